@@ -3,15 +3,36 @@ import dash
 import dash_auth
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output    # State
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
-import cufflinks as cf
 
-import numpy as np
-import pandas as pd
-from datetime import datetime
+import flask
+import threading
+import time
+import uuid
+from contextlib import nullcontext
+from functools import wraps
 # import json   for displaying hoverdata
-import base64  # for displaying logo/image without online hosting
+
+from dashboard_data import (CACHE_VERSION, DashboardData, DataState,
+                            max_prev_years,
+                            cols_to_graph_1, cols_to_graph_4,
+                            cols_to_graph_5, cols_to_graph_6,
+                            cols_to_graph_7)
+from figure_cache import FigureCache
+from payload import payload_stats, reduce_payload
+from metrics import SamplingProfiler, callback_metrics
+from job_pool import JobPool
+from single_flight import SingleFlight
+from figures import (TEMPLATE, line_figure, margin_figure, pie_figure,
+                     stacked_bar_figure)
+from result_store import make_store
+from live_reload import watch
+from sql_source import SQLiteData
+from static_assets import StaticAssets
+from compression import Compressor
+import data_cache
 
 
 # simple authentication
@@ -20,82 +41,33 @@ USERNAME_PASSWORD_PAIRS = [
     ['Demo', 'demo']
 ]
 
-# Read in data
-df = pd.read_excel('DashboardDemo_RandomData.xlsx',
-                   sheet_name='Data', parse_dates=['Month'])
-sf = pd.read_excel('DashboardDemo_RandomData.xlsx', sheet_name='SF_Rates')
-
-# Calculate extra cols:
-# eg. Service Fee, Commission paid,
-# and recalculate margin from just Sales and Commission
-
-# Lookup the month and use the consultant rates at that time to calculate SF,
-# if none, use month appropriate Default values
-
-
-def service_fee_calc(row):
-    name = row['Consultant']
-    date = row['Month']
-    filtered_sf = sf[sf['Date_applied'] <= date]
-
-    if name in filtered_sf['Consultant'].values:
-        # use most recent from before this date
-        vals = filtered_sf[filtered_sf['Consultant'] == name].iloc[-1]
-    else:
-        # else use most recent default from before this date
-        vals = filtered_sf[filtered_sf['Consultant'] == 'DEFAULT'].iloc[-1]
-    return vals['SF_flat'] + vals['SF_pct'] * row['Commission'] / 100
-
-
-def margin_divide(df):
-    return None if df['Gross sales'] == 0 \
-        else 100 * df['Commission'] / df['Gross sales']
-
-
-def financial_year(date):
-    if date.month >= 7:
-        return f'{date.year}.{date.year+1}'
-    else:
-        return f'{date.year-1}.{date.year}'
-
-
-df['Service fee'] = df.apply(service_fee_calc, axis=1)
-df['Commission paid'] = df['Commission'] - df['Service fee']
-df['Month_label'] = df['Month'].apply(lambda x: datetime.strftime(x, "%b %Y"))
-df['Margin'] = df[['Commission', 'Gross sales']].apply(margin_divide, axis=1)
-df['Financial_year'] = df['Month'].apply(financial_year)
-
-
-# Rounding values for ease of reading.
-# nb. Values will be very slightly off due to rounding. Deemed acceptable
-df = df.round({
-    'Gross sales': 0,
-    'Cost of sales': 0,
-    'Commission': 0,
-    'Service fee': 0,
-    'Commission paid': 0,
-    'Margin': 1
-})
-
-# calculate some useful values/lists
-months = list(df['Month_label'].unique())  # month labels
-months_dt = list(df['Month'].unique())  # month datetimes
-num_of_months = len(months)
-years = df['Month'].apply(lambda x: datetime.strftime(x, "%Y")).unique()
-fin_years = df['Financial_year'].unique()
-consultants = np.sort(df['Consultant'].unique())
-top5_selected = None  # global variable needed later
-max_prev_years = 5  # for graph 7, comparing previous years for consultant
-
-# for ease of altering if necessary
-cols_to_graph_1 = ['Gross sales', 'Commission', 'Service fee']
-cols_to_graph_4 = ['Gross sales', 'Commission', 'Service fee']
-cols_to_graph_5 = ['Service fee', 'Commission paid', 'Cost of sales']
-cols_to_graph_6 = ['Gross sales', 'Commission', 'Service fee']
-cols_to_graph_7 = ['Gross sales', 'Commission', 'Service fee']
-
-in_date_overall_margin = round(
-    100 * df['Commission'].sum() / df['Gross sales'].sum(), 1)
+DEFAULT_CONFIG = {
+    'workbook': 'DashboardDemo_RandomData.xlsx',
+    'cache_dir': '.dashboard_cache',  # parsed workbook, see data_cache.py
+    'logo': 'DemoLogo.JPG',
+    'auth_pairs': USERNAME_PASSWORD_PAIRS,
+    'background': True,  # load data on a thread, serving a skeleton until then
+    'warm_up': True,  # pre-compute the figures for the default selections
+    'watch': True,  # pick up changes to the workbook while running
+    'reload_interval': 30,  # seconds between checks for workbook changes
+    # where computed figures are kept - None for each process's own memory,
+    # or eg. 'sqlite:///.dashboard_results/results.db' to share between
+    # workers (kept out of cache_dir)
+    'result_store': None,
+    # name of a callback (eg. 'update_graph5') to run under the sampling
+    # profiler - stacks are served at /profile
+    'profile_callback': None,
+    # threads for the heavy callbacks (gr1, gr5), where only the latest
+    # request from a page is answered - 0 to run them in the request thread
+    'job_workers': 2,
+    # where the data is queried from - None to hold it in memory, or eg.
+    # 'sqlite:///.dashboard_cache/data.db' for a SQLite file imported from
+    # the workbook (sql_source.py), for histories too large for memory
+    'data_source': None,
+    # responses larger than this are sent gzip/brotli compressed - None to
+    # never compress
+    'compress_min_bytes': 1024,
+}
 
 colour_list = [
  'rgb(215,25,28)',
@@ -105,271 +77,288 @@ colour_list = [
  'rgb(44,123,182)'
  ]
 
-# Reshape the data.
-# Columns=['Month', 'Consultant', 'Gross sales', 'Cost of sales', 'Commission',
-# 'Margin', 'Service fee', 'Commission paid', 'Month_label', 'Financial_year']
-cols_of_interest = df.columns[2:]
-df_reshaped = df.pivot_table(
-    index='Month', columns='Consultant', values=cols_of_interest)
-df_in_date = df[(df.Month >= months_dt[-12]) & (df.Month <= months_dt[-1])]
-df_in_date_reshaped = df_in_date.pivot_table(
-    index='Month', columns='Consultant', values=cols_of_interest)
+# Figures for callbacks that depend only on their inputs (gr3, gr5, gr7),
+# shared between users - keyed on the data, so a reload never hits old ones
+figure_cache = FigureCache(max_entries=256, max_bytes=64 * 1024 ** 2)
+# Identical calls running at once (eg. a team opening the dashboard
+# together) share one computation - gr1, gr3, gr5 and gr7
+single_flight = SingleFlight()
 
 
 # Visualisations
 
-# 1 Line graph - Sales/Commission/Service Fee vs time
-
-
-fig1 = df_in_date_reshaped['Gross sales'].iplot(
-    title='Gross sales', asFigure=True)
-fig1['layout'].update({'hovermode': 'closest'})
-
-gr1_line = dcc.Graph(
-    id='gr1',
-    figure=fig1,
-    style={'height': '80vh'}
-)
-
-# 2 - Margin history - updated  to individual consultant on gr1 hover
-fig2 = df_in_date_reshaped['Margin'].iplot(
-    title=f'Margin (Overall avg. {in_date_overall_margin}%)', kind='scatter',
-          mode='markers', asFigure=True)
-fig2['data'].update({'marker': {'size': 6, 'opacity': 0.5}})
-fig2['layout'].update({'hovermode': 'closest',
-                       'yaxis': {'title': '% Margin', 'range': [0, 100]},
-                       'shapes': [{  # add in an overall average line...
-                           'type': 'line',  # Overall mean
-                           'x0': df_in_date_reshaped['Margin'].index[0],
-                           'y0':in_date_overall_margin,
-                           'x1':df_in_date_reshaped['Margin'].index[-1],
-                           'y1':in_date_overall_margin,
-                           'line': {
-                               'color': 'rgb(0, 0, 200)',
-                               # 'width': 4,
-                               # 'dash': 'dash',
-                           }
-                       }],
-                       'annotations': [  # display overall average value
-                           dict(x=df_in_date_reshaped['Margin'].index[0],
-                                y=in_date_overall_margin,
-                                ay=0,
-                                ax=-15,
-                                showarrow=True,
-                                font={'color': 'rgb(0,0,200)'},
-                                text=f'{in_date_overall_margin}%')
-                       ]
-                       })
-
-gr2_margin = dcc.Graph(
-    id='gr2',
-    figure=fig2,
-    style={'height': '80vh'}
-)
-
-
-# 4 Line graph history for individual
-df_latest_month = df_in_date[df_in_date.Month == months_dt[-1]]
-month_leader = (df_latest_month   # initially show the month leader
-                .loc[df_latest_month['Gross sales'].idxmax()]['Consultant'])
-fig4 = (df_in_date[df_in_date['Consultant'] == month_leader]
-        .set_index('Month_label')
-        .iplot(keys=cols_to_graph_4,
-               title=f'Consultant History - {month_leader}', asFigure=True))
-
-gr4_bar = dcc.Graph(
-    id='gr4',
-    figure=fig4,
-    style={'height': '87vh'}
-)
-
-
-# Logo
-demo_logo = 'DemoLogo.JPG'
-encoded_logo = base64.b64encode(open(demo_logo, 'rb').read())
+def initial_figures(data):
+    recent = data.recent
+    in_date_overall_margin = data.in_date_overall_margin
+
+    # 1 Line graph - Sales/Commission/Service Fee vs time
+    fig1 = line_figure(data.range_frame('Gross sales', *recent),
+                       'Gross sales')
+
+    # 2 - Margin history - updated  to individual consultant on gr1 hover
+    fig2 = margin_figure(
+        data.range_frame('Margin', *recent),
+        f'Margin (Overall avg. {in_date_overall_margin}%)',
+        in_date_overall_margin)
+
+    # 4 Line graph history for individual
+    month_leader = data.month_leader
+    fig4 = line_figure(
+        data.history(month_leader, *recent),
+        f'Consultant History - {month_leader}', keys=cols_to_graph_4)
+
+    return {'gr1': fig1, 'gr2': fig2, 'gr4': fig4}
+
+
+def warm_up(data):
+    # Fill the figure cache for what every new page load asks for first
+    for metric in cols_to_graph_1:
+        update_graph3(data, metric, data.months[-1])
+    update_graph5(data, data.years[-1])
+    for metric in cols_to_graph_7:
+        update_graph7(data, data.month_leader, metric)
 
 
 # Dashboard layout
-app = dash.Dash()
-auth = dash_auth.BasicAuth(app, USERNAME_PASSWORD_PAIRS)
 
-app.layout = html.Div([
-    html.H1('Dashboard Demo',
-            style={'background': '#0f3d8b', 'color': '#ffffff',
-                   'borderRadius': '10', 'paddingLeft': '10',
-                   'fontFamily': 'Georgia'}),
-    html.H3('Consultant performance over time'),
+def header():
+    return html.H1('Dashboard Demo',
+                   style={'background': '#0f3d8b', 'color': '#ffffff',
+                          'borderRadius': '10', 'paddingLeft': '10',
+                          'fontFamily': 'Georgia'})
 
-    html.Div([
-        html.Div([
-            dcc.RadioItems(
-                id='gr1_y_select',
-                options=[{'label': i, 'value': i}
-                         for i in cols_to_graph_1],
-                value=cols_to_graph_1[0],
-            )], style={'float': 'left', 'marginTop': '5'}),
 
+def skeleton_layout():
+    # Served until the data has loaded, then swapped for the full page
+    return html.Div([
+        header(),
         html.Div([
-            dcc.Checklist(
-                id='gr1_top5',
-                options=[{'label': 'Top 5', 'value': 'top5'}],
-                values=[],
-            )], style={'width': '10%', 'float': 'left',
-                       'marginLeft': '15', 'marginTop': '5'}),
+            html.H3('Loading data...'),
+            dcc.Interval(id='ready_poll', interval=1000),
+        ], id='page'),
+    ])
+
+
+def build_page(data, figures, logo_url, poll_interval=30):
+    months = data.months
+    years = data.years
+    consultants = data.consultants
+    num_of_months = data.num_of_months
+
+    gr1_line = dcc.Graph(
+        id='gr1',
+        figure=figures['gr1'],
+        style={'height': '80vh'}
+    )
+    gr2_margin = dcc.Graph(
+        id='gr2',
+        figure=figures['gr2'],
+        style={'height': '80vh'}
+    )
+    gr4_bar = dcc.Graph(
+        id='gr4',
+        figure=figures['gr4'],
+        style={'height': '87vh'}
+    )
+
+    return [
+        html.H3('Consultant performance over time'),
 
         html.Div([
-            dcc.Dropdown(
-                id='gr6_name_select',
-                options=[{'label': i, 'value': i} for i in consultants],
-                placeholder='Individual consultant lookup',
-            )], style={'width': '15%', 'float': 'left'}),
-
-        html.P('Filter by months: ', id='months_filter',
-               style={'float': 'right', 'marginRight': '20%'}),
-
-    ]),
-    html.Div([
-        dcc.RangeSlider(
-            id='month_slider',
-            min=0,
-            max=num_of_months - 1,
-            marks={i: '' for i in range(num_of_months)},
-            # Default to the previous 12 months of data
-            value=[num_of_months - 12, num_of_months - 1],
-        )
-    ], style={'width': '80%', 'clear': 'both'}),
-    html.Div([
-        gr1_line
-    ], style={'marginTop': '10', 'width': '60%', 'float': 'left'}),
-    html.Div([
-        gr2_margin
-    ], style={'marginTop': '10', 'width': '40%', 'float': 'right'}),
-
-    html.Hr(),
-    html.H3('Monthy breakdown / Consultants ranked'),
-    html.Div([
+            html.Div([
+                dcc.RadioItems(
+                    id='gr1_y_select',
+                    options=[{'label': i, 'value': i}
+                             for i in cols_to_graph_1],
+                    value=cols_to_graph_1[0],
+                )], style={'float': 'left', 'marginTop': '5'}),
+
+            html.Div([
+                dcc.Checklist(
+                    id='gr1_top5',
+                    options=[{'label': 'Top 5', 'value': 'top5'}],
+                    value=[],
+                )], style={'width': '10%', 'float': 'left',
+                           'marginLeft': '15', 'marginTop': '5'}),
+
+            html.Div([
+                dcc.Dropdown(
+                    id='gr6_name_select',
+                    options=[{'label': i, 'value': i} for i in consultants],
+                    placeholder='Individual consultant lookup',
+                )], style={'width': '15%', 'float': 'left'}),
+
+            html.P('Filter by months: ', id='months_filter',
+                   style={'float': 'right', 'marginRight': '20%'}),
+
+        ]),
         html.Div([
-            dcc.Dropdown(
-                id='gr3_month_select',
-                options=[{'label': i, 'value': i} for i in months[::-1]],
-                value=months[-1],
-                clearable=False
+            dcc.RangeSlider(
+                id='month_slider',
+                min=0,
+                max=num_of_months - 1,
+                marks={i: '' for i in range(num_of_months)},
+                # Default to the previous 12 months of data
+                value=[num_of_months - 12, num_of_months - 1],
             )
-        ], style={'width': '200', 'float': 'left'}),
+        ], style={'width': '80%', 'clear': 'both'}),
+        html.Div([
+            dcc.Loading([
+                gr1_line,
+                # Figure from the server, and trace hovered over -
+                # highlighting is done in the browser (assets/dashboard.js)
+                dcc.Store(id='gr1_base'),
+            ]),
+            dcc.Store(id='gr1_hover_curve'),
+            dcc.Store(id='gr1_traces'),  # consultant of each trace
+        ], style={'marginTop': '10', 'width': '60%', 'float': 'left'}),
+        html.Div([
+            gr2_margin
+        ], style={'marginTop': '10', 'width': '40%', 'float': 'right'}),
+
+        html.Hr(),
+        html.H3('Monthy breakdown / Consultants ranked'),
+        html.Div([
+            html.Div([
+                dcc.Dropdown(
+                    id='gr3_month_select',
+                    options=[{'label': i, 'value': i} for i in months[::-1]],
+                    value=months[-1],
+                    clearable=False
+                )
+            ], style={'width': '200', 'float': 'left'}),
+            html.Div([
+                dcc.RadioItems(
+                    id='gr3_y_select',
+                    options=[{'label': i, 'value': i}
+                             for i in cols_to_graph_1],
+                    value=cols_to_graph_1[0],
+                    labelStyle={'display': 'inline-block'}
+                )], style={'float': 'left', 'marginLeft': '5',
+                           'marginTop': '5'})
+        ], ),
         html.Div([
-            dcc.RadioItems(
-                id='gr3_y_select',
-                options=[{'label': i, 'value': i} for i in cols_to_graph_1],
-                value=cols_to_graph_1[0],
-                labelStyle={'display': 'inline-block'}
-            )], style={'float': 'left', 'marginLeft': '5', 'marginTop': '5'})
-    ], ),
-    html.Div([
-        dcc.Graph(id='gr3', style={'height': '87vh'})
-    ], style={'width': '50%', 'marginTop': '10',
-              'clear': 'both', 'float': 'left'}),
-
-    html.Div([
-        gr4_bar
-    ], style={'width': '50%', 'marginTop': '10', 'float': 'right'}),
-    html.Hr(style={'clear': 'both'}),
-    html.H3(['YTD - Stacked bar graph by Consultant']),
-    html.Div([
+            dcc.Graph(id='gr3', style={'height': '87vh'})
+        ], style={'width': '50%', 'marginTop': '10',
+                  'clear': 'both', 'float': 'left'}),
+
+        html.Div([
+            gr4_bar
+        ], style={'width': '50%', 'marginTop': '10', 'float': 'right'}),
+        html.Hr(style={'clear': 'both'}),
+        html.H3(['YTD - Stacked bar graph by Consultant']),
+        html.Div([
+            html.Div([
+                dcc.Dropdown(
+                    id='gr5_year_select',
+                    options=[{'label': i, 'value': i} for i in years[::-1]],
+                    value=years[-1],
+                    clearable=False
+                )],
+                style={'width': '200'}),
+            html.Div([
+                dcc.Loading(dcc.Graph(id='gr5', style={'height': '88vh'}))
+            ], style={'width': '100%', 'marginTop': '10'})
+        ]),
+        html.Hr(),
+        html.H3(['Consultant history by Financial Year']),
         html.Div([
             dcc.Dropdown(
-                id='gr5_year_select',
-                options=[{'label': i, 'value': i} for i in years[::-1]],
-                value=years[-1],
+                id='gr7_name_select',
+                options=[{'label': i, 'value': i} for i in consultants],
+                value=data.month_leader,
                 clearable=False
-            )],
-            style={'width': '200'}),
+            )], style={'width': '200', 'float': 'left'}),
         html.Div([
-            dcc.Graph(id='gr5', style={'height': '88vh'})
-        ], style={'width': '100%', 'marginTop': '10'})
-    ]),
-    html.Hr(),
-    html.H3(['Consultant history by Financial Year']),
-    html.Div([
-        dcc.Dropdown(
-            id='gr7_name_select',
-            options=[{'label': i, 'value': i} for i in consultants],
-            value=month_leader,
-            clearable=False
-        )], style={'width': '200', 'float': 'left'}),
-    html.Div([
-            dcc.RadioItems(
-                id='gr7_y_select',
-                options=[{'label': i, 'value': i}
-                         for i in cols_to_graph_7],
-                value=cols_to_graph_7[0],
-            )], style={'float': 'left', 'marginTop': '5'}),
-    html.Div([
-        dcc.Graph(id='gr7', style={'height': '88vh'})
-    ], style={'clear': 'both', 'width': '100%', 'marginTop': '10'}),
-    html.Hr(),
-    html.Div([
-        html.Img(src='data:image/jpg;base64,{}'.format(encoded_logo.decode()))
-    ], style={'textAlign': 'center'})
-])
-
-# For investigating and displaying hoverdata
-# html.Div([
-#     html.Pre(id='hover-data', style={'paddingTop':35})
-# ], style={'width':'30%'}),
-
-app.title = 'Dashboard Demo'
-
-# Possible to use CSS for better styling at later date
-# app.css.append_css({
-#     'external_url': ''
-# })
+                dcc.RadioItems(
+                    id='gr7_y_select',
+                    options=[{'label': i, 'value': i}
+                             for i in cols_to_graph_7],
+                    value=cols_to_graph_7[0],
+                )], style={'float': 'left', 'marginTop': '5'}),
+        html.Div([
+            dcc.Graph(id='gr7', style={'height': '88vh'})
+        ], style={'clear': 'both', 'width': '100%', 'marginTop': '10'}),
+        html.Hr(),
+        html.Div([
+            html.Img(src=logo_url)
+        ], style={'textAlign': 'center'}),
+
+        # Data version shown, checked periodically for workbook reloads
+        dcc.Store(id='data_version', data=data.version),
+        # Identifies this page, and numbers its gr1/gr5 requests in the
+        # order they're made, for the job pool - see job_pool.py
+        dcc.Store(id='session_id', data=uuid.uuid4().hex),
+        dcc.Store(id='gr1_request'),
+        dcc.Store(id='gr5_request'),
+        dcc.Interval(id='data_poll', interval=poll_interval * 1000),
+    ]
+
+    # For investigating and displaying hoverdata
+    # html.Div([
+    #     html.Pre(id='hover-data', style={'paddingTop':35})
+    # ], style={'width':'30%'}),
 
 
 # Callbacks - for selection and hover functionality
+# Each takes the loaded DashboardData first, and the component values after
+
+# Data reloads - pass on a new data version to the controls below
+def check_data_version(data, n_intervals, version):
+    if data.version == version:
+        raise PreventUpdate
+    return data.version
+
+
+# Month slider range - keep the selection, following the latest month
+def refresh_slider(data, version, months_selected, old_max):
+    num_of_months = data.num_of_months
+    if months_selected is None or old_max is None:
+        months_selected = [num_of_months - 12, num_of_months - 1]
+    elif months_selected[1] == old_max:
+        shift = num_of_months - 1 - old_max
+        months_selected = [months_selected[0] + shift, num_of_months - 1]
+    return (num_of_months - 1, {i: '' for i in range(num_of_months)},
+            months_selected)
+
+
+# Dropdown options for months, years and consultants
+def refresh_options(data, version):
+    consultant_options = [{'label': i, 'value': i} for i in data.consultants]
+    return ([{'label': i, 'value': i} for i in data.months[::-1]],
+            [{'label': i, 'value': i} for i in data.years[::-1]],
+            consultant_options,
+            consultant_options)
+
 
 # Month selector - title
-@app.callback(
-    Output('months_filter', 'children'),
-    [Input('month_slider', 'value')])
-def month_selector_title(months_selected):
+def month_selector_title(data, months_selected):
+    months = data.months
     return f'Months selected: {months[months_selected[0]]} \
             - {months[months_selected[1]]}'
 
 
-# Highlight on hover, gr1
-@app.callback(
-    Output('gr1', 'figure'),
-    [Input('gr1_y_select', 'value'),
-     Input('gr1', 'hoverData'),
-     Input('gr1_top5', 'values'),
-     Input('gr6_name_select', 'value'),
-     Input('month_slider', 'value')],
-)  # [State('gr1', 'figure')]
-def update_graph1(y_select, hoverData, top5, name, months_selected, ):  # fig1
+# Metric/Top 5/consultant/months for gr1 - hover highlighting is clientside
+@single_flight.coalesce
+@reduce_payload(decimals=0, key=(0, 'figure'))
+def update_graph1(data, y_select, top5, name, months_selected):
+    months_dt = data.months_dt
     month_start = months_dt[months_selected[0]]
     month_end = months_dt[months_selected[1]]
-    df_in_date = df[(df.Month >= month_start) & (df.Month <= month_end)]
     if name:
-        fig6 = (df_in_date[df_in_date['Consultant'] == name]
-                .set_index('Month_label')
-                .iplot(kind='line', title='Sales/Commission - ' + name,
-                       keys=cols_to_graph_6, asFigure=True))
-        return fig6
+        fig6 = line_figure(data.history(name, month_start, month_end),
+                           'Sales/Commission - ' + name, keys=cols_to_graph_6)
+        return {'figure': fig6, 'highlight': False}, None
     else:
-        df_in_date_reshaped = df_in_date.pivot_table(
-            index='Month', columns='Consultant', values=cols_of_interest)
         if top5:
             # find top 5 by total (metric selected) within selected time period
-            top5_filter = (df_in_date_reshaped[y_select]
-                           .sum().sort_values(ascending=False).head(5).index)
-            global top5_selected  # needed to match margin graph on hover
-            top5_selected = df_in_date_reshaped[y_select][top5_filter].columns
-            fig1 = df_in_date_reshaped[y_select][top5_filter].iplot(
-                title=f'{y_select} - Top 5', asFigure=True)
+            top5_filter = data.top_n(y_select, month_start, month_end, 5)
+            df_graph = data.range_frame(y_select, month_start, month_end,
+                                        top5_filter)
+            fig1 = line_figure(df_graph, f'{y_select} - Top 5')
         else:
-            fig1 = df_in_date_reshaped[y_select].iplot(
-                title=y_select, asFigure=True)
-        fig1['layout'].update({'hovermode': 'closest'})
+            df_graph = data.range_frame(y_select, month_start, month_end)
+            fig1 = line_figure(df_graph, y_select)
 
     # Alternate method of controlling x axis
     # Top5 calculations wouldn't be updated
@@ -394,155 +383,97 @@ def update_graph1(y_select, hoverData, top5, name, months_selected, ):  # fig1
     #             ),
     #             rangeslider=dict() # type='date')
 
-    try:  # Needed try/except to avoid error when no trace hovered over
-        hovering_over = hoverData['points'][0]['curveNumber']
-        # Highlight trace hovered over
-        for n, trace in enumerate(fig1['data']):
-            if n == hovering_over:
-                # Size of highlighted line
-                trace.update(dict(line={'width': 6}))
-            else:
-                trace.update(dict(line={'width': 1}))
-    except Exception as e:
-        print(str(e))
-
-    return fig1
+    # Consultant of each trace, kept in the browser to match margin graph
+    # on hover
+    return {'figure': fig1, 'highlight': True}, list(df_graph.columns)
 
 
 # Display Margin history (12months) on gr2
-@app.callback(
-    Output('gr2', 'figure'),
-    [Input('gr1', 'hoverData'),
-     Input('gr6_name_select', 'value'),
-     Input('gr1_top5', 'values'),
-     Input('month_slider', 'value'),
-     Input('gr1_y_select', 'value')])
-def update_graph2(hoverData, name_input, top5, months_selected, y_select):
-    global fig2
+# Unchanged if nothing hovered over yet, or the update fails - the browser
+# keeps the figure it has
+@reduce_payload(decimals=1)
+def update_graph2(data, hover_curve, name_input, gr1_traces):
+    recent = data.recent
+    if hover_curve is None:
+        raise PreventUpdate
     try:
-        hovering_over = hoverData['points'][0]['curveNumber']
         if name_input:  # If graphing individual consultant
             name = name_input
-            # Since default global 'in date' is 12mo
-            df_hov = df_in_date_reshaped['Margin'][name]
-        elif top5:  # If graphing top5
-            # If top5 selected, names/numbers dont match up, so use global list
-            global top5_selected
-            name = top5_selected[hovering_over]
-            df_hov = df_in_date_reshaped['Margin'][top5_selected].iloc[:, hovering_over]
         else:
-            month_start, month_end = months_dt[months_selected[0]], \
-                months_dt[months_selected[1]]
-            df_in_date = df[(df.Month >= month_start)
-                            & (df.Month <= month_end)]
-            df_in_date_reshaped_2 = df_in_date.pivot_table(
-                index='Month', columns='Consultant', values=cols_of_interest)
-            name = df_in_date_reshaped_2[y_select].columns[hovering_over]
-            df_hov = df_in_date_reshaped['Margin'][name]
-        # mean_margin = round(df_hov.mean())
-        # average of margins, can be affected quite a bit by outliers
-        # eg. when low amount but high%.
-        mean_overall = (round(100 * df_in_date_reshaped['Commission'][name]
-                              .sum() / df_in_date_reshaped['Gross sales'][name]
-                              .sum()))  # overall using total values
-        fig2 = df_hov.iplot(title=f'{name} - Margin history (avg. {mean_overall}%)',
-                            asFigure=True, kind='scatter', mode='markers')
-        fig2['layout'].update({'hovermode': 'closest',
-                               'showlegend': False,
-                               'yaxis': {'title': '% Margin',
-                                         'range': [0, 100]},
-                               'shapes': [
-                                   {   # Add line showing Overall average
-                                       'type': 'line',
-                                       'x0': df_hov.index[0],
-                                       'y0':mean_overall,
-                                       'x1':df_hov.index[-1],
-                                       'y1':mean_overall,
-                                       'line': {
-                                           'color': 'rgb(0, 0, 200)',
-                                                    # 'width': 4,
-                                                    'dash': 'dash',
-                                       }}
-                               ],
-                               'annotations': [  # And value of overall average
-                                   dict(x=df_hov.index[0],
-                                        y=mean_overall,
-                                        ay=0,
-                                        ax=-15,
-                                        showarrow=True,
-                                        font={
-                                       'color': 'rgb(0,0,200)'},
-                                       text=f'{mean_overall}%')
-                               ]
-                               })
+            # Names/numbers of traces depend on Top 5/months selected, so
+            # use the list stored alongside gr1
+            name = gr1_traces[hover_curve]
+        # Since default 'in date' is 12mo
+        # mean of the monthly margins would be affected quite a bit by
+        # outliers eg. when low amount but high%, so use the totals.
+        # (KeyError for consultants with no data in the period)
+        commission = data.range_totals('Commission', *recent)[name]
+        gross_sales = data.range_totals('Gross sales', *recent)[name]
+        mean_overall = round(100 * commission / gross_sales)
+        df_hov = data.range_frame('Margin', *recent, [name])
+        fig2 = margin_figure(
+            df_hov,
+            f'{name} - Margin history (avg. {mean_overall}%)',
+            mean_overall, line_dash='dash', showlegend=False)
     except Exception as e:
-        print(str(e))
+        callback_metrics.error('update_graph2', e)
+        raise PreventUpdate
 
     return fig2
 
 
 # Select month and metric for pie chart gr3
-@app.callback(
-    Output('gr3', 'figure'),
-    [Input('gr3_y_select', 'value'),
-     Input('gr3_month_select', 'value')])
-def update_graph3(y_select, month):
-    pie_df = df_reshaped[y_select].transpose().reset_index()
-    pie_df.columns = ['Consultant'] + months
-
-    fig3 = pie_df.iplot(kind='pie', labels='Consultant', values=month,
-                        title=f'{y_select} - {month}',
-                        textinfo='label+value+percent', asFigure=True)
+@single_flight.coalesce
+@figure_cache.memoize
+def update_graph3(data, y_select, month):
+    month_values = data.month_values(
+        y_select, data.months_dt[data.months.index(month)])
+    fig3 = pie_figure(month_values.index.values, month_values.values,
+                      f'{y_select} - {month}')
     return fig3
 
 
 # Select user for bargraph by hovering on pie chart gr4
-@app.callback(
-    Output('gr4', 'figure'),
-    [Input('gr3', 'hoverData')])
-def update_graph4(hoverData):
-    global fig4
+def update_graph4(data, hoverData):
+    if hoverData is None:
+        raise PreventUpdate
     try:
         hovering_over = hoverData['points'][0]['label']
-        fig4 = (df_in_date[df_in_date['Consultant'] == hovering_over]
-                .set_index('Month_label')
-                .iplot(keys=cols_to_graph_4,
-                       title='Consultant History - ' + hovering_over, asFigure=True))
+        fig4 = line_figure(
+            data.history(hovering_over, *data.recent),
+            'Consultant History - ' + hovering_over, keys=cols_to_graph_4)
     except Exception as e:
-        print(str(e))
+        callback_metrics.error('update_graph4', e)
+        raise PreventUpdate
 
     return fig4
 
 
 # Select year for ytd bargraph gr5
-@app.callback(
-    Output('gr5', 'figure'),
-    [Input('gr5_year_select', 'value')])
-def update_graph5(year_selected):
-    global fig5
-    if year_selected:
-        fig5 = (df[df['Month'].apply(lambda x:x.year) == int(year_selected)]
-                .pivot_table(index='Consultant', values=cols_to_graph_5, aggfunc=sum)
-                .sort_values(by='Service fee', ascending=False)
-                .iplot(kind='bar', barmode='stack',
-                       title=f'{year_selected} YTD sales/commission',
-                       keys=cols_to_graph_5, asFigure=True)
-                )
+@single_flight.coalesce
+@figure_cache.memoize
+def update_graph5(data, year_selected):
+    if not year_selected or str(year_selected) not in data.years:
+        raise PreventUpdate
+    # Totals per consultant for the year - precomputed (rollups.py) or
+    # summed by the query (sql_source.py)
+    fig5 = stacked_bar_figure(
+        data.period_totals('year', str(year_selected), cols_to_graph_5)
+        .sort_values(by='Service fee', ascending=False),
+        cols_to_graph_5, f'{year_selected} YTD sales/commission')
     return fig5
 
 
 # Select consultand and metric for gr7
-@app.callback(
-    Output('gr7', 'figure'),
-    [Input('gr7_name_select', 'value'),
-     Input('gr7_y_select', 'value')])
-def update_graph7(name, metric):
+@single_flight.coalesce
+@figure_cache.memoize
+@reduce_payload(decimals=0)
+def update_graph7(data, name, metric):
     traces = []
-    filter1 = df['Consultant'] == name
-    for i, fyr in enumerate(fin_years[:-max_prev_years-1:-1]):  # include up to the last 5 years
-        filter2 = df['Financial_year'] == fyr
-        trace = go.Scatter(x=df[filter1 & filter2]['Month'].dt.strftime('%b'),
-                           y=df[filter1 & filter2][metric],
+    for i, fyr in enumerate(data.fin_years[:-max_prev_years-1:-1]):  # include up to the last 5 years
+        df_year = data.financial_year_history(name, fyr)
+        trace = go.Scatter(x=df_year['Month'].dt.strftime('%b'),
+                           y=df_year[metric],
                            name=fyr,
                            line=dict(
                                 color=colour_list[i],
@@ -550,8 +481,9 @@ def update_graph7(name, metric):
                                     )
                            )
         traces.append(trace)
-    layout = go.Layout(title=f'{name} - {metric} comparison by Financial Year')
-    fig7 = dict(data=traces, layout=layout)
+    layout = go.Layout(title=f'{name} - {metric} comparison by Financial Year',
+                       template=TEMPLATE)
+    fig7 = go.Figure(data=traces, layout=layout)
     return fig7
 
 # For testing format of hoverdata
@@ -562,6 +494,305 @@ def update_graph7(name, metric):
 #     return json.dumps(hoverData, indent=2)
 
 
+def register_callbacks(app, state, profiler=None, pool=None):
+
+    def with_data(fn, pooled=False):
+        # Dash passes component values only - look up the current data.
+        # Pooled (heavy) callbacks, with the request number as the Input and
+        # the page's session id as the last State, wait for a job pool slot,
+        # superseding the page's earlier requests. Compute time is taken (and
+        # the profiler samples) around fn only, the rest is recorded once
+        # the response is ready
+        name = fn.__name__
+
+        @wraps(fn)
+        def callback(*args):
+            data = state.get()
+            computes = []  # empty if a pooled job was cancelled unstarted
+
+            def compute(*args):
+                start = time.perf_counter()
+                try:
+                    with profiler.sample(name) if profiler else nullcontext():
+                        return fn(data, *args)
+                finally:
+                    computes.append(time.perf_counter() - start)
+
+            try:
+                if pooled:
+                    seq, *args, session_id = args
+                    if pool is not None:
+                        return pool.run((session_id, name), compute, *args,
+                                        seq=seq)
+                return compute(*args)
+            except PreventUpdate:
+                callback_metrics.prevent(name)
+                raise
+            except Exception as e:
+                callback_metrics.error(name, e)
+                raise
+            finally:
+                if computes:
+                    if flask.has_request_context():
+                        flask.g.callback = (name, computes[0])
+                    else:
+                        callback_metrics.observe(name, computes[0])
+        return callback
+
+    app.callback(
+        Output('data_version', 'data'),
+        [Input('data_poll', 'n_intervals')],
+        [State('data_version', 'data')])(with_data(check_data_version))
+
+    app.callback(
+        [Output('month_slider', 'max'),
+         Output('month_slider', 'marks'),
+         Output('month_slider', 'value')],
+        [Input('data_version', 'data')],
+        [State('month_slider', 'value'),
+         State('month_slider', 'max')])(with_data(refresh_slider))
+
+    app.callback(
+        [Output('gr3_month_select', 'options'),
+         Output('gr5_year_select', 'options'),
+         Output('gr6_name_select', 'options'),
+         Output('gr7_name_select', 'options')],
+        [Input('data_version', 'data')])(with_data(refresh_options))
+
+    app.callback(
+        Output('months_filter', 'children'),
+        [Input('month_slider', 'value')])(with_data(month_selector_title))
+
+    # gr1 and gr5 requests are numbered in the browser as the controls
+    # change, and sent with the controls' values at that point
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard',
+                           function_name='next_request'),
+        Output('gr1_request', 'data'),
+        [Input('gr1_y_select', 'value'),
+         Input('gr1_top5', 'value'),
+         Input('gr6_name_select', 'value'),
+         Input('month_slider', 'value')])
+
+    app.callback(
+        [Output('gr1_base', 'data'),
+         Output('gr1_traces', 'data')],
+        [Input('gr1_request', 'data')],
+        [State('gr1_y_select', 'value'),
+         State('gr1_top5', 'value'),
+         State('gr6_name_select', 'value'),
+         State('month_slider', 'value'),
+         State('session_id', 'data')],
+    )(with_data(update_graph1, pooled=True))
+
+    # Highlight on hover, gr1 - in the browser, no server round trip.
+    # Hovers only register when the trace changes, so moving along a line
+    # doesn't trigger the margin graph either
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard', function_name='hover_curve'),
+        Output('gr1_hover_curve', 'data'),
+        [Input('gr1', 'hoverData')],
+        [State('gr1_hover_curve', 'data')])
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard',
+                           function_name='highlight_trace'),
+        Output('gr1', 'figure'),
+        [Input('gr1_base', 'data'),
+         Input('gr1_hover_curve', 'data')])
+
+    app.callback(
+        Output('gr2', 'figure'),
+        [Input('gr1_hover_curve', 'data'),
+         Input('gr6_name_select', 'value'),
+         Input('gr1_traces', 'data')])(with_data(update_graph2))
+
+    app.callback(
+        Output('gr3', 'figure'),
+        [Input('gr3_y_select', 'value'),
+         Input('gr3_month_select', 'value')])(with_data(update_graph3))
+
+    app.callback(
+        Output('gr4', 'figure'),
+        [Input('gr3', 'hoverData')])(with_data(update_graph4))
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='dashboard',
+                           function_name='next_request'),
+        Output('gr5_request', 'data'),
+        [Input('gr5_year_select', 'value')])
+
+    app.callback(
+        Output('gr5', 'figure'),
+        [Input('gr5_request', 'data')],
+        [State('gr5_year_select', 'value'),
+         State('session_id', 'data')])(with_data(update_graph5, pooled=True))
+
+    app.callback(
+        Output('gr7', 'figure'),
+        [Input('gr7_name_select', 'value'),
+         Input('gr7_y_select', 'value')])(with_data(update_graph7))
+
+
+def on_reload(state, config, data):
+    # Runs before the reloaded data is swapped in
+    state.figures = initial_figures(data)
+    figure_cache.invalidate()
+    if config['warm_up']:
+        warm_up(data)
+    if isinstance(data, DashboardData):
+        data_cache.save(config['workbook'], config['cache_dir'],
+                        {'df': data.df, 'sf': data.sf}, CACHE_VERSION)
+
+
+def load_data(config, timer):
+    url = config['data_source']
+    if not url:
+        return DashboardData.load(config['workbook'], config['cache_dir'],
+                                  timer)
+    if url.startswith('sqlite:///'):
+        return SQLiteData.load(config['workbook'], url[len('sqlite:///'):],
+                               timer)
+    raise ValueError(f'Unknown data source: {url}')
+
+
+def load_and_warm_up(state, config):
+    try:
+        data = load_data(config, state.timer)
+        state.figures = initial_figures(data)
+        state.timer.lap('initial figures')
+        state.set(data)
+        if config['warm_up']:
+            warm_up(data)
+            state.timer.lap('warm up')
+    except Exception as e:
+        print(str(e))
+        state.fail(e)
+        return
+    state.ready.set()
+    print(state.timer.report())
+    if config['watch']:
+        watch(state, config,
+              lambda data: on_reload(state, config, data))
+
+
+def create_app(config=None):
+    config = dict(DEFAULT_CONFIG, **(config or {}))
+    state = DataState()
+
+    if config['result_store']:
+        figure_cache.use_store(make_store(config['result_store']))
+
+    app = dash.Dash(__name__)
+    # Health checks and the metrics scraper don't log in
+    dash_auth.BasicAuth(app, config['auth_pairs'],
+                        public_routes=['/ready', '/metrics'])
+    # Registered first so it runs after the other after_request hooks -
+    # /metrics records response sizes before compression
+    compressor = None
+    if config['compress_min_bytes'] is not None:
+        compressor = Compressor(config['compress_min_bytes'])
+        compressor.init_app(app.server)
+    # Logo served separately at a content-hashed URL, cached by the browser
+    logo_url = StaticAssets(app.server).url(config['logo'])
+    app.state = state
+    app.title = 'Dashboard Demo'
+    # The full layout (and its component ids) only exists once data is loaded
+    app.config['suppress_callback_exceptions'] = True
+
+    # Possible to use CSS for better styling at later date
+    # app.css.append_css({
+    #     'external_url': ''
+    # })
+
+    def serve_layout():
+        if not state.loaded.is_set() or state.data is None:
+            return skeleton_layout()
+        return html.Div([
+            header(),
+            html.Div(build_page(state.data, state.figures, logo_url,
+                                poll_interval),
+                     id='page'),
+        ])
+
+    poll_interval = config['reload_interval']
+    app.layout = serve_layout
+
+    # Swap the skeleton for the full page once loading has finished
+    @app.callback(
+        Output('page', 'children'),
+        [Input('ready_poll', 'n_intervals')])
+    def replace_skeleton(n_intervals):
+        data = state.get(timeout=0)
+        return build_page(data, state.figures, logo_url, poll_interval)
+
+    profiler = None
+    if config['profile_callback']:
+        profiler = SamplingProfiler(config['profile_callback'])
+    pool = JobPool(config['job_workers']) if config['job_workers'] else None
+    register_callbacks(app, state, profiler, pool)
+
+    @app.server.before_request
+    def start_request_timer():
+        flask.g.request_start = time.perf_counter()
+
+    @app.server.after_request
+    def record_callback(response):
+        # Set by callbacks registered with with_data
+        callback = flask.g.pop('callback', None)
+        if callback:
+            name, compute = callback
+            callback_metrics.observe(
+                name, compute, time.perf_counter() - flask.g.request_start,
+                response.calculate_content_length())
+        return response
+
+    @app.server.route('/metrics')
+    def metrics():
+        memory = state.data.memory_report() if state.data else None
+        counters = {'single_flight': single_flight.stats()}
+        if pool:
+            counters['jobs'] = pool.stats()
+        if compressor:
+            counters['compression'] = compressor.stats()
+        return flask.Response(
+            callback_metrics.render(figure_cache.stats(), memory, counters),
+            mimetype='text/plain; version=0.0.4')
+
+    @app.server.route('/profile')
+    def profile():
+        if profiler is None:
+            return 'Set profile_callback to profile a callback\n', 404
+        return flask.Response(profiler.collapsed(), mimetype='text/plain')
+
+    # Bytes saved by payload.reduce_payload, per callback
+    @app.server.route('/payload')
+    def payload():
+        return flask.jsonify(payload_stats.summary())
+
+    @app.server.route('/ready')
+    def ready():
+        body = {'ready': state.ready.is_set() and state.error is None,
+                'loaded': state.loaded.is_set() and state.error is None,
+                'error': str(state.error) if state.error else None,
+                'phases': dict(state.timer.phases)}
+        return flask.jsonify(body), 200 if body['ready'] else 503
+
+    if config['background']:
+        threading.Thread(target=load_and_warm_up, args=(state, config),
+                         daemon=True).start()
+    else:
+        load_and_warm_up(state, config)
+    return app
+
+
+def create_server(config=None):
+    # The Flask (WSGI) app, for gunicorn - it only accepts a name or a call
+    return create_app(config).server
+
+
 # Initialise the server
+# eg. gunicorn "DashboardDemo:create_server()"
 if __name__ == '__main__':
+    app = create_app()
     app.run_server()
@@ -0,0 +1,57 @@
+// Clientside callbacks - run in the browser, see register_callbacks
+
+// Sweeping across gr1 hovers over many traces - only the one the pointer
+// rests on for this long is passed on (and redraws gr2)
+var HOVER_DEBOUNCE_MS = 150;
+var hoverCalls = 0;
+// Numbers the page's gr1/gr5 requests in the order the user made them
+var requestCount = 0;
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // Trace hovered over on gr1, only updated when it changes - once
+        // no other hover has come in for HOVER_DEBOUNCE_MS
+        hover_curve: function(hoverData, current) {
+            var curve = null;
+            if (hoverData && hoverData.points && hoverData.points.length) {
+                curve = hoverData.points[0].curveNumber;
+            }
+            var call = ++hoverCalls;
+            var no_update = window.dash_clientside.no_update;
+            return new Promise(function(resolve) {
+                setTimeout(function() {
+                    if (call !== hoverCalls || curve === current) {
+                        resolve(no_update);
+                    } else {
+                        resolve(curve);
+                    }
+                }, HOVER_DEBOUNCE_MS);
+            });
+        },
+
+        // Next request number, as a control of gr1/gr5 changes - the server
+        // drops requests older than one it has seen (job_pool.py)
+        next_request: function() {
+            requestCount += 1;
+            return requestCount;
+        },
+
+        // Highlight trace hovered over, thin lines for the rest
+        highlight_trace: function(base, curve) {
+            if (!base) {
+                return window.dash_clientside.no_update;
+            }
+            var figure = base.figure;
+            if (!base.highlight || curve === null || curve === undefined) {
+                return figure;
+            }
+            var data = figure.data.map(function(trace, n) {
+                // Size of highlighted line
+                var width = n === curve ? 6 : 1;
+                var line = Object.assign({}, trace.line, {width: width});
+                return Object.assign({}, trace, {line: line});
+            });
+            return Object.assign({}, figure, {data: data});
+        }
+    }
+});
@@ -0,0 +1,73 @@
+# Figure building - cufflinks vs figures.py
+#
+# Times building the gr1 line figure (consultants x months) both ways and
+# compares the size of the JSON sent to the browser. cufflinks is only
+# needed for the comparison - without it just the direct builders are timed.
+#
+# Usage (from the repo root):
+#   python benchmarks/bench_figures.py [--consultants 10 50 200] [--months 120]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from figure_cache import figure_size  # noqa: E402
+from figures import line_figure, use_webgl  # noqa: E402
+
+try:
+    import cufflinks  # noqa: F401
+except ImportError:
+    cufflinks = None
+
+
+def sample_frame(num_consultants, num_months, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        rng.uniform(0, 20000, (num_months, num_consultants)).round(0),
+        index=pd.date_range('2010-01-01', periods=num_months, freq='MS',
+                            name='Month'),
+        columns=pd.Index([f'Consultant {i:04d}'
+                          for i in range(num_consultants)],
+                         name='Consultant'))
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), fig
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compare cufflinks and direct figure building')
+    parser.add_argument('--consultants', type=int, nargs='+',
+                        default=[10, 50, 200])
+    parser.add_argument('--months', type=int, default=120)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f'{"consultants":>11} {"path":<10} {"build ms":>9} {"JSON KB":>9}')
+    for num in args.consultants:
+        frame = sample_frame(num, args.months)
+        paths = [('direct', lambda: line_figure(frame, 'Gross sales'))]
+        if cufflinks is not None:
+            paths.append(('cufflinks', lambda: frame.iplot(
+                title='Gross sales', asFigure=True)))
+        for name, build in paths:
+            secs, fig = best_of(build, args.repeat)
+            print(f'{num:>11} {name:<10} {1000 * secs:9.1f} '
+                  f'{figure_size(fig) / 1024:9.1f}')
+        webgl = use_webgl(num, frame.size)
+        print(f'{"":>11} {"(WebGL)" if webgl else "(SVG)"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+# Service fee engine - equivalence check and timing
+#
+# Compares service_fee.calculate_fees against the original row-by-row
+# `df.apply(service_fee_calc, axis=1)` lookup, first on the demo workbook and
+# then on a synthetic history (1M rows by default).
+#
+# Row-by-row is far too slow to run over 1M rows routinely, so by default it
+# is timed on a sample and extrapolated - pass --full-rowwise to run it all.
+#
+# Usage (from the repo root):
+#   python benchmarks/bench_service_fee.py [--rows 1000000]
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+from service_fee import calculate_fees  # noqa: E402
+from synthetic import make_frames  # noqa: E402
+
+WORKBOOK = os.path.join(os.path.dirname(__file__), os.pardir,
+                        'DashboardDemo_RandomData.xlsx')
+
+
+# Original per-row implementation, kept here as the reference
+def service_fee_calc(row, sf):
+    name = row['Consultant']
+    date = row['Month']
+    filtered_sf = sf[sf['Date_applied'] <= date]
+
+    if name in filtered_sf['Consultant'].values:
+        # use most recent from before this date
+        vals = filtered_sf[filtered_sf['Consultant'] == name].iloc[-1]
+    else:
+        # else use most recent default from before this date
+        vals = filtered_sf[filtered_sf['Consultant'] == 'DEFAULT'].iloc[-1]
+    return vals['SF_flat'] + vals['SF_pct'] * row['Commission'] / 100
+
+
+def check_equal(df, sf, label):
+    expected = df.apply(service_fee_calc, axis=1, sf=sf).values
+    actual = calculate_fees(df, sf)['Service fee'].values
+    if not np.allclose(expected, actual):
+        bad = np.flatnonzero(~np.isclose(expected, actual))
+        raise AssertionError(f'{label}: {len(bad)} rows differ, '
+                             f'first at row {bad[0]}')
+    print(f'{label}: {len(df)} rows match')
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Service fee engine equivalence check and timing')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--sample', type=int, default=20000,
+                        help='rows used to time the row-by-row path')
+    parser.add_argument('--full-rowwise', action='store_true')
+    args = parser.parse_args()
+
+    if os.path.exists(WORKBOOK):
+        df = pd.read_excel(WORKBOOK, sheet_name='Data', parse_dates=['Month'])
+        sf = pd.read_excel(WORKBOOK, sheet_name='SF_Rates')
+        check_equal(df, sf, 'Demo workbook')
+
+    df, sf = make_frames(num_consultants=500,
+                         num_months=max(1, args.rows // 500))
+    check_equal(df.sample(min(len(df), 5000), random_state=0), sf,
+                'Synthetic sample')
+
+    vectorised = timed(lambda: calculate_fees(df, sf))
+    sample = df if args.full_rowwise else df.iloc[:args.sample]
+    rowwise = timed(lambda: sample.apply(service_fee_calc, axis=1, sf=sf))
+    rowwise *= len(df) / len(sample)
+
+    note = '' if args.full_rowwise else f' (extrapolated from {len(sample)})'
+    print(f'{len(df)} rows, {len(sf)} rates')
+    print(f'  row-by-row: {rowwise:10.2f}s{note}')
+    print(f'  vectorised: {vectorised:10.2f}s')
+    print(f'  speed-up:   {rowwise / vectorised:10.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+# Load test - concurrent users replaying sessions against a running app
+#
+# Starts the app locally (the threaded Flask server, or gunicorn with
+# --workers), then each simulated user replays random_session() from
+# benchmarks/session.py against /_dash-update-component: page loads, slider
+# drags, hover storms on gr1/gr3, Top 5 toggles and consultant lookups.
+# Requests within a burst (eg. each step of a drag) start --burst-gap apart
+# without waiting for each other, as the browser sends them; users pause
+# for a random think time (mean --think) between actions.
+#
+# Reports p50/p95/p99 latency and throughput per callback for each server
+# setup - every --workers count with every --config - writes them as JSON
+# and can compare them with an earlier run. 204s (no update, eg. a request
+# superseded on the job pool) are counted apart from errors.
+#
+# Usage (from the repo root):
+#   python benchmarks/load_test.py [--users 10] [--duration 60] [--think 2]
+#       [--workers 1 4] [--config '{"job_workers": 0}' ...]
+#       [--workbook ...] [--out load_results.json] [--compare old.json]
+
+import argparse
+import base64
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import DashboardDemo as demo  # noqa: E402
+from run_benchmarks import git_revision  # noqa: E402
+from session import random_session  # noqa: E402
+from timings import PhaseTimer  # noqa: E402
+
+REPO = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+AUTH = 'Basic ' + base64.b64encode(b'Demo:demo').decode()
+
+
+def serve(port, config):
+    # The app on the threaded Flask server - run in a subprocess
+    app = demo.create_app(config)
+    app.server.run(host='127.0.0.1', port=port, threaded=True)
+
+
+def start_server(port, workers, config):
+    if workers is None:
+        command = [sys.executable, os.path.abspath(__file__), '--serve',
+                   str(port), json.dumps(config)]
+    else:
+        command = ['gunicorn', '--workers', str(workers), '--threads', '8',
+                   '--bind', f'127.0.0.1:{port}',
+                   f'DashboardDemo:create_server({config!r})']
+    try:
+        return subprocess.Popen(command, cwd=REPO, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+    except FileNotFoundError:
+        sys.exit('--workers needs gunicorn installed')
+
+
+def request(port, method, path, body=None, timeout=60):
+    # (status, seconds)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    headers = {'Authorization': AUTH, 'Accept-Encoding': 'gzip, br'}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    start = time.perf_counter()
+    try:
+        conn.request(method, path, body, headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status, time.perf_counter() - start
+    except OSError:
+        return None, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def wait_ready(port, server, timeout=300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            sys.exit('The app exited while starting')
+        if request(port, 'GET', '/ready', timeout=5)[0] == 200:
+            return
+        time.sleep(0.5)
+    sys.exit(f'The app was not ready after {timeout}s')
+
+
+class Recorder:
+
+    def __init__(self):
+        self.samples = []  # (callback, status, seconds)
+        self._lock = threading.Lock()
+
+    def add(self, name, status, seconds):
+        with self._lock:
+            self.samples.append((name, status, seconds))
+
+
+def user(port, data, seed, think, burst_gap, stop, recorder):
+    rng = random.Random(seed)
+    while not stop.is_set():
+        session = random_session(data, rng, session_id=f'user{seed}')
+        for burst in session:
+            threads = []
+            for name, body in burst:
+                if stop.is_set():
+                    break
+                thread = threading.Thread(
+                    target=lambda name=name, body=body: recorder.add(
+                        name, *request(port, 'POST',
+                                       '/_dash-update-component', body)))
+                thread.start()
+                threads.append(thread)
+                stop.wait(burst_gap)
+            for thread in threads:
+                thread.join()
+            if stop.wait(rng.expovariate(1 / think) if think else 0):
+                return
+
+
+def summarise(samples, duration):
+    by_name = {}
+    for name, status, seconds in samples:
+        by_name.setdefault(name, []).append((status, seconds))
+    by_name['all'] = [(status, seconds) for _, status, seconds in samples]
+    results = {}
+    for name, calls in sorted(by_name.items()):
+        answered = np.array([s for status, s in calls
+                             if status in (200, 204)]) * 1000
+        results[name] = {
+            'requests': len(calls),
+            'no_update': sum(status == 204 for status, _ in calls),
+            'errors': sum(status not in (200, 204) for status, _ in calls),
+            'per_sec': round(len(answered) / duration, 2)}
+        if len(answered):
+            results[name].update({
+                f'p{q}_ms': round(float(np.percentile(answered, q)), 1)
+                for q in (50, 95, 99)})
+    return results
+
+
+def run(workers, config, args, data, port):
+    label = f"{'dev server' if workers is None else f'{workers} workers'}" \
+        + (f' {json.dumps(config)}' if config else '')
+    server_config = dict({'workbook': os.path.abspath(args.workbook),
+                          'watch': False},
+                         **config)
+    server = start_server(port, workers, server_config)
+    try:
+        wait_ready(port, server)
+        stop = threading.Event()
+        recorder = Recorder()
+        users = [threading.Thread(target=user, args=(
+                     port, data, seed, args.think, args.burst_gap, stop,
+                     recorder))
+                 for seed in range(args.users)]
+        start = time.perf_counter()
+        for thread in users:
+            thread.start()
+        stop.wait(args.duration)
+        stop.set()
+        for thread in users:
+            thread.join()
+        duration = time.perf_counter() - start
+    finally:
+        server.terminate()
+        server.wait()
+    return {'label': label, 'workers': workers, 'config': config,
+            'users': args.users, 'think': args.think,
+            'duration': round(duration, 1),
+            'callbacks': summarise(recorder.samples, duration)}
+
+
+def print_run(run):
+    print(f"\n{run['label']} - {run['users']} users, think {run['think']}s, "
+          f"{run['duration']}s")
+    print(f"  {'callback':<22} {'requests':>8} {'req/s':>7} {'no upd':>7} "
+          f"{'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for name, s in run['callbacks'].items():
+        print(f"  {name:<22} {s['requests']:>8} {s['per_sec']:>7.1f} "
+              f"{s['no_update']:>7} {s['errors']:>7} "
+              + ''.join(f"{s.get(f'p{q}_ms', float('nan')):>9.1f}"
+                        for q in (50, 95, 99)))
+
+
+def print_comparison(runs, baseline=None):
+    # p95 and throughput of each callback, run by run (against the
+    # matching run of an earlier result file, if given)
+    names = sorted({name for run in runs for name in run['callbacks']})
+    print('\np95 ms (req/s)')
+    for i, run in enumerate(runs, start=1):
+        print(f"  run {i}: {run['label']}")
+    print(f"  {'callback':<22}" + ''.join(f"{f'run {i}':>26}"
+                                          for i in range(1, len(runs) + 1)))
+    for name in names:
+        cells = []
+        for run in runs:
+            s = run['callbacks'].get(name)
+            cell = '-' if s is None else \
+                f"{s.get('p95_ms', float('nan')):.1f} ({s['per_sec']:.1f})"
+            if baseline and s:
+                prev = baseline.get(run['label'], {}).get(name)
+                if prev and prev.get('p95_ms') and 'p95_ms' in s:
+                    cell += f" x{s['p95_ms'] / prev['p95_ms']:.2f}"
+            cells.append(cell)
+        print(f'  {name:<22}' + ''.join(f'{cell:>26}' for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the dashboard with concurrent sessions')
+    parser.add_argument('--serve', nargs=2, metavar=('PORT', 'CONFIG'),
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=60,
+                        help='seconds of load per server setup')
+    parser.add_argument('--think', type=float, default=2,
+                        help='mean seconds between a user\'s actions')
+    parser.add_argument('--burst-gap', type=float, default=0.05,
+                        help='seconds between requests of a drag/hover')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='gunicorn worker counts (default: one process '
+                             'on the Flask server)')
+    parser.add_argument('--config', nargs='+', type=json.loads,
+                        default=[{}], help='app config overrides, as JSON')
+    parser.add_argument('--workbook',
+                        default=demo.DEFAULT_CONFIG['workbook'])
+    parser.add_argument('--port', type=int, default=8051)
+    parser.add_argument('--out', default='load_results.json')
+    parser.add_argument('--compare', help='earlier results to compare with')
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(int(args.serve[0]), json.loads(args.serve[1]))
+        return
+
+    # Sessions are built from the same data the app loads
+    data = demo.load_data(dict(demo.DEFAULT_CONFIG, workbook=args.workbook),
+                          PhaseTimer())
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'revision': git_revision(), 'runs': []}
+    for workers in args.workers or [None]:
+        for config in args.config:
+            result = run(workers, config, args, data, args.port)
+            results['runs'].append(result)
+            print_run(result)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nWrote {args.out}')
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print(f"\nCompared with {old.get('revision')} "
+              f"({old.get('timestamp')}) - xN is p95 now/then")
+        baseline = {r['label']: r['callbacks'] for r in old['runs']}
+    if len(results['runs']) > 1 or baseline:
+        print_comparison(results['runs'], baseline)
+
+
+if __name__ == '__main__':
+    main()
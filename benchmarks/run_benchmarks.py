@@ -0,0 +1,282 @@
+# Startup and callback timings on synthetic workbooks
+#
+# For each size, writes a workbook with benchmarks/synthetic.py, then times
+# startup (cold - no data cache, and warm - from the data cache) phase by
+# phase, and every graph callback over a spread of inputs. Memoized callbacks
+# are timed both uncached and from the figure cache. Results are written as
+# JSON, and can be compared with an earlier run. --sources picks the data
+# sources timed: in memory (dashboard_data.py) and/or SQLite (sql_source.py).
+# The data source queries the callbacks make are timed too, and the SQLite
+# ones checked against QUERY_P95_TARGET_MS - what its indexes are meant to
+# deliver. The exit status is 1 if any query is over it.
+#
+# Usage (from the repo root):
+#   python benchmarks/run_benchmarks.py [--sizes 20x24 200x120]
+#       [--sources memory sqlite] [--repeat 3] [--out results.json]
+#       [--compare old_results.json]
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import DashboardDemo as demo  # noqa: E402
+from dashboard_data import (DashboardData, cols_to_graph_1,  # noqa: E402
+                            cols_to_graph_7)
+from sql_source import SQLiteData  # noqa: E402
+from synthetic import write_workbook  # noqa: E402
+from timings import PhaseTimer  # noqa: E402
+
+QUERY_P95_TARGET_MS = 100  # per SQLite query, p95
+
+
+def call_time(fn, *args):
+    start = time.perf_counter()
+    try:
+        fn(*args)
+    except PreventUpdate:
+        pass
+    return time.perf_counter() - start
+
+
+def callback_inputs(data):
+    # (callback name, function, memoized, list of argument tuples)
+    n = data.num_of_months
+    ranges = [[max(0, n - 12), n - 1], [0, n - 1]]
+    names = list(data.consultants[:3]) + [data.month_leader]
+    months = [data.months[0], data.months[n // 2], data.months[-1]]
+    return [
+        ('update_graph1', demo.update_graph1, False,
+         [(data, metric, top5, None, r) for metric in cols_to_graph_1
+          for top5 in ([], ['top5']) for r in ranges]
+         + [(data, cols_to_graph_1[0], [], name, r)
+            for name in names for r in ranges]),
+        ('update_graph2', demo.update_graph2, False,
+         [(data, i, None, names) for i in range(len(names))]
+         + [(data, 0, name, None) for name in names]),
+        ('update_graph3', demo.update_graph3, True,
+         [(data, metric, month) for metric in cols_to_graph_1
+          for month in months]),
+        ('update_graph4', demo.update_graph4, False,
+         [(data, {'points': [{'label': name}]}) for name in names]),
+        ('update_graph5', demo.update_graph5, True,
+         [(data, year) for year in data.years]),
+        ('update_graph7', demo.update_graph7, True,
+         [(data, name, metric) for name in names
+          for metric in cols_to_graph_7]),
+    ]
+
+
+def query_inputs(data):
+    # (query name, method, list of argument tuples)
+    months = data.months_dt
+    ranges = [(months[max(0, len(months) - 12)], months[-1]),
+              (months[0], months[-1])]
+    names = list(data.consultants[:3]) + [data.month_leader]
+    return [
+        ('range_frame', data.range_frame,
+         [(metric, *r) for metric in cols_to_graph_1 for r in ranges]
+         + [(cols_to_graph_1[0], *r, names) for r in ranges]),
+        ('range_totals', data.range_totals,
+         [(metric, *r) for metric in cols_to_graph_1 for r in ranges]),
+        ('top_n', data.top_n,
+         [(metric, *r) for metric in cols_to_graph_1 for r in ranges]),
+        ('month_values', data.month_values,
+         [(metric, month) for metric in cols_to_graph_1
+          for month in (months[0], months[-1])]),
+        ('history', data.history, [(name,) for name in names]),
+        ('financial_year_history', data.financial_year_history,
+         [(name, fin_year) for name in names
+          for fin_year in data.fin_years[-3:]]),
+        ('period_totals', data.period_totals,
+         [('year', year) for year in data.years]),
+    ]
+
+
+def summarise(times):
+    times = np.array(times) * 1000
+    return {'calls': len(times),
+            'mean_ms': round(float(times.mean()), 3),
+            'p50_ms': round(float(np.percentile(times, 50)), 3),
+            'p95_ms': round(float(np.percentile(times, 95)), 3),
+            'max_ms': round(float(times.max()), 3)}
+
+
+def time_startup(workbook, cache_dir, source):
+    timer = PhaseTimer()
+    if source == 'sqlite':
+        data = SQLiteData.load(workbook, os.path.join(cache_dir, 'data.db'),
+                               timer)
+    else:
+        data = DashboardData.load(workbook, cache_dir, timer)
+    with timer.phase('initial figures'):
+        demo.initial_figures(data)
+    demo.figure_cache.invalidate()
+    with timer.phase('warm up'):
+        demo.warm_up(data)
+    phases = {name: round(secs, 4) for name, secs in timer.phases.items()}
+    phases['total'] = round(timer.total(), 4)
+    return data, phases
+
+
+def time_callbacks(data, repeat):
+    results = {}
+    for name, fn, memoized, inputs in callback_inputs(data):
+        uncached, cached = [], []
+        for _ in range(repeat):
+            for args in inputs:
+                if memoized:
+                    demo.figure_cache.invalidate()
+                uncached.append(call_time(fn, *args))
+                if memoized:
+                    cached.append(call_time(fn, *args))
+        results[name] = summarise(uncached)
+        if memoized:
+            results[name + ' (cached)'] = summarise(cached)
+    return results
+
+
+def time_queries(data, repeat):
+    return {name: summarise([call_time(fn, *args) for _ in range(repeat)
+                             for args in inputs])
+            for name, fn, inputs in query_inputs(data)}
+
+
+def over_target(run):
+    # SQLite queries slower than the target, p95
+    if run['source'] != 'sqlite':
+        return []
+    return [name for name, s in run['queries'].items()
+            if s['p95_ms'] > QUERY_P95_TARGET_MS]
+
+
+def run_size(num_consultants, num_months, source, repeat,
+             rate_change_months):
+    with tempfile.TemporaryDirectory() as tmp:
+        workbook = os.path.join(tmp, 'bench.xlsx')
+        cache_dir = os.path.join(tmp, 'cache')
+        df, sf = write_workbook(workbook, num_consultants=num_consultants,
+                                num_months=num_months,
+                                rate_change_months=rate_change_months)
+        _, cold = time_startup(workbook, cache_dir, source)
+        data, warm = time_startup(workbook, cache_dir, source)
+        callbacks = time_callbacks(data, repeat)
+        queries = time_queries(data, repeat)
+        memory = data.memory_report()
+    return {'consultants': num_consultants, 'months': num_months,
+            'source': source,
+            'rows': len(df), 'rates': len(sf),
+            'memory': memory,
+            'startup (no data cache)': cold, 'startup (data cache)': warm,
+            'callbacks': callbacks, 'queries': queries}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_run(run):
+    print(f"\n{run['consultants']} consultants x {run['months']} months "
+          f"({run['rows']} rows, {run['rates']} rates) - {run['source']}")
+    print('  memory: ' + ', '.join(f'{name} {n / 1024 ** 2:.1f}MB'
+                                   for name, n in run['memory'].items()))
+    for label in ('startup (no data cache)', 'startup (data cache)'):
+        print(f'  {label}:')
+        for phase, secs in run[label].items():
+            print(f'    {phase:<20} {secs:8.3f}s')
+    print(f"  {'callback':<26} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'max ms':>9}")
+    for name, s in run['callbacks'].items():
+        print(f"  {name:<26} {s['calls']:>6} {s['p50_ms']:>9.2f} "
+              f"{s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}")
+    print(f"  {'query':<26} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} "
+          f"{'max ms':>9}")
+    slow = over_target(run)
+    for name, s in run['queries'].items():
+        print(f"  {name:<26} {s['calls']:>6} {s['p50_ms']:>9.2f} "
+              f"{s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}"
+              + ('  over target' if name in slow else ''))
+    if run['source'] == 'sqlite':
+        print(f'  query p95 target {QUERY_P95_TARGET_MS}ms: '
+              + (f'{len(slow)} over' if slow else 'met'))
+
+
+def compare(old, new):
+    # p50 of each callback and startup total, new vs old, for matching sizes
+    def key(run):
+        return run['consultants'], run['months'], run.get('source', 'memory')
+
+    old_runs = {key(r): r for r in old['runs']}
+    print(f"\nCompared with {old.get('revision')} ({old.get('timestamp')}):")
+    for run in new['runs']:
+        prev = old_runs.get(key(run))
+        if prev is None:
+            continue
+        print(f"  {run['consultants']} x {run['months']} {run['source']}")
+        rows = [(label, prev[label]['total'], run[label]['total'])
+                for label in ('startup (no data cache)',
+                              'startup (data cache)')]
+        rows += [(name, prev['callbacks'][name]['p50_ms'], s['p50_ms'])
+                 for name, s in run['callbacks'].items()
+                 if name in prev['callbacks']]
+        for name, before, after in rows:
+            ratio = after / before if before else float('nan')
+            print(f'    {name:<26} {before:10.3f} -> {after:10.3f}  '
+                  f'x{ratio:.2f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark startup and callbacks on synthetic data')
+    parser.add_argument('--sizes', nargs='+', default=['20x24', '200x120'],
+                        help='consultants x months, eg. 200x120')
+    parser.add_argument('--sources', nargs='+', default=['memory'],
+                        choices=['memory', 'sqlite'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--rate-change-months', type=int, default=24)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', help='earlier results to compare with')
+    args = parser.parse_args()
+
+    results = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'revision': git_revision(),
+               'python': platform.python_version(),
+               'pandas': pd.__version__,
+               'numpy': np.__version__,
+               'runs': []}
+    for size in args.sizes:
+        num_consultants, num_months = map(int, size.lower().split('x'))
+        for source in args.sources:
+            run = run_size(num_consultants, num_months, source, args.repeat,
+                           args.rate_change_months)
+            results['runs'].append(run)
+            print_run(run)
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'\nWrote {args.out}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    if any(over_target(run) for run in results['runs']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
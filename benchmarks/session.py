@@ -0,0 +1,272 @@
+# User sessions, as the browser's callback requests
+#
+# Page holds one page's control values and gives the requests a change to
+# each control makes the browser send. typical_session() is a fixed walk
+# through the dashboard: the page loading (every callback Dash fires for the
+# initial layout), then moving the month slider, toggling Top 5, hovering
+# over gr1 and the pie chart, and picking other metrics, months, years and
+# consultants. random_session() is a seeded mix of the same, as bursts -
+# slider drags and hover storms send one request per step in quick
+# succession (gr1 hovers are debounced in the browser, so a sweep over its
+# traces sends one) - for load testing (load_test.py).
+# Each request is (callback name, /_dash-update-component JSON body).
+
+from dashboard_data import cols_to_graph_1, cols_to_graph_7
+
+
+def _output(outputs):
+    # Dash's output id: 'gr3.figure', or '..a.b...c.d..' for several
+    if len(outputs) == 1:
+        return '.'.join(outputs[0])
+    return '..' + '...'.join('.'.join(o) for o in outputs) + '..'
+
+
+def update_body(outputs, inputs, state=()):
+    # outputs: [(id, property)], inputs/state: [(id, property, value)]
+    return {
+        'output': _output(outputs),
+        'outputs': ({'id': outputs[0][0], 'property': outputs[0][1]}
+                    if len(outputs) == 1 else
+                    [{'id': i, 'property': p} for i, p in outputs]),
+        'inputs': [{'id': i, 'property': p, 'value': v}
+                   for i, p, v in inputs],
+        'state': [{'id': i, 'property': p, 'value': v} for i, p, v in state],
+        'changedPropIds': [f'{i}.{p}' for i, p, _ in inputs[:1]],
+    }
+
+
+class Page:
+
+    def __init__(self, data, session_id='session'):
+        self.data = data
+        self.session_id = session_id
+        self.requests = 0  # gr1/gr5 requests numbered, as next_request does
+        n = data.num_of_months
+        self.default_range = [max(0, n - 12), n - 1]
+        # Control values, as build_page sets them
+        self.months_selected = self.default_range
+        self.gr1_metric = cols_to_graph_1[0]
+        self.top5 = []
+        self.name = None
+        self.hover_curve = None
+        self.gr3_metric = cols_to_graph_1[0]
+        self.month = data.months[-1]
+        self.year = data.years[-1]
+        self.gr7_name = data.month_leader
+        self.gr7_metric = cols_to_graph_7[0]
+
+    def traces(self):
+        # Consultant of each gr1 trace, as kept in the gr1_traces store
+        if self.name:
+            return None
+        months_dt = self.data.months_dt
+        start, end = (months_dt[i] for i in self.months_selected)
+        if self.top5:
+            return list(self.data.top_n(self.gr1_metric, start, end, 5))
+        return list(self.data.range_totals(self.gr1_metric, start,
+                                           end).index)
+
+    def load(self):
+        n = self.data.num_of_months
+        return [
+            ('refresh_slider', update_body(
+                [('month_slider', 'max'), ('month_slider', 'marks'),
+                 ('month_slider', 'value')],
+                [('data_version', 'data', self.data.version)],
+                [('month_slider', 'value', self.months_selected),
+                 ('month_slider', 'max', n - 1)])),
+            ('refresh_options', update_body(
+                [('gr3_month_select', 'options'),
+                 ('gr5_year_select', 'options'),
+                 ('gr6_name_select', 'options'),
+                 ('gr7_name_select', 'options')],
+                [('data_version', 'data', self.data.version)])),
+            self._title(), self._gr1(), self._gr2(), self._gr3(),
+            self._gr4(None), self._gr5(), self._gr7()]
+
+    def _title(self):
+        return ('month_selector_title', update_body(
+            [('months_filter', 'children')],
+            [('month_slider', 'value', self.months_selected)]))
+
+    def _next_request(self):
+        self.requests += 1
+        return self.requests
+
+    def _gr1(self):
+        return ('update_graph1', update_body(
+            [('gr1_base', 'data'), ('gr1_traces', 'data')],
+            [('gr1_request', 'data', self._next_request())],
+            [('gr1_y_select', 'value', self.gr1_metric),
+             ('gr1_top5', 'value', self.top5),
+             ('gr6_name_select', 'value', self.name),
+             ('month_slider', 'value', self.months_selected),
+             ('session_id', 'data', self.session_id)]))
+
+    def _gr2(self):
+        return ('update_graph2', update_body(
+            [('gr2', 'figure')],
+            [('gr1_hover_curve', 'data', self.hover_curve),
+             ('gr6_name_select', 'value', self.name),
+             ('gr1_traces', 'data', self.traces())]))
+
+    def _gr3(self):
+        return ('update_graph3', update_body(
+            [('gr3', 'figure')],
+            [('gr3_y_select', 'value', self.gr3_metric),
+             ('gr3_month_select', 'value', self.month)]))
+
+    def _gr4(self, name):
+        return ('update_graph4', update_body(
+            [('gr4', 'figure')],
+            [('gr3', 'hoverData',
+              {'points': [{'label': name}]} if name else None)]))
+
+    def _gr5(self):
+        return ('update_graph5', update_body(
+            [('gr5', 'figure')],
+            [('gr5_request', 'data', self._next_request())],
+            [('gr5_year_select', 'value', self.year),
+             ('session_id', 'data', self.session_id)]))
+
+    def _gr7(self):
+        return ('update_graph7', update_body(
+            [('gr7', 'figure')],
+            [('gr7_name_select', 'value', self.gr7_name),
+             ('gr7_y_select', 'value', self.gr7_metric)]))
+
+    # Control changes - each returns the requests it sends
+
+    def slide(self, months_selected):
+        self.months_selected = list(months_selected)
+        return [self._title(), self._gr1()]
+
+    def select_gr1(self, metric=None, top5=None):
+        if metric is not None:
+            self.gr1_metric = metric
+        if top5 is not None:
+            self.top5 = ['top5'] if top5 else []
+        return [self._gr1()]
+
+    def select_name(self, name):
+        # gr6_name_select - gr1 shows the consultant's history
+        self.name = name
+        return [self._gr1(), self._gr2()]
+
+    def hover_gr1(self, curve):
+        # The trace the pointer rests on - only sent when it changes
+        # (clientside hover_curve)
+        if curve == self.hover_curve:
+            return []
+        self.hover_curve = curve
+        return [self._gr2()]
+
+    def select_pie(self, metric=None, month=None):
+        self.gr3_metric = metric or self.gr3_metric
+        self.month = month or self.month
+        return [self._gr3()]
+
+    def hover_pie(self, name):
+        return [self._gr4(name)]
+
+    def select_year(self, year):
+        self.year = year
+        return [self._gr5()]
+
+    def select_gr7(self, name=None, metric=None):
+        self.gr7_name = name or self.gr7_name
+        self.gr7_metric = metric or self.gr7_metric
+        return [self._gr7()]
+
+
+def typical_session(data, session_id='session'):
+    page = Page(data, session_id)
+    consultants = list(data.consultants)
+    n = data.num_of_months
+    requests = page.load()
+
+    full_range = [0, n - 1]
+    requests += page.slide(full_range)
+    requests += page.select_gr1(top5=True)
+    for curve in range(min(3, len(page.traces()))):
+        requests += page.hover_gr1(curve)
+    requests += page.select_gr1(metric=cols_to_graph_1[-1])
+    requests += page.select_pie(metric=cols_to_graph_1[-1])
+    requests += page.select_pie(month=data.months[-2])
+    for name in consultants[:3]:
+        requests += page.hover_pie(name)
+    for year in data.years[::-1][:3]:
+        requests += page.select_year(year)
+    for name in consultants[:2]:
+        requests += page.select_gr7(name=name)
+    requests += page.select_gr7(metric=cols_to_graph_7[-1])
+    requests += page.select_gr1(metric=cols_to_graph_1[0], top5=False)
+    requests += page.slide(page.default_range)
+    requests += page.select_name(consultants[0])
+    requests += page.hover_gr1(0)
+    return requests
+
+
+def random_session(data, rng, actions=20, session_id='session'):
+    # Bursts of requests - the page load, then `actions` user actions
+    page = Page(data, session_id)
+    consultants = list(data.consultants)
+    n = data.num_of_months
+    yield page.load()
+
+    def drag():
+        # One handle of the month slider, a month per step
+        low, high = page.months_selected
+        if rng.random() < 0.5:
+            target = rng.randrange(0, high + 1)
+            steps = [[m, high] for m in _towards(low, target)]
+        else:
+            target = rng.randrange(low, n)
+            steps = [[low, m] for m in _towards(high, target)]
+        return [request for step in steps for request in page.slide(step)]
+
+    def hover_storm_gr1():
+        # Sweeping over several traces - the browser's debounce only sends
+        # the last
+        traces = page.traces() or [page.name]
+        curves = [rng.randrange(len(traces))
+                  for _ in range(rng.randint(3, 15))]
+        return page.hover_gr1(curves[-1])
+
+    def hover_storm_gr3():
+        return [request for name in rng.sample(
+                    consultants, min(len(consultants), rng.randint(3, 15)))
+                for request in page.hover_pie(name)]
+
+    def toggle_top5():
+        return page.select_gr1(top5=not page.top5)
+
+    def lookup_gr6():
+        if page.name and rng.random() < 0.5:
+            return page.select_name(None)
+        return page.select_name(rng.choice(consultants))
+
+    def lookup_gr7():
+        return page.select_gr7(name=rng.choice(consultants),
+                               metric=rng.choice(cols_to_graph_7))
+
+    def other():
+        return rng.choice([
+            lambda: page.select_gr1(metric=rng.choice(cols_to_graph_1)),
+            lambda: page.select_pie(metric=rng.choice(cols_to_graph_1),
+                                    month=rng.choice(data.months)),
+            lambda: page.select_year(rng.choice(list(data.years))),
+        ])()
+
+    choices = [drag, hover_storm_gr1, hover_storm_gr3, toggle_top5,
+               lookup_gr6, lookup_gr7, other]
+    weights = [3, 3, 2, 1, 2, 2, 1]
+    for _ in range(actions):
+        burst = rng.choices(choices, weights)[0]()
+        if burst:
+            yield burst
+
+
+def _towards(start, target):
+    step = 1 if target >= start else -1
+    return range(start + step, target + step, step)
@@ -0,0 +1,78 @@
+# Synthetic workbooks shaped like DashboardDemo_RandomData.xlsx
+#
+# A Data sheet (Month, Consultant, Gross sales, Cost of sales, Commission)
+# and an SF_Rates sheet (Consultant, Date_applied, SF_pct, SF_flat) with
+# DEFAULT rows, at any number of consultants/months, and with consultants'
+# own rates changing every `rate_change_months`.
+#
+# Usage (from the repo root):
+#   python benchmarks/synthetic.py out.xlsx --consultants 200 --months 120
+
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+def make_frames(num_consultants=20, num_months=24, rate_change_months=24,
+                start='2010-01-01', seed=0):
+    rng = np.random.default_rng(seed)
+    month_list = pd.date_range(start, periods=num_months, freq='MS')
+    names = np.array([f'Consultant {i:04d}' for i in range(num_consultants)])
+
+    # Each consultant's sales vary around their own base, as in Rand_calcs
+    base = np.tile(rng.uniform(500, 10000, num_consultants), num_months)
+    gross = (base * rng.uniform(0.8, 1.3, len(base))).round(2)
+    commission = (gross * rng.uniform(0.05, 0.3, len(base))).round(2)
+    df = pd.DataFrame({
+        'Month': np.repeat(month_list, num_consultants),
+        'Consultant': np.tile(names, num_months),
+        'Gross sales': gross,
+        'Cost of sales': (gross - commission).round(2),
+        'Commission': commission,
+    })
+
+    # DEFAULT from before the data starts, changing yearly. A fifth of the
+    # consultants have their own rates, from a random month on
+    sf_rows = [('DEFAULT', pd.Timestamp('2000-01-01'), 10, 100)]
+    sf_rows += [('DEFAULT', d, 10 + i % 5, 100)
+                for i, d in enumerate(pd.date_range(start, month_list[-1],
+                                                    freq='12MS'))]
+    for name in names[::5]:
+        first = month_list[rng.integers(num_months)]
+        for d in pd.date_range(first, month_list[-1],
+                               freq=f'{rate_change_months}MS'):
+            sf_rows.append((name, d, int(rng.integers(0, 20)),
+                            int(rng.integers(0, 300))))
+    sf = pd.DataFrame(sf_rows, columns=['Consultant', 'Date_applied',
+                                        'SF_pct', 'SF_flat'])
+    sf = sf.sort_values('Date_applied', kind='mergesort').reset_index(drop=True)
+    return df, sf
+
+
+def write_workbook(path, **kwargs):
+    df, sf = make_frames(**kwargs)
+    with pd.ExcelWriter(path) as writer:
+        df.to_excel(writer, sheet_name='Data', index=False)
+        sf.to_excel(writer, sheet_name='SF_Rates', index=False)
+    return df, sf
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Write a synthetic dashboard workbook')
+    parser.add_argument('path')
+    parser.add_argument('--consultants', type=int, default=20)
+    parser.add_argument('--months', type=int, default=24)
+    parser.add_argument('--rate-change-months', type=int, default=24)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    df, sf = write_workbook(args.path, num_consultants=args.consultants,
+                            num_months=args.months,
+                            rate_change_months=args.rate_change_months,
+                            seed=args.seed)
+    print(f'Wrote {args.path}: {len(df)} rows, {len(sf)} rates')
+
+
+if __name__ == '__main__':
+    main()
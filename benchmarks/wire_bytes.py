@@ -0,0 +1,139 @@
+# Bytes on the wire for a typical session
+#
+# Replays a first visit and a repeat visit to the dashboard against the app
+# in-process (Flask's test client): the page, Dash's scripts, the layout,
+# images, and the callbacks of benchmarks/session.py. The repeat visit has
+# the browser cache from the first - fresh cached files aren't requested,
+# others are revalidated with If-None-Match. Response bodies are counted
+# as sent (compressed or not), for each Accept-Encoding.
+#
+# Usage (from the repo root):
+#   python benchmarks/wire_bytes.py [--workbook ...] [--encodings identity
+#       gzip br]
+
+import argparse
+import base64
+import gzip
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+import DashboardDemo as demo  # noqa: E402
+from compression import brotli  # noqa: E402
+from session import typical_session  # noqa: E402
+
+CATEGORIES = ('page', 'scripts', 'layout', 'images', 'callbacks')
+
+
+def decoded(response):
+    body = response.get_data()
+    encoding = response.headers.get('Content-Encoding')
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'br':
+        return brotli.decompress(body)
+    return body
+
+
+class Browser:
+    # Test client plus a browser-like HTTP cache, counting body bytes
+
+    def __init__(self, client, headers):
+        self.client = client
+        self.headers = headers
+        self.cache = {}  # url -> (expires, ETag)
+        self.bytes = dict.fromkeys(CATEGORIES, 0)
+        self.requests = 0
+
+    def get(self, url, category):
+        expires, etag = self.cache.get(url, (0, None))
+        if expires > time.time():
+            return None
+        headers = dict(self.headers)
+        if etag:
+            headers['If-None-Match'] = etag
+        response = self.client.get(url, headers=headers)
+        self._count(response, category)
+        if response.status_code == 304:
+            return None
+        max_age = response.cache_control.max_age or 0
+        self.cache[url] = (time.time() + max_age,
+                           response.headers.get('ETag'))
+        return decoded(response)
+
+    def post(self, url, body, category):
+        response = self.client.post(url, json=body, headers=self.headers)
+        self._count(response, category)
+        return response
+
+    def _count(self, response, category):
+        self.requests += 1
+        self.bytes[category] += len(response.get_data())
+
+
+def visit(browser, data):
+    index = browser.get('/', 'page')
+    if index:
+        for url in re.findall(r'(?:src|href)="(/[^"]+)"', index.decode()):
+            if url.split('?')[0].endswith(('.js', '.css')):
+                browser.get(url, 'scripts')
+    browser.get('/_dash-dependencies', 'layout')
+    layout = browser.get('/_dash-layout', 'layout')
+    # (Dash escapes '/' in the layout JSON)
+    layout = json.dumps(json.loads(layout)) if layout else ''
+    for url in set(re.findall(r'"(/files/[^"]+)"', layout)):
+        browser.get(url, 'images')
+    for name, body in typical_session(data):
+        browser.post('/_dash-update-component', body, 'callbacks')
+
+
+def measure(app, encoding):
+    auth = base64.b64encode(b'Demo:demo').decode()
+    headers = {'Authorization': f'Basic {auth}'}
+    if encoding != 'identity':
+        headers['Accept-Encoding'] = encoding
+    browser = Browser(app.server.test_client(), headers)
+    data = app.state.get()
+    visit(browser, data)
+    first = dict(browser.bytes, requests=browser.requests)
+    browser.bytes = dict.fromkeys(CATEGORIES, 0)
+    browser.requests = 0
+    visit(browser, data)
+    repeat = dict(browser.bytes, requests=browser.requests)
+    return {'first visit': first, 'repeat visit': repeat}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Bytes on the wire for a typical dashboard session')
+    parser.add_argument('--workbook',
+                        default=demo.DEFAULT_CONFIG['workbook'])
+    parser.add_argument('--encodings', nargs='+',
+                        default=['identity', 'gzip', 'br'])
+    parser.add_argument('--out', help='write the results as JSON')
+    args = parser.parse_args()
+
+    app = demo.create_app({'workbook': args.workbook, 'background': False,
+                           'watch': False, 'job_workers': 0})
+    results = {encoding: measure(app, encoding)
+               for encoding in args.encodings}
+
+    for encoding, visits in results.items():
+        print(f'\nAccept-Encoding: {encoding}')
+        print(f'  {"":<12}' + ''.join(f'{c:>11}' for c in CATEGORIES)
+              + f'{"total":>11}{"requests":>10}')
+        for visit_name, counts in visits.items():
+            total = sum(counts[c] for c in CATEGORIES)
+            print(f'  {visit_name:<12}'
+                  + ''.join(f'{counts[c] / 1024:10.1f}K' for c in CATEGORIES)
+                  + f'{total / 1024:10.1f}K{counts["requests"]:>10}')
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
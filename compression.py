@@ -0,0 +1,110 @@
+# Response compression
+#
+# Layout, callback (figure JSON) and other text responses larger than
+# min_bytes are sent brotli- or gzip-compressed, whichever the browser
+# accepts (brotli preferred, if the brotli package is installed). Responses
+# browsers may cache, such as Dash's fingerprinted JS bundles, are only
+# compressed once. Bytes before/after are counted for /metrics.
+
+import gzip
+import threading
+from collections import OrderedDict
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE = {'application/json', 'application/javascript',
+                'text/javascript', 'text/html', 'text/css', 'text/plain',
+                'image/svg+xml'}
+
+
+def accepted_encoding(accept_encoding):
+    # 'br', 'gzip' or None, from the request's Accept-Encoding
+    accepted = {part.split(';')[0].strip()
+                for part in accept_encoding.lower().split(',')
+                if not part.strip().endswith(';q=0')}
+    if 'br' in accepted and brotli is not None:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        # quality 5 is several times faster than the default 11, for
+        # nearly the same size on JSON
+        return brotli.compress(body, quality=5)
+    return gzip.compress(body, compresslevel=6)
+
+
+class Compressor:
+
+    def __init__(self, min_bytes=1024, cached_entries=64):
+        self.min_bytes = min_bytes
+        self.cached_entries = cached_entries
+        self._cached = OrderedDict()  # (path, ETag, encoding) -> body
+        self._lock = threading.Lock()
+        self.responses = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def init_app(self, server):
+        server.after_request(self.after_request)
+
+    def after_request(self, response):
+        if (response.status_code != 200 or response.direct_passthrough
+                or response.mimetype not in COMPRESSIBLE
+                or 'Content-Encoding' in response.headers):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = accepted_encoding(
+            flask.request.headers.get('Accept-Encoding', ''))
+        body = response.get_data()
+        if encoding is None or len(body) < self.min_bytes:
+            return response
+
+        key = None
+        if response.cache_control.max_age:
+            key = (flask.request.full_path, response.get_etag()[0],
+                   encoding)
+        compressed = self._get(key)
+        if compressed is None:
+            compressed = compress(body, encoding)
+            self._put(key, compressed)
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        with self._lock:
+            self.responses += 1
+            self.bytes_in += len(body)
+            self.bytes_out += len(compressed)
+        return response
+
+    def _get(self, key):
+        if key is None:
+            return None
+        with self._lock:
+            body = self._cached.get(key)
+            if body is not None:
+                self._cached.move_to_end(key)
+            return body
+
+    def _put(self, key, body):
+        if key is None:
+            return
+        with self._lock:
+            self._cached[key] = body
+            while len(self._cached) > self.cached_entries:
+                self._cached.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'responses': self.responses,
+                    'bytes_in': self.bytes_in,
+                    'bytes_out': self.bytes_out}
@@ -0,0 +1,231 @@
+# Loading the workbook and everything derived from it
+#
+# DashboardData holds the enriched data plus the lists/pivots the layout and
+# callbacks use, so the app can build it on a background thread rather than
+# at import time.
+
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dash.exceptions import PreventUpdate
+
+import data_cache
+from data_source import DataSource
+from ingest import WorkbookReader
+from metric_cube import MetricCube
+from rollups import Rollups
+from row_index import RowIndex, sort_rows
+from service_fee import calculate_fees
+from timings import PhaseTimer
+
+
+CACHE_VERSION = 3  # bump if the derived columns below change
+
+max_prev_years = 5  # for graph 7, comparing previous years for consultant
+
+# for ease of altering if necessary
+cols_to_graph_1 = ['Gross sales', 'Commission', 'Service fee']
+cols_to_graph_4 = ['Gross sales', 'Commission', 'Service fee']
+cols_to_graph_5 = ['Service fee', 'Commission paid', 'Cost of sales']
+cols_to_graph_6 = ['Gross sales', 'Commission', 'Service fee']
+cols_to_graph_7 = ['Gross sales', 'Commission', 'Service fee']
+
+# Column types kept in memory - see compact()
+text_cols = ['Consultant', 'Month_label', 'Financial_year']
+metric_cols = ['Gross sales', 'Cost of sales', 'Commission', 'Service fee',
+               'Commission paid', 'Margin']
+
+
+# Calculate extra cols:
+# eg. Service Fee, Commission paid,
+# and recalculate margin from just Sales and Commission
+
+# Service fee uses the consultant rates at that month, if none, the month
+# appropriate Default values - resolved for all rows at once (service_fee.py)
+
+
+def financial_year(date):
+    if date.month >= 7:
+        return f'{date.year}.{date.year+1}'
+    else:
+        return f'{date.year-1}.{date.year}'
+
+
+def _per_month(months, fn):
+    # fn applied once per distinct month rather than once per row
+    distinct = pd.DatetimeIndex(months.unique())
+    return months.map(dict(zip(distinct, (fn(m) for m in distinct))))
+
+
+def prepare_data(df, sf):
+    fees = calculate_fees(df, sf)
+    df['Service fee'] = fees['Service fee']
+    df['Commission paid'] = fees['Commission paid']
+    df['Month_label'] = _per_month(df['Month'],
+                                   lambda m: datetime.strftime(m, "%b %Y"))
+    df['Margin'] = fees['Margin']
+    df['Financial_year'] = _per_month(df['Month'], financial_year)
+
+    # Rounding values for ease of reading.
+    # nb. Values will be very slightly off due to rounding. Deemed acceptable
+    return compact(df.round({
+        'Gross sales': 0,
+        'Cost of sales': 0,
+        'Commission': 0,
+        'Service fee': 0,
+        'Commission paid': 0,
+        'Margin': 1
+    }))
+
+
+def compact(df):
+    # Repeated text as categoricals (integer codes plus one copy of each
+    # name/label) and metrics as float32 - plenty for values rounded as above,
+    # and totals are accumulated in float64 (metric_cube.py)
+    dtypes = {col: 'category' for col in text_cols}
+    dtypes.update({col: np.float32 for col in metric_cols})
+    return df.astype(dtypes)
+
+
+def read_workbook(workbook, cache_dir, timer):
+    # Read in data - from the columnar cache if the workbook hasn't changed
+    with timer.phase('load cache'):
+        cached = data_cache.load(workbook, cache_dir, CACHE_VERSION)
+    if cached:
+        return cached['df'], cached['sf']
+
+    # Streamed a chunk at a time, derived columns added as it's read
+    reader = WorkbookReader(workbook)
+    df, sf = reader.read(prepare_data, timer)
+    print(reader.report())
+    with timer.phase('write cache'):
+        data_cache.save(workbook, cache_dir, {'df': df, 'sf': sf},
+                        CACHE_VERSION)
+    return df, sf
+
+
+class DashboardData(DataSource):
+
+    def __init__(self, df, sf, timer=None, source_id=None):
+        timer = timer or PhaseTimer()
+        self.df = sort_rows(df)
+        self.sf = sf
+        self.source_id = source_id  # eg. hash of the workbook loaded
+
+        # Month x Consultant x Metric arrays with running totals - the one
+        # wide copy of the data, used for month range totals/Top 5 behind the
+        # slider and the month/12 month views (metric_cube.py)
+        self.cube = MetricCube(df, metric_cols)
+        # Each consultant's (and consultant/financial year's) rows, for the
+        # individual history views (row_index.py)
+        self.rows = RowIndex(self.df)
+        # Year/financial year/quarter totals per consultant (rollups.py)
+        self.rollups = Rollups(self.cube)
+
+        self._set_months(self.cube.months, self.cube.consultants)
+        self._derive_recent()
+        timer.lap('pivots')
+
+    def with_rows(self, df, sf, changed, source_id=None):
+        # Data after a reload that only added (or recalculated) the rows in
+        # `changed` - only those rows are added to the cube, the rest is reused
+        data = object.__new__(DashboardData)
+        data.df = sort_rows(df)
+        data.sf = sf
+        data.source_id = source_id
+        data.cube = self.cube.updated(changed)
+        data.rows = RowIndex(data.df)
+        data.rollups = Rollups(data.cube)
+        data._set_months(data.cube.months, data.cube.consultants)
+        data._derive_recent()
+        return data
+
+    @property
+    def cache_token(self):
+        # Identifies the data in cache keys - the same workbook gives the same
+        # token in every process, so results can be shared between workers
+        if self.source_id:
+            return f'{self.source_id}:{CACHE_VERSION}'
+        return str(id(self))
+
+    def _derive_recent(self):
+        df = self.df
+        self.in_date_overall_margin = round(
+            100 * df['Commission'].sum() / df['Gross sales'].sum(), 1)
+
+        # initially show the month leader
+        self.month_leader = self.cube.leader('Gross sales', -1)
+
+    # Queries, see data_source.py
+
+    def range_frame(self, metric, month_start, month_end, consultants=None):
+        return self.cube.frame(metric, self.cube.period(month_start, month_end),
+                               consultants)
+
+    def range_totals(self, metric, month_start, month_end):
+        return self.cube.totals(metric, self.cube.period(month_start,
+                                                         month_end))
+
+    def top_n(self, metric, month_start, month_end, n=5):
+        return self.cube.top_n(metric, self.cube.period(month_start,
+                                                        month_end), n)
+
+    def month_values(self, metric, month):
+        m = self.months_dt.index(month)
+        return self.cube.frame(metric, slice(m, m + 1)).iloc[0]
+
+    def history(self, name, month_start=None, month_end=None):
+        rows = self.rows.consultant(name, month_start, month_end)
+        return self.df.iloc[rows].set_index('Month_label')
+
+    def financial_year_history(self, name, fin_year):
+        rows = self.rows.financial_year(name, fin_year)
+        return self.df.iloc[rows].set_index('Month_label')
+
+    def period_totals(self, kind, label, metrics=None):
+        return self.rollups.table(kind, label, metrics)
+
+    def memory_report(self):
+        return {
+            'df': int(self.df.memory_usage(deep=True).sum()),
+            'sf': int(self.sf.memory_usage(deep=True).sum()),
+            'cube': self.cube.nbytes,
+        }
+
+    @classmethod
+    def load(cls, workbook, cache_dir, timer=None):
+        timer = timer or PhaseTimer()
+        df, sf = read_workbook(workbook, cache_dir, timer)
+        # (the cache may not have been written)
+        source_id = (data_cache.cached_hash(cache_dir)
+                     or data_cache.file_hash(workbook))
+        return cls(df, sf, timer, source_id=source_id)
+
+
+class DataState:
+    # The app's current data, filled in by a background thread
+
+    def __init__(self):
+        self.data = None
+        self.figures = None
+        self.error = None
+        self.timer = PhaseTimer()
+        self.loaded = threading.Event()  # data available to callbacks
+        self.ready = threading.Event()  # ... and initial figures warmed up
+
+    def set(self, data):
+        self.data = data
+        self.loaded.set()
+
+    def fail(self, error):
+        self.error = error
+        self.loaded.set()
+        self.ready.set()
+
+    def get(self, timeout=30):
+        # Callbacks fired before loading ends wait briefly, then skip
+        if not self.loaded.wait(timeout) or self.data is None:
+            raise PreventUpdate
+        return self.data
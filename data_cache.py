@@ -0,0 +1,172 @@
+# Columnar on-disk cache of the parsed (and enriched) workbook
+#
+# Parsing the xlsx is the slowest part of starting up, so after the first
+# parse each DataFrame is written as one .npy file per column, which later
+# starts read straight back into arrays. Text columns are stored as integer
+# codes plus a list of their values, and categoricals load back as
+# categoricals.
+#
+# Everything is written under <cache_dir>/data, which the cache owns - the
+# rest of cache_dir (eg. a result store) is left alone. Each save writes a
+# new frames_* directory and then swaps in a manifest pointing at it, so a
+# half-written cache is never read, and the frames the old manifest pointed
+# at are removed.
+#
+# The cache is best effort: if it can't be written (eg. a read-only
+# directory) the data is used uncached, and when several workers start at
+# once whichever swaps its manifest in last wins.
+#
+# The cache is keyed on the workbook: if its size/mtime have changed, its
+# content hash is checked, and a changed workbook means a cache miss so the
+# caller falls back to reading the xlsx again.
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+
+FORMAT_VERSION = 2
+DATA_DIR = 'data'
+MANIFEST = 'manifest.json'
+
+
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 ** 2), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _source_stat(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _data_dir(cache_dir):
+    return os.path.join(cache_dir, DATA_DIR)
+
+
+def _read_manifest(cache_dir):
+    try:
+        with open(os.path.join(_data_dir(cache_dir), MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _is_current(manifest, source, version):
+    if manifest is None or manifest.get('format') != FORMAT_VERSION \
+            or manifest.get('version') != version:
+        return False
+    stat = _source_stat(source)
+    if manifest['source'] == stat:
+        return True
+    # Touched but possibly unchanged (eg. copied/saved again) - check content
+    return manifest['sha1'] == file_hash(source)
+
+
+def _save_frame(df, frame_dir):
+    os.makedirs(frame_dir)
+    columns = []
+    for n, col in enumerate(df.columns):
+        values = df[col]
+        file_name = f'{n}.npy'
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            np.save(os.path.join(frame_dir, file_name),
+                    values.cat.codes.values.astype(np.int32))
+            columns.append({'name': col, 'file': file_name,
+                            'kind': 'category',
+                            'categories': [str(c) for c in
+                                           values.cat.categories]})
+        elif values.dtype.kind in 'biufcM':
+            if values.dtype.kind == 'M':
+                values = values.astype('datetime64[ns]')
+            np.save(os.path.join(frame_dir, file_name), values.values)
+            columns.append({'name': col, 'file': file_name, 'kind': 'array'})
+        else:
+            codes, uniques = pd.factorize(values)
+            np.save(os.path.join(frame_dir, file_name),
+                    codes.astype(np.int32))
+            columns.append({'name': col, 'file': file_name, 'kind': 'codes',
+                            'categories': [str(u) for u in uniques]})
+    return columns
+
+
+def _load_frame(frame_dir, columns):
+    data = {}
+    for col in columns:
+        values = np.load(os.path.join(frame_dir, col['file']))
+        if col['kind'] == 'codes':
+            # Missing values are stored as code -1, ie. the trailing None
+            categories = np.array(col['categories'] + [None], dtype=object)
+            values = categories[values]
+        elif col['kind'] == 'category':
+            values = pd.Categorical.from_codes(values, col['categories'])
+        data[col['name']] = values
+    return pd.DataFrame(data, columns=[col['name'] for col in columns])
+
+
+def cached_hash(cache_dir):
+    # Content hash of the workbook the cache was written from
+    manifest = _read_manifest(cache_dir)
+    return manifest['sha1'] if manifest else None
+
+
+def load(source, cache_dir, version=1):
+    # Returns {name: DataFrame} if the cache matches the source, else None
+    manifest = _read_manifest(cache_dir)
+    if not _is_current(manifest, source, version):
+        return None
+    frames_dir = os.path.join(_data_dir(cache_dir), manifest['dir'])
+    try:
+        return {name: _load_frame(os.path.join(frames_dir, name), columns)
+                for name, columns in manifest['frames'].items()}
+    except (OSError, ValueError, KeyError):
+        return None  # incomplete/corrupt cache, treat as a miss
+
+
+def save(source, cache_dir, frames, version=1):
+    # Returns False if the cache couldn't be written
+    data_dir = _data_dir(cache_dir)
+    try:
+        os.makedirs(data_dir, exist_ok=True)
+        frames_dir = tempfile.mkdtemp(dir=data_dir, prefix='frames_')
+    except OSError as e:
+        print(f'Not caching {source}: {e}')
+        return False
+    tmp_manifest = None
+    try:
+        manifest = {
+            'format': FORMAT_VERSION,
+            'version': version,
+            'source': _source_stat(source),
+            'sha1': file_hash(source),
+            'dir': os.path.basename(frames_dir),
+            'frames': {name: _save_frame(df, os.path.join(frames_dir, name))
+                       for name, df in frames.items()},
+        }
+        fd, tmp_manifest = tempfile.mkstemp(dir=data_dir,
+                                            prefix='.tmp_manifest_')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f)
+        old = _read_manifest(cache_dir)
+        os.replace(tmp_manifest, os.path.join(data_dir, MANIFEST))
+    except BaseException as e:
+        shutil.rmtree(frames_dir, ignore_errors=True)
+        if tmp_manifest and os.path.exists(tmp_manifest):
+            os.remove(tmp_manifest)
+        if not isinstance(e, OSError):
+            raise
+        print(f'Not caching {source}: {e}')
+        return False
+    # Workers still reading the old frames see a miss and read the xlsx
+    if old and old.get('dir') not in (None, manifest['dir']):
+        shutil.rmtree(os.path.join(data_dir, os.path.basename(old['dir'])),
+                      ignore_errors=True)
+    return True
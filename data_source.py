@@ -0,0 +1,75 @@
+# What the callbacks need from the data, whichever backend holds it
+#
+# DashboardData (dashboard_data.py) holds everything in memory, read from
+# the workbook. SQLiteData (sql_source.py) queries an embedded SQLite file
+# imported from the workbook, for histories too large to keep in every
+# worker. Month ranges are inclusive (first, last) month datetimes.
+
+from abc import ABC, abstractmethod
+
+import pandas as pd
+
+from rollups import period_labels
+
+
+class DataSource(ABC):
+
+    def _set_months(self, months, consultants):
+        # Lists for the layout, from the distinct months (sorted datetime64)
+        month_index = pd.DatetimeIndex(months)
+        self.months = list(month_index.strftime('%b %Y'))  # month labels
+        self.months_dt = list(months)  # month datetimes
+        self.num_of_months = len(self.months)
+        labels = period_labels(months)
+        self.years = pd.unique(labels['year'])
+        self.fin_years = pd.unique(labels['financial_year'])
+        self.consultants = consultants
+        # 12 months shown by default
+        self.recent = (self.months_dt[-12], self.months_dt[-1])
+
+    @property
+    def version(self):
+        # Data version the page polls for - from the workbook's content, so
+        # every worker (even one started since) gives the page the same one
+        return self.source_id or f'process:{id(self)}'
+
+    @abstractmethod
+    def range_frame(self, metric, month_start, month_end, consultants=None):
+        # Month x Consultant frame of one metric, as pivot_table would give -
+        # for consultants with data in the range, or those given (in order)
+        pass
+
+    @abstractmethod
+    def range_totals(self, metric, month_start, month_end):
+        # Series of totals per consultant with data in the range
+        pass
+
+    @abstractmethod
+    def top_n(self, metric, month_start, month_end, n=5):
+        # Names of the n largest totals in the range, largest first
+        pass
+
+    @abstractmethod
+    def month_values(self, metric, month):
+        # Series of one month's values per consultant with data
+        pass
+
+    @abstractmethod
+    def history(self, name, month_start=None, month_end=None):
+        # Consultant's rows in month order, indexed by Month_label
+        pass
+
+    @abstractmethod
+    def financial_year_history(self, name, fin_year):
+        pass
+
+    @abstractmethod
+    def period_totals(self, kind, label, metrics=None):
+        # Consultant x Metric totals for a year/financial_year/quarter (see
+        # rollups.py), consultants with data in it only
+        pass
+
+    @abstractmethod
+    def memory_report(self):
+        # Bytes held per structure
+        pass
@@ -0,0 +1,248 @@
+# Static export of every dashboard view - the offline monthly pack
+#
+# Enumerates the inputs of the graph callbacks: every metric/month for the
+# gr3 pies, every year for gr5, every consultant/metric for gr7, and over
+# the latest 12 months each gr1 metric (all and Top 5) and each consultant's
+# history. Views are rendered on a process pool - each worker loads the data
+# once, from the data cache (or SQLite file) the parent has just filled -
+# and written as figure JSON and standalone HTML, with an index page.
+#
+# manifest.json keeps a hash of the data each view reads, so a later export
+# only renders views whose data has changed (eg. the new month's pies), and
+# deletes views that no longer exist.
+#
+# Usage:
+#   python export.py <out_dir> [--workbook ...] [--data-source sqlite:///...]
+#       [--workers 4] [--force]
+
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import plotly.io
+import plotly.offline
+
+import DashboardDemo as demo
+from dashboard_data import (cols_to_graph_1, cols_to_graph_6,
+                            cols_to_graph_7, max_prev_years)
+from figure_cache import figure_json
+from timings import PhaseTimer
+
+
+EXPORT_VERSION = 1  # bump when the figures change, to render them all again
+MANIFEST = 'manifest.json'
+PLOTLY_JS = 'plotly.min.js'
+
+SECTIONS = {
+    'gr1': 'Last 12 months',
+    'gr6': 'Consultant history - last 12 months',
+    'gr3': 'Month breakdown',
+    'gr5': 'Year to date',
+    'gr7': 'Consultant comparison by financial year',
+}
+
+
+def slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', str(text).lower()).strip('-')
+
+
+def _canonical(part):
+    # The same values whichever source read them - float32 or float64,
+    # categorical or object
+    frame = pd.DataFrame(part).copy()
+    for col in frame.columns:
+        if isinstance(frame[col].dtype, pd.CategoricalDtype):
+            frame[col] = frame[col].astype(object)
+        elif pd.api.types.is_float_dtype(frame[col]):
+            frame[col] = frame[col].astype('float64')
+    if isinstance(frame.index.dtype, pd.CategoricalDtype):
+        frame.index = frame.index.astype(object)
+    return frame
+
+
+def digest(*parts):
+    # Hash of a view's inputs and the data it reads
+    sha1 = hashlib.sha1(repr(EXPORT_VERSION).encode())
+    for part in parts:
+        if isinstance(part, (pd.DataFrame, pd.Series)):
+            frame = _canonical(part)
+            sha1.update(repr(list(frame.columns)).encode())
+            sha1.update(pd.util.hash_pandas_object(frame).values.tobytes())
+        else:
+            sha1.update(repr(part).encode())
+    return sha1.hexdigest()
+
+
+def views(data):
+    # (section, name, callback, arguments after the data, digest)
+    n = data.num_of_months
+    months_selected = [max(0, n - 12), n - 1]  # the slider's default
+    recent = data.recent
+    for metric in cols_to_graph_1:
+        frame = data.range_frame(metric, *recent)
+        for top5 in ([], ['top5']):
+            yield ('gr1', metric + (' - Top 5' if top5 else ''),
+                   'update_graph1', (metric, top5, None, months_selected),
+                   digest(metric, top5, frame))
+    for name in data.consultants:
+        yield ('gr6', name, 'update_graph1',
+               (cols_to_graph_1[0], [], name, months_selected),
+               digest(name, data.history(name, *recent)[cols_to_graph_6]))
+    for month, month_dt in zip(data.months, data.months_dt):
+        for metric in cols_to_graph_1:
+            yield ('gr3', f'{metric} - {month}', 'update_graph3',
+                   (metric, month),
+                   digest(metric, month, data.month_values(metric, month_dt)))
+    for year in data.years:
+        yield ('gr5', year, 'update_graph5', (year,),
+               digest(year, data.period_totals('year', str(year))))
+    fin_years = list(data.fin_years[:-max_prev_years-1:-1])
+    for name in data.consultants:
+        history = [data.financial_year_history(name, fyr)
+                   for fyr in fin_years]
+        for metric in cols_to_graph_7:
+            yield ('gr7', f'{name} - {metric}', 'update_graph7',
+                   (name, metric),
+                   digest(name, metric, fin_years,
+                          *[df[['Month', metric]] for df in history]))
+
+
+# Worker processes - the data is loaded once per worker
+_data = None
+
+
+def _start_worker(config):
+    global _data
+    _data = demo.load_data(config, PhaseTimer())
+
+
+def _render(task):
+    out_dir, path, callback, args = task
+    fig = getattr(demo, callback)(_data, *args)
+    if callback == 'update_graph1':
+        fig = fig[0]['figure']
+    with open(os.path.join(out_dir, path + '.json'), 'w') as f:
+        f.write(figure_json(fig))
+    plotly.io.write_html(
+        fig, os.path.join(out_dir, path + '.html'), validate=False,
+        include_plotlyjs=os.path.relpath(
+            os.path.join(out_dir, PLOTLY_JS),
+            os.path.dirname(os.path.join(out_dir, path))))
+    return path
+
+
+def _read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != EXPORT_VERSION:
+        return {}
+    return manifest['views']
+
+
+def _write_index(out_dir, entries):
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8">',
+             '<title>Dashboard Demo</title></head><body>',
+             '<h1>Dashboard Demo</h1>']
+    for section, title in SECTIONS.items():
+        links = [(path, entry['name']) for path, entry in entries.items()
+                 if entry['section'] == section]
+        if not links:
+            continue
+        parts.append(f'<h2>{html.escape(title)}</h2><ul>')
+        parts += [f'<li><a href="{html.escape(path)}.html">'
+                  f'{html.escape(str(name))}</a> '
+                  f'(<a href="{html.escape(path)}.json">json</a>)</li>'
+                  for path, name in links]
+        parts.append('</ul>')
+    parts.append('</body></html>')
+    with open(os.path.join(out_dir, 'index.html'), 'w') as f:
+        f.write('\n'.join(parts))
+
+
+def export(config, out_dir, workers=None, force=False):
+    # Returns the numbers of views rendered, unchanged and removed
+    timer = PhaseTimer()
+    data = demo.load_data(config, timer)
+
+    old = {} if force else _read_manifest(out_dir)
+    entries, tasks = {}, []
+    for section, name, callback, args, view_digest in views(data):
+        path = f'{section}/{slug(name)}'
+        while path in entries:  # names differing only in punctuation
+            path += '_'
+        entries[path] = {'section': section, 'name': name,
+                         'digest': view_digest}
+        if old.get(path, {}).get('digest') != view_digest \
+                or not os.path.exists(os.path.join(out_dir, path + '.html')):
+            tasks.append((out_dir, path, callback, args))
+    timer.lap('enumerate views')
+
+    for section in SECTIONS:
+        os.makedirs(os.path.join(out_dir, section), exist_ok=True)
+    if not os.path.exists(os.path.join(out_dir, PLOTLY_JS)):
+        with open(os.path.join(out_dir, PLOTLY_JS), 'w') as f:
+            f.write(plotly.offline.get_plotlyjs())
+
+    removed = [path for path in old if path not in entries]
+    for path in removed:
+        for ext in ('.json', '.html'):
+            try:
+                os.remove(os.path.join(out_dir, path + ext))
+            except FileNotFoundError:
+                pass
+
+    done = set()
+    try:
+        if tasks:
+            workers = workers or os.cpu_count()
+            with ProcessPoolExecutor(workers, initializer=_start_worker,
+                                     initargs=(config,)) as pool:
+                chunksize = max(1, len(tasks) // (workers * 4))
+                for path in pool.map(_render, tasks, chunksize=chunksize):
+                    done.add(path)
+        timer.lap('render')
+    finally:
+        # Views that didn't render are tried again next time
+        pending = {task[1] for task in tasks} - done
+        with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+            json.dump({'version': EXPORT_VERSION,
+                       'views': {path: entry
+                                 for path, entry in entries.items()
+                                 if path not in pending}}, f)
+    _write_index(out_dir, entries)
+    print(timer.report())
+    return len(tasks), len(entries) - len(tasks), len(removed)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export every dashboard view as static figures')
+    parser.add_argument('out_dir')
+    parser.add_argument('--workbook', default=demo.DEFAULT_CONFIG['workbook'])
+    parser.add_argument('--cache-dir',
+                        default=demo.DEFAULT_CONFIG['cache_dir'])
+    parser.add_argument('--data-source', default=None,
+                        help='eg. sqlite:///.dashboard_cache/data.db')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='processes rendering views (default: CPUs)')
+    parser.add_argument('--force', action='store_true',
+                        help='render every view, changed or not')
+    args = parser.parse_args()
+    config = dict(demo.DEFAULT_CONFIG, workbook=args.workbook,
+                  cache_dir=args.cache_dir, data_source=args.data_source)
+    rendered, unchanged, removed = export(config, args.out_dir, args.workers,
+                                          args.force)
+    print(f'{rendered} views rendered, {unchanged} unchanged, '
+          f'{removed} removed - {os.path.join(args.out_dir, "index.html")}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Figure cache for callbacks that depend only on their inputs and the data
+#
+# Figures are kept in a result store (result_store.py) - by default a
+# per-process LRU bounded by both the number of entries and their
+# (serialised) size, or a SQLite file shared by all workers on the host.
+# Keys include the data's cache_token, so once the data reloads older
+# figures are never served again - invalidate() also drops local ones.
+
+import json
+import threading
+from functools import wraps
+
+import plotly
+
+from result_store import MemoryStore
+
+
+def figure_json(fig):
+    # The figure as JSON, i.e. roughly what is sent to the browser
+    return json.dumps(fig, cls=plotly.utils.PlotlyJSONEncoder)
+
+
+def figure_size(fig):
+    return len(figure_json(fig))
+
+
+def cache_key(name, args):
+    # Inputs must have a stable repr(), and objects such as the data are
+    # keyed on their cache_token
+    return repr((name,) + tuple(getattr(a, 'cache_token', a) for a in args))
+
+
+class FigureCache:
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 ** 2):
+        self.store = MemoryStore(max_entries, max_bytes)
+        self.version = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def use_store(self, store):
+        self.store = store
+
+    def get(self, key):
+        value = self.store.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if value is not None and self.store.shared:
+            value = json.loads(value)
+        return value
+
+    def put(self, key, fig):
+        text = figure_json(fig)
+        self.store.set(key, text if self.store.shared else fig, len(text))
+
+    def invalidate(self):
+        # Call when the data reloads
+        with self._lock:
+            self.version += 1
+        if not self.store.shared:
+            self.store.clear()  # other processes may still use shared ones
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'version': self.version,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+        stats.update(self.store.stats())
+        return stats
+
+    def memoize(self, fn):
+        # Decorator for callbacks, see cache_key()
+        @wraps(fn)
+        def wrapper(*args):
+            key = cache_key(fn.__name__, args)
+            fig = self.get(key)
+            if fig is None:
+                fig = fn(*args)
+                self.put(key, fig)
+            return fig
+        return wrapper
@@ -0,0 +1,98 @@
+# Figure builders - plotly figures straight from DataFrame/NumPy arrays
+#
+# Replaces the cufflinks DataFrame.iplot(..., asFigure=True) calls, which
+# were slow to import and call, and always drew SVG traces. Line/scatter
+# figures switch to WebGL (Scattergl) once there are enough traces or points
+# for SVG to get sluggish in the browser.
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objs as go
+
+
+WEBGL_TRACES = 50  # more traces than this are drawn with WebGL
+WEBGL_POINTS = 5000  # ... as are more points than this in total
+
+# No plotly.py styling template - it would add several KB to every figure
+# sent to the browser, and the graphs were designed without one
+TEMPLATE = 'none'
+
+average_colour = 'rgb(0, 0, 200)'
+
+
+def use_webgl(num_traces, num_points):
+    return num_traces > WEBGL_TRACES or num_points > WEBGL_POINTS
+
+
+def _x_values(index):
+    # Dates as plain 'YYYY-MM-DD' - a third of the size of the full
+    # timestamps numpy datetimes serialise to
+    if isinstance(index, pd.DatetimeIndex):
+        return index.strftime('%Y-%m-%d').values
+    return np.asarray(index)  # nb. categorical labels as plain strings
+
+
+def _scatter_type(frame):
+    return (go.Scattergl if use_webgl(frame.shape[1], frame.size)
+            else go.Scatter)
+
+
+def line_figure(frame, title, keys=None):
+    # One line per column (or per column in keys), against the index
+    if keys is not None:
+        frame = frame[keys]
+    scatter = _scatter_type(frame)
+    x = _x_values(frame.index)
+    traces = [scatter(x=x, y=frame[col].values, name=str(col), mode='lines')
+              for col in frame.columns]
+    return go.Figure(data=traces,
+                     layout=go.Layout(title=title, hovermode='closest',
+                                       template=TEMPLATE))
+
+
+def margin_figure(frame, title, average, line_dash=None, showlegend=True):
+    # Margin % markers per column, with a line and label at the average
+    scatter = _scatter_type(frame)
+    x = _x_values(frame.index)
+    traces = [scatter(x=x, y=frame[col].values, name=str(col),
+                      mode='markers', marker={'size': 6, 'opacity': 0.5})
+              for col in frame.columns]
+    line = {'color': average_colour}
+    if line_dash:
+        line['dash'] = line_dash
+    layout = go.Layout(
+        title=title,
+        template=TEMPLATE,
+        hovermode='closest',
+        showlegend=showlegend,
+        yaxis={'title': '% Margin', 'range': [0, 100]},
+        shapes=[{  # add in an overall average line...
+            'type': 'line',
+            'x0': x[0], 'y0': average,
+            'x1': x[-1], 'y1': average,
+            'line': line,
+        }],
+        annotations=[{  # ... and display its value
+            'x': x[0], 'y': average,
+            'ay': 0, 'ax': -15,
+            'showarrow': True,
+            'font': {'color': average_colour},
+            'text': f'{average}%',
+        }])
+    return go.Figure(data=traces, layout=layout)
+
+
+def pie_figure(labels, values, title):
+    return go.Figure(
+        data=[go.Pie(labels=labels, values=values,
+                     textinfo='label+value+percent')],
+        layout=go.Layout(title=title, template=TEMPLATE))
+
+
+def stacked_bar_figure(frame, keys, title):
+    # One bar segment per column in keys, stacked for each index value
+    x = _x_values(frame.index)
+    traces = [go.Bar(x=x, y=frame[col].values, name=str(col)) for col in keys]
+    return go.Figure(data=traces,
+                     layout=go.Layout(title=title, barmode='stack',
+                                      template=TEMPLATE))
@@ -0,0 +1,219 @@
+# Streaming, validated read of the workbook
+#
+# The Data sheet is read with openpyxl in read-only mode a chunk of rows at
+# a time, rather than whole with pd.read_excel, and each chunk is typed
+# (datetime64 months, float64 values) and checked before the next is read.
+# A derive(chunk, sf) step can turn each chunk into its final form as it
+# goes (eg. dashboard_data.prepare_data's compact frame), so memory peaks
+# near the final size rather than at several copies of the raw sheet.
+#
+# Problems are reported up front, with their sheet and row, rather than as
+# an error in the fee calculation or NaN margins later on:
+# - missing columns
+# - months/dates that aren't dates, blank consultants
+# - values and rates that aren't numbers
+# - rows with no DEFAULT (or own) service fee rate on or before their month
+
+import time
+
+import numpy as np
+import openpyxl
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from service_fee import DEFAULT_NAME
+
+
+DATA_SHEET = 'Data'
+RATES_SHEET = 'SF_Rates'
+DATA_COLS = ['Month', 'Consultant', 'Gross sales', 'Cost of sales',
+             'Commission']
+RATES_COLS = ['Consultant', 'Date_applied', 'SF_pct', 'SF_flat']
+CHUNK_ROWS = 10000
+MAX_PROBLEMS = 20  # reading stops once this many have been found
+
+
+class WorkbookError(ValueError):
+
+    def __init__(self, problems):
+        # problems: (sheet, row or None, message)
+        self.problems = sorted(problems, key=lambda p: (p[0], p[1] or 0))
+        lines = [f'{sheet}{f" row {row}" if row else ""}: {message}'
+                 for sheet, row, message in self.problems]
+        if len(lines) >= MAX_PROBLEMS:
+            lines.append(f'(stopped reading after {MAX_PROBLEMS} problems)')
+        super().__init__('Problems in the workbook:\n  ' + '\n  '.join(lines))
+
+
+class Problems(list):
+
+    def add(self, sheet, row, message):
+        self.append((sheet, row, message))
+        if len(self) >= MAX_PROBLEMS:
+            raise WorkbookError(self)
+
+
+def _columns(rows, sheet, names):
+    # Positions of `names` in the sheet's header row
+    header = next(rows, None) or ()
+    positions = {name: i for i, name in enumerate(header) if name is not None}
+    missing = [name for name in names if name not in positions]
+    if missing:
+        raise WorkbookError([(sheet, None, f'no {", ".join(missing)} column'
+                              + ('s' if len(missing) > 1 else ''))])
+    return [positions[name] for name in names]
+
+
+def _typed(records, row_numbers, sheet, names, dates, numbers, problems):
+    # Chunk of records as a frame of explicit dtypes, problems noted
+    frame = pd.DataFrame.from_records(records, columns=names)
+
+    def check(col, bad, what):
+        k = names.index(col)
+        for i in np.flatnonzero(bad):
+            value = records[i][k]
+            problems.add(sheet, row_numbers[i], f'no {col}' if value is None
+                         else f'{col} {value!r} is not {what}')
+
+    for col in dates:
+        values = pd.to_datetime(frame[col], errors='coerce')
+        check(col, values.isna().values, 'a date')
+        frame[col] = values.astype('datetime64[ns]')
+    for col in numbers:
+        values = pd.to_numeric(frame[col], errors='coerce').astype(np.float64)
+        check(col, values.isna().values, 'a number')
+        frame[col] = values
+    for col in names:
+        if col not in dates and col not in numbers:
+            check(col, frame[col].isna().values, 'text')
+            frame[col] = frame[col].astype(str)
+    return frame
+
+
+class WorkbookReader:
+
+    def __init__(self, workbook, chunk_rows=CHUNK_ROWS):
+        self.workbook = workbook
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.seconds = 0
+
+    def _sheet_rows(self, book, sheet, names):
+        # (sheet row number, values of `names`) for each non-blank row
+        try:
+            rows = book[sheet].iter_rows(values_only=True)
+        except KeyError:
+            raise WorkbookError([(sheet, None, 'no such sheet')]) from None
+        positions = _columns(rows, sheet, names)
+        for number, row in enumerate(rows, start=2):
+            values = tuple(row[i] if i < len(row) else None
+                           for i in positions)
+            if any(value is not None for value in values):
+                yield number, values
+
+    def rates(self, book):
+        problems = Problems()
+        numbers, records = [], []
+        for number, values in self._sheet_rows(book, RATES_SHEET, RATES_COLS):
+            numbers.append(number)
+            records.append(values)
+        sf = _typed(records, numbers, RATES_SHEET, RATES_COLS,
+                    ['Date_applied'], ['SF_pct', 'SF_flat'], problems)
+        if not (sf['Consultant'] == DEFAULT_NAME).any():
+            problems.add(RATES_SHEET, None, f'no {DEFAULT_NAME} rate')
+        if problems:
+            raise WorkbookError(problems)
+        return sf
+
+    def chunks(self, book, sf):
+        # Typed, checked chunks of the Data sheet
+        problems = Problems()
+        # A row is covered from its consultant's first own rate, or the
+        # first DEFAULT rate
+        first_rate = sf.groupby('Consultant')['Date_applied'].min()
+        default_from = first_rate.get(DEFAULT_NAME, pd.NaT)
+
+        def typed(numbers, records):
+            chunk = _typed(records, numbers, DATA_SHEET, DATA_COLS, ['Month'],
+                           DATA_COLS[2:], problems)
+            months = chunk['Month'].values
+            own_from = chunk['Consultant'].map(first_rate).values
+            uncovered = ~((own_from <= months) | (months >= default_from))
+            uncovered &= ~np.isnat(months)
+            for i in np.flatnonzero(uncovered):
+                problems.add(DATA_SHEET, numbers[i],
+                             f'no {DEFAULT_NAME} service fee rate applied '
+                             f'on or before {pd.Timestamp(months[i]):%b %Y}')
+            return chunk
+
+        # Once a problem is found the rest is only checked, not yielded -
+        # later steps (derive, inserts) never see a bad chunk
+        numbers, records = [], []
+        for number, values in self._sheet_rows(book, DATA_SHEET, DATA_COLS):
+            numbers.append(number)
+            records.append(values)
+            if len(records) == self.chunk_rows:
+                chunk = typed(numbers, records)
+                if not problems:
+                    yield chunk
+                numbers, records = [], []
+        if records:
+            chunk = typed(numbers, records)
+            if not problems:
+                yield chunk
+        if problems:
+            raise WorkbookError(problems)
+
+    def open(self):
+        # For rates() and chunks() - close it when done
+        return openpyxl.load_workbook(self.workbook, read_only=True,
+                                      data_only=True)
+
+    def read(self, derive=None, timer=None):
+        # (df, sf) - each chunk of the Data sheet passed through
+        # derive(chunk, sf) as it's read, if given, then joined
+        start = time.perf_counter()
+        book = self.open()
+        try:
+            sf = self.rates(book)
+            parts = []
+            for chunk in self.chunks(book, sf):
+                self.rows += len(chunk)
+                if derive is not None:
+                    if timer:
+                        timer.lap('read excel')
+                    chunk = derive(chunk, sf)
+                    if timer:
+                        timer.lap('derived columns')
+                parts.append(chunk)
+        finally:
+            book.close()
+        df = concat_chunks(parts) if parts else pd.DataFrame(
+            columns=DATA_COLS)
+        if timer:
+            timer.lap('read excel' if derive is None else 'derived columns')
+        self.seconds = time.perf_counter() - start
+        return df, sf
+
+    def report(self):
+        rate = self.rows / self.seconds if self.seconds else 0
+        return (f'Read {self.rows} rows from {self.workbook} in '
+                f'{self.seconds:.2f}s ({rate:,.0f} rows/s)')
+
+
+def concat_chunks(chunks):
+    # Categoricals are joined with their categories combined - pd.concat
+    # would turn them back into (much larger) object columns
+    columns = {}
+    for col in chunks[0].columns:
+        parts = [chunk[col] for chunk in chunks]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[col] = union_categoricals(parts, sort_categories=True)
+        else:
+            columns[col] = np.concatenate([part.values for part in parts])
+    return pd.DataFrame(columns)
+
+
+def read_sheets(workbook, chunk_rows=CHUNK_ROWS):
+    # The raw Data and SF_Rates sheets, checked
+    return WorkbookReader(workbook, chunk_rows).read()
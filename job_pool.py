@@ -0,0 +1,103 @@
+# Worker slots for the heavy callbacks
+#
+# Dragging the month slider fires a request per step, and only the last
+# one matters. At most max_workers jobs compute at once (each on its own
+# request thread), leaving the CPU to hovers. Each page numbers its
+# requests in the order the user made them (a clientside counter), and a
+# job for a key (page session, callback) is superseded by one with a higher
+# number, whichever reaches the server first:
+# - arriving after a newer one (eg. delayed on the network): never run
+# - still waiting for a slot: never run
+# - already running: left to finish (pandas can't be interrupted), but its
+#   result is dropped, and it stops counting against max_workers so it
+#   can't hold up the latest
+# Superseded requests raise PreventUpdate, leaving the browser as it is.
+
+import itertools
+import threading
+from collections import OrderedDict
+
+from dash.exceptions import PreventUpdate
+
+
+class _Job:
+
+    def __init__(self, seq):
+        self.seq = seq
+        self.superseded = False
+        self.has_slot = False
+
+
+class JobPool:
+
+    def __init__(self, max_workers=2, max_keys=10000):
+        self.max_workers = max_workers
+        self.max_keys = max_keys
+        self._lock = threading.Condition()
+        self._seen = OrderedDict()  # key -> highest seq, least recent first
+        self._latest = {}  # key -> its waiting/running _Job
+        self._running = 0  # jobs holding a slot
+        self._arrivals = itertools.count()
+        self.submitted = 0
+        self.stale = 0  # older than a request already seen
+        self.cancelled = 0  # superseded before starting
+        self.dropped = 0  # superseded while running
+
+    def run(self, key, fn, *args, seq=None):
+        # fn(*args) once a slot is free, unless superseded first. Without a
+        # seq, the key's jobs are ordered by arrival
+        with self._lock:
+            self.submitted += 1
+            if seq is None:
+                seq = next(self._arrivals)
+            if self._seen.get(key, -1) >= seq:
+                self.stale += 1
+                raise PreventUpdate
+            self._see(key, seq)
+            if key in self._latest:
+                self._supersede(self._latest[key])
+            job = self._latest[key] = _Job(seq)
+            while not job.superseded and self._running >= self.max_workers:
+                self._lock.wait()
+            if job.superseded:
+                self.cancelled += 1
+                raise PreventUpdate
+            job.has_slot = True
+            self._running += 1
+
+        try:
+            result = fn(*args)
+        finally:
+            with self._lock:
+                self._release(job)
+                if self._latest.get(key) is job:
+                    del self._latest[key]
+                if job.superseded:
+                    self.dropped += 1
+        if job.superseded:
+            raise PreventUpdate
+        return result
+
+    def _see(self, key, seq):
+        self._seen[key] = seq
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_keys:
+            self._seen.popitem(last=False)
+
+    def _supersede(self, job):
+        job.superseded = True
+        self._release(job)
+        self._lock.notify_all()  # so it stops waiting, if it is
+
+    def _release(self, job):
+        if job.has_slot:
+            job.has_slot = False
+            self._running -= 1
+            self._lock.notify_all()
+
+    def stats(self):
+        with self._lock:
+            return {'submitted': self.submitted, 'stale': self.stale,
+                    'cancelled': self.cancelled, 'dropped': self.dropped,
+                    'in_flight': len(self._latest),
+                    'running': self._running}
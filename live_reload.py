@@ -0,0 +1,145 @@
+# Picking up workbook changes without restarting the server
+#
+# A WorkbookWatcher thread polls the workbook's size/mtime. When it changes,
+# the sheets are re-read and compared with the loaded data:
+# - new rows in Data, and existing rows affected by new SF_Rates entries,
+#   get their derived columns calculated and are merged into the loaded data
+# - anything else (edited or removed rows/rates) falls back to a full reload
+# The new data's version is the new workbook's hash, which the page polls
+# for.
+
+import copy
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from dashboard_data import DashboardData, compact, prepare_data
+from data_cache import file_hash
+from ingest import read_sheets
+
+
+KEY_COLS = ['Month', 'Consultant']
+RAW_COLS = ['Gross sales', 'Cost of sales', 'Commission']
+RATE_COLS = ['Consultant', 'Date_applied', 'SF_pct', 'SF_flat']
+
+
+def _keys(df):
+    return pd.MultiIndex.from_frame(df[KEY_COLS])
+
+
+def affected_rows(data, raw, sf):
+    # Boolean mask over `raw` of rows needing (re)calculation, or None if
+    # the change isn't a pure addition and everything should be rebuilt
+    old_rates = data.sf[RATE_COLS].merge(sf[RATE_COLS], how='left',
+                                         indicator=True)
+    if (old_rates['_merge'] == 'left_only').any():
+        return None  # a rate was edited or removed
+    new_rates = sf[RATE_COLS].merge(data.sf[RATE_COLS], how='left',
+                                    indicator=True)
+    new_rates = new_rates[new_rates['_merge'] == 'left_only']
+
+    old_keys = _keys(data.df)
+    raw_keys = _keys(raw)
+    if not old_keys.isin(raw_keys).all():
+        return None  # rows removed
+
+    is_new = ~raw_keys.isin(old_keys)
+    # Existing rows should be unchanged. nb. loaded values are rounded, so
+    # compare at that precision
+    old = data.df.set_index(KEY_COLS)[RAW_COLS]
+    kept = raw[~is_new].set_index(KEY_COLS)[RAW_COLS].round(0)
+    if not np.allclose(kept.values, old.loc[kept.index].values,
+                       equal_nan=True):
+        return None
+
+    mask = is_new.copy()
+    for _, rate in new_rates.iterrows():
+        later = raw['Month'].values >= np.datetime64(rate['Date_applied'])
+        if rate['Consultant'] == 'DEFAULT':
+            mask |= later
+        else:
+            mask |= later & (raw['Consultant'].values == rate['Consultant'])
+    return mask
+
+
+def reload_data(data, raw, sf, source_id=None):
+    # Returns (new DashboardData, number of rows recalculated)
+    mask = affected_rows(data, raw, sf)
+    if mask is None:
+        new = DashboardData(prepare_data(raw, sf), sf, source_id=source_id)
+        return new, len(raw)
+    if not mask.any():
+        # The same rows, but from the new workbook - the version must move on
+        # or pages would keep polling for it
+        same = copy.copy(data)
+        same.source_id = source_id
+        return same, 0
+
+    changed = prepare_data(raw[mask].copy(), sf)
+    kept = data.df[~_keys(data.df).isin(_keys(changed))]
+    # nb. categoricals with different categories concat as objects.
+    # with_rows() puts the rows back in consultant/month order
+    df = compact(pd.concat([kept, changed], ignore_index=True))
+    return data.with_rows(df, sf, changed, source_id), int(mask.sum())
+
+
+class WorkbookWatcher(threading.Thread):
+    # Calls on_change() whenever the workbook's size/mtime change
+
+    def __init__(self, workbook, on_change, interval=30):
+        super().__init__(daemon=True)
+        self.workbook = workbook
+        self.on_change = on_change
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._last = self._stat()
+
+    def _stat(self):
+        try:
+            stat = os.stat(self.workbook)
+        except OSError:
+            return None  # eg. mid-save, try again next time
+        return stat.st_size, stat.st_mtime_ns
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            current = self._stat()
+            if current is None or current == self._last:
+                continue
+            try:
+                self.on_change()
+                self._last = current
+            except Exception as e:
+                # Leave _last as was, so a half-written file is retried
+                print(f'Reload of {self.workbook} failed: {e}')
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def watch(state, config, on_reload=None):
+    # Start watching the workbook, swapping new data into `state`
+    def reload():
+        start = time.perf_counter()
+        source_id = file_hash(config['workbook'])
+        if isinstance(state.data, DashboardData):
+            raw, sf = read_sheets(config['workbook'])
+            data, recalculated = reload_data(state.data, raw, sf, source_id)
+        else:
+            # eg. SQLiteData - imported again from scratch
+            data, recalculated = state.data.reimport(config['workbook'],
+                                                     source_id)
+        if data is not state.data:
+            if on_reload:
+                on_reload(data)
+            state.set(data)
+        print(f'Reloaded {config["workbook"]}: {recalculated} rows '
+              f'recalculated in {time.perf_counter() - start:.2f}s')
+
+    watcher = WorkbookWatcher(config['workbook'], reload,
+                              config['reload_interval'])
+    watcher.start()
+    return watcher
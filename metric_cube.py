@@ -0,0 +1,163 @@
+# Month x Consultant x Metric cube
+#
+# Holds every metric as one dense NumPy array, with running totals along the
+# month axis, so that any month range can be totalled, ranked or sliced with
+# index arithmetic instead of filtering df and building a fresh pivot table.
+# Slider latency then depends on the size of the range shown, not the
+# length of the history.
+#
+# Values are float32 (as in df), running totals float64.
+
+import numpy as np
+import pandas as pd
+
+
+class MetricCube:
+
+    def __init__(self, df, metrics):
+        self.metrics = list(metrics)
+        self.months = np.sort(df['Month'].unique())
+        self.consultants = np.sort(np.asarray(df['Consultant'].unique()))
+        self._metric_pos = {m: k for k, m in enumerate(self.metrics)}
+
+        # Missing months for a consultant stay NaN, as in pivot_table
+        shape = (len(self.months), len(self.consultants))
+        self.values = np.full(shape + (len(self.metrics),), np.nan,
+                              dtype=np.float32)
+        self.present = np.zeros(shape, dtype=bool)
+        self._cum = np.zeros((shape[0] + 1,) + self.values.shape[1:])
+        self._cum_present = np.zeros((shape[0] + 1, shape[1]), dtype=np.int64)
+        self._fill(df)
+        self._accumulate(0)
+
+    def updated(self, rows):
+        # New cube with `rows` added or replaced. Arrays are copied, so the
+        # current cube stays valid for anything still using it, and running
+        # totals are only recalculated from the first month touched.
+        cube = object.__new__(MetricCube)
+        cube.metrics = self.metrics
+        cube._metric_pos = self._metric_pos
+        cube.months = np.union1d(self.months, rows['Month'].unique())
+        cube.consultants = np.union1d(self.consultants,
+                                      np.asarray(rows['Consultant'].unique()))
+
+        shape = (len(cube.months), len(cube.consultants))
+        old_months = len(self.months)
+        # Usual case - new months at the end for the same consultants
+        appended = (shape[1] == len(self.consultants)
+                    and (cube.months[:old_months] == self.months).all())
+
+        cube.values = np.full(shape + (len(self.metrics),), np.nan,
+                              dtype=np.float32)
+        cube.present = np.zeros(shape, dtype=bool)
+        cube._cum = np.zeros((shape[0] + 1,) + cube.values.shape[1:])
+        cube._cum_present = np.zeros((shape[0] + 1, shape[1]), dtype=np.int64)
+        if appended:
+            cube.values[:old_months] = self.values
+            cube.present[:old_months] = self.present
+            cube._cum[:old_months + 1] = self._cum
+            cube._cum_present[:old_months + 1] = self._cum_present
+        else:
+            m = np.searchsorted(cube.months, self.months)[:, None]
+            c = np.searchsorted(cube.consultants, self.consultants)
+            cube.values[m, c] = self.values
+            cube.present[m, c] = self.present
+
+        first = cube._fill(rows)
+        cube._accumulate(first if appended else 0)
+        return cube
+
+    def _fill(self, df):
+        # Write rows into the arrays, returns the first month position used
+        m = np.searchsorted(self.months, df['Month'].values)
+        c = self._consultant_positions(df['Consultant'])
+        self.values[m, c] = df[self.metrics].values
+        self.present[m, c] = True
+        return m.min() if len(m) else len(self.months)
+
+    def _consultant_positions(self, names):
+        # Categoricals are looked up once per category, not once per row
+        if isinstance(names.dtype, pd.CategoricalDtype):
+            positions = np.searchsorted(self.consultants,
+                                        np.asarray(names.cat.categories))
+            return positions[names.cat.codes.values]
+        return np.searchsorted(self.consultants, names.values)
+
+    def _accumulate(self, first):
+        # Running totals from month position `first` onwards, with a leading
+        # zero row so range [i, j] totals are cum[j + 1] - cum[i]
+        self._cum[first + 1:] = self._cum[first] + np.cumsum(
+            np.nan_to_num(self.values[first:]), axis=0, dtype=np.float64)
+        self._cum_present[first + 1:] = self._cum_present[first] + np.cumsum(
+            self.present[first:], axis=0)
+
+    @property
+    def nbytes(self):
+        return (self.values.nbytes + self.present.nbytes + self._cum.nbytes
+                + self._cum_present.nbytes + self.months.nbytes
+                + sum(len(name) for name in self.consultants))
+
+    def period(self, month_start, month_end):
+        # Inclusive date range -> slice of month positions
+        start = np.searchsorted(self.months, np.datetime64(month_start, 'ns'))
+        stop = np.searchsorted(self.months, np.datetime64(month_end, 'ns'),
+                               side='right')
+        return slice(start, stop)
+
+    def _active(self, period):
+        counts = (self._cum_present[period.stop]
+                  - self._cum_present[period.start])
+        return counts > 0
+
+    def active_consultants(self, period):
+        # Consultants with any data in the period (pivot column order)
+        return self.consultants[self._active(period)]
+
+    def totals(self, metric, period):
+        # Series of metric totals per consultant active in the period
+        k = self._metric_pos[metric]
+        sums = self._cum[period.stop, :, k] - self._cum[period.start, :, k]
+        active = self._active(period)
+        return pd.Series(sums[active], index=self.consultants[active])
+
+    def range_totals(self, starts, stops):
+        # Totals (range x consultant x metric) for month position ranges
+        # [start, stop), and whether each consultant has data in each
+        sums = self._cum[stops] - self._cum[starts]
+        active = (self._cum_present[stops] - self._cum_present[starts]) > 0
+        return sums, active
+
+    def top_n(self, metric, period, n=5):
+        # Names of the n largest totals in the period, largest first
+        totals = self.totals(metric, period)
+        sums = totals.values
+        if len(sums) > n:
+            top = np.argpartition(-sums, n - 1)[:n]
+        else:
+            top = np.arange(len(sums))
+        top = top[np.argsort(-sums[top], kind='mergesort')]
+        return totals.index[top]
+
+    def leader(self, metric, month):
+        # Consultant with the largest value in one month position
+        values = self.values[month, :, self._metric_pos[metric]]
+        return self.consultants[np.nanargmax(values)]
+
+    def frame(self, metric, period, consultants=None):
+        # Month x Consultant frame of one metric, as pivot_table would give
+        values = self.values[period, :, self._metric_pos[metric]]
+        index = pd.DatetimeIndex(self.months[period], name='Month')
+        if consultants is None:
+            cols = np.flatnonzero(self._active(period))
+            return pd.DataFrame(
+                values[:, cols], index=index,
+                columns=pd.Index(self.consultants[cols], name='Consultant'))
+        # Names not in the data get a column of NaN
+        names = np.asarray(consultants, dtype=object)
+        cols = np.searchsorted(self.consultants, names)
+        cols = np.minimum(cols, len(self.consultants) - 1)
+        known = self.consultants[cols] == names
+        data = np.full((len(index), len(names)), np.nan, dtype=values.dtype)
+        data[:, known] = values[:, cols[known]]
+        return pd.DataFrame(data, index=index,
+                            columns=pd.Index(names, name='Consultant'))
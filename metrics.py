@@ -0,0 +1,161 @@
+# Per-callback instrumentation
+#
+# Wall time (split into computing the result and Dash serialising/sending
+# it), response bytes, errors and PreventUpdates per callback, kept as
+# fixed-bucket histograms and rendered in the Prometheus text format for
+# /metrics. SamplingProfiler can be switched on for a single callback to see
+# where its time goes.
+
+import sys
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(8))  # 1KB to 16MB
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for le, n in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += n
+            yield f'{name}_bucket{{{labels},le="{le}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum!r}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class CallbackMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.compute = {}
+        self.serialize = {}
+        self.response_bytes = {}
+        self.errors = Counter()  # (callback, exception type)
+        self.prevented = Counter()
+
+    def _histogram(self, table, name, buckets):
+        if name not in table:
+            table[name] = Histogram(buckets)
+        return table[name]
+
+    def observe(self, name, compute, total=None, size=None):
+        # total/size are only known when called from a request
+        with self._lock:
+            self._histogram(self.compute, name,
+                            SECONDS_BUCKETS).observe(compute)
+            if total is not None:
+                self._histogram(self.serialize, name, SECONDS_BUCKETS
+                                ).observe(max(0, total - compute))
+            if size is not None:
+                self._histogram(self.response_bytes, name,
+                                BYTES_BUCKETS).observe(size)
+
+    def error(self, name, exc):
+        with self._lock:
+            self.errors[name, type(exc).__name__] += 1
+        print(f'{name}: {type(exc).__name__}: {exc}')
+
+    def prevent(self, name):
+        with self._lock:
+            self.prevented[name] += 1
+
+    def render(self, cache_stats=None, memory=None, counters=None):
+        # counters: {prefix: {name: value}}, eg. {'jobs': pool.stats()}
+        lines = []
+        with self._lock:
+            for metric, table, help_text in (
+                    ('dashboard_callback_compute_seconds', self.compute,
+                     'Time computing callback results'),
+                    ('dashboard_callback_serialize_seconds', self.serialize,
+                     'Request time outside the callback - serialising '
+                     'and sending the result'),
+                    ('dashboard_callback_response_bytes', self.response_bytes,
+                     'Size of callback responses')):
+                lines += [f'# HELP {metric} {help_text}',
+                          f'# TYPE {metric} histogram']
+                for name, hist in sorted(table.items()):
+                    lines += hist.lines(metric, f'callback="{name}"')
+            lines += ['# TYPE dashboard_callback_errors_total counter']
+            lines += [f'dashboard_callback_errors_total{{callback="{name}",'
+                      f'type="{exc_type}"}} {n}'
+                      for (name, exc_type), n in sorted(self.errors.items())]
+            lines += ['# TYPE dashboard_callback_prevented_total counter']
+            lines += [f'dashboard_callback_prevented_total'
+                      f'{{callback="{name}"}} {n}'
+                      for name, n in sorted(self.prevented.items())]
+        for key, value in (cache_stats or {}).items():
+            if isinstance(value, (int, float)):
+                lines.append(f'dashboard_figure_cache_{key} {value:g}')
+        for prefix, values in (counters or {}).items():
+            lines += [f'dashboard_{prefix}_{key} {value}'
+                      for key, value in values.items()]
+        if memory:
+            lines += ['# TYPE dashboard_memory_bytes gauge']
+            lines += [f'dashboard_memory_bytes{{structure="{name}"}} {n}'
+                      for name, n in memory.items()]
+        return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    # Samples the stack of a thread running the chosen callback every
+    # `interval` seconds. Stacks are kept collapsed ('outer;inner count'
+    # lines), as read by flamegraph.pl/speedscope
+
+    def __init__(self, callback, interval=0.005):
+        self.callback = callback
+        self.interval = interval
+        self.stacks = Counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def sample(self, name):
+        if name != self.callback:
+            yield
+            return
+        ident = threading.get_ident()
+        done = threading.Event()
+        thread = threading.Thread(target=self._run, args=(ident, done),
+                                  daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _run(self, ident, done):
+        while not done.wait(self.interval):
+            frame = sys._current_frames().get(ident)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} '
+                             f'({code.co_filename}:{frame.f_lineno})')
+                frame = frame.f_back
+            with self._lock:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        with self._lock:
+            return ''.join(f'{stack} {n}\n'
+                           for stack, n in self.stacks.most_common())
+
+
+callback_metrics = CallbackMetrics()
+
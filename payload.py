@@ -0,0 +1,190 @@
+# Shrinking figures before they're sent to the browser
+#
+# Applied to the long time series callbacks (gr1, gr2, gr7):
+# - values are quantized to the precision shown (df is already rounded), so
+#   whole numbers go out as 1234 rather than 1234.0
+# - leading/trailing gaps of each trace are dropped - nothing is drawn there
+# - if the figure is still over its byte budget, traces are downsampled to
+#   the number of points the budget allows (from the bytes per point of the
+#   full figure) by keeping each bucket's lowest and highest point, so peaks
+#   and troughs survive, and a gap in a bucket stays a gap
+#
+# Sizes after are recorded per callback in payload_stats, and sizes before
+# on one call in PAYLOAD_SAMPLE_EVERY - measuring them means serialising the
+# whole figure again.
+
+import threading
+from functools import wraps
+
+import numpy as np
+
+from figure_cache import figure_json
+
+
+DEFAULT_BUDGET = 512 * 1024  # bytes per figure
+MIN_POINTS = 24  # never downsample a trace below this
+PAYLOAD_SAMPLE_EVERY = 20
+
+
+def _as_dict(fig):
+    # go.Figure -> plain dict, which is cheaper to modify
+    if hasattr(fig, 'to_plotly_json'):
+        fig = fig.to_plotly_json()
+    return {'data': [dict(trace) for trace in fig.get('data', [])],
+            'layout': fig.get('layout', {})}
+
+
+def quantize(values, decimals):
+    # List of values rounded to `decimals`, NaN as None (JSON null)
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    missing = np.isnan(values)
+    if decimals <= 0:
+        out = values.astype(np.int64).tolist() if not missing.any() else [
+            None if m else int(v) for v, m in zip(values, missing)]
+    else:
+        out = values.tolist()
+        for i in np.flatnonzero(missing):
+            out[i] = None
+    return out
+
+
+def min_max_points(y, max_points):
+    # Sorted indices of at most max_points points of y: the lowest and
+    # highest of each bucket, plus a missing value in any bucket that has
+    # one (so the line still breaks there)
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(1, max_points // (3 if np.isnan(y).any() else 2))
+    size = -(-n // buckets)
+    buckets = -(-n // size)  # so only the last bucket is padded
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    rows = padded.reshape(buckets, size)
+    missing = np.isnan(rows)
+    missing[-1, n - (buckets - 1) * size:] = False  # padding isn't a gap
+    offsets = np.arange(buckets) * size
+    has_value = ~np.isnan(rows).all(axis=1)
+    low = np.argmin(np.where(np.isnan(rows), np.inf, rows), axis=1)
+    high = np.argmax(np.where(np.isnan(rows), -np.inf, rows), axis=1)
+    gap = np.argmax(missing, axis=1)
+    keep = np.concatenate([(offsets + low)[has_value],
+                           (offsets + high)[has_value],
+                           (offsets + gap)[missing.any(axis=1)]])
+    return np.unique(keep)
+
+
+def _trim(trace):
+    # Drop leading/trailing points with no value
+    y = np.asarray(trace['y'], dtype=float)
+    valid = np.flatnonzero(~np.isnan(y))
+    if len(valid) == 0 or (valid[0] == 0 and valid[-1] == len(y) - 1):
+        trace['y'] = y
+        return
+    keep = slice(valid[0], valid[-1] + 1)
+    trace['y'] = y[keep]
+    trace['x'] = np.asarray(trace['x'])[keep]
+
+
+def reduce_figure(fig, decimals=0, budget=DEFAULT_BUDGET):
+    # (fig, its JSON) - serialised once if it's within budget, else twice
+    fig = _as_dict(fig)
+    traces = [t for t in fig['data'] if 'y' in t and 'x' in t]
+    for trace in traces:
+        _trim(trace)
+    full = [trace['y'] for trace in traces]
+    for trace in traces:
+        trace['y'] = quantize(trace['y'], decimals)
+    text = figure_json(fig)
+    points = sum(len(y) for y in full)
+    longest = max([len(y) for y in full] or [0])
+    if len(text) <= budget or longest <= MIN_POINTS:
+        return fig, text
+
+    # Bytes are near enough proportional to points, less what the layout
+    # and trace settings take
+    fixed = len(figure_json({
+        'data': [dict(t, x=[], y=[]) if 'y' in t and 'x' in t else t
+                 for t in fig['data']],
+        'layout': fig['layout']}))
+    ratio = max(0, budget - fixed) / max(1, len(text) - fixed)
+    max_points = max(MIN_POINTS, int(longest * ratio))
+    for trace, y in zip(traces, full):
+        keep = min_max_points(y, max_points)
+        if len(keep) < len(y):
+            trace['y'] = quantize(y[keep], decimals)
+            trace['x'] = np.asarray(trace['x'])[keep]
+    return fig, figure_json(fig)
+
+
+class PayloadStats:
+    # Bytes after reduction per callback, and before/after on the sampled
+    # calls - one in `sample_every`, starting with the first
+
+    def __init__(self, sample_every=PAYLOAD_SAMPLE_EVERY):
+        self.sample_every = sample_every
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def _stats(self, name):
+        return self.calls.setdefault(name, {
+            'calls': 0, 'bytes_after': 0,
+            'sampled': 0, 'sampled_before': 0, 'sampled_after': 0})
+
+    def sample(self, name):
+        # Whether to measure this call's size before
+        with self._lock:
+            return self._stats(name)['calls'] % self.sample_every == 0
+
+    def record(self, name, after, before=None):
+        with self._lock:
+            stats = self._stats(name)
+            stats['calls'] += 1
+            stats['bytes_after'] += after
+            if before is not None:
+                stats['sampled'] += 1
+                stats['sampled_before'] += before
+                stats['sampled_after'] += after
+
+    def summary(self):
+        with self._lock:
+            return {name: dict(stats, saved_per_call=(
+                        (stats['sampled_before'] - stats['sampled_after'])
+                        // stats['sampled'] if stats['sampled'] else None))
+                    for name, stats in self.calls.items()}
+
+
+payload_stats = PayloadStats()
+
+
+def reduce_payload(decimals=0, budget=DEFAULT_BUDGET, key=None):
+    # Decorator for callbacks returning a figure - or a dict/tuple holding
+    # one at `key` (eg. key=(0, 'figure') for update_graph1)
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args):
+            result = fn(*args)
+            fig = result
+            for part in key or ():
+                fig = fig[part]
+            before = None
+            if payload_stats.sample(fn.__name__):
+                before = len(figure_json(fig))
+            fig, text = reduce_figure(fig, decimals, budget)
+            payload_stats.record(fn.__name__, len(text), before)
+            return _replace(result, key, fig)
+        return wrapper
+    return decorator
+
+
+def _replace(result, key, fig):
+    if not key:
+        return fig
+    head, rest = key[0], key[1:]
+    if isinstance(result, tuple):
+        result = list(result)
+        result[head] = _replace(result[head], rest, fig)
+        return tuple(result)
+    result = dict(result)
+    result[head] = _replace(result[head], rest, fig)
+    return result
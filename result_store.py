@@ -0,0 +1,142 @@
+# Stores for computed results (figures), shared or per-process
+#
+# MemoryStore is private to one process. SQLiteStore is a single file any
+# number of worker processes on the host can share, so a figure computed by
+# one gunicorn worker is served by the others. Both evict the least recently
+# used entries past a size limit.
+#
+# Values are stored as JSON text; keys are strings.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from sqlite_local import ThreadConnections
+
+
+class MemoryStore:
+    shared = False
+
+    def __init__(self, max_entries=256, max_bytes=64 * 1024 ** 2):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value, _ = self._entries[key]
+            except KeyError:
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return  # never worth evicting everything for
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                _, (_, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes,
+                    'evictions': self.evictions}
+
+
+class SQLiteStore:
+    shared = True
+
+    def __init__(self, path, max_bytes=256 * 1024 ** 2):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conns = ThreadConnections(self._connect)
+        self.evictions = 0
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conns.get()
+
+    def _connect(self):
+        # The table is (re)created with each connection, in case the file
+        # was removed meanwhile
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')  # readers don't block
+        conn.execute('CREATE TABLE IF NOT EXISTS results ('
+                     'key TEXT PRIMARY KEY, value TEXT, size INTEGER, '
+                     'accessed REAL)')
+        conn.execute('CREATE INDEX IF NOT EXISTS results_accessed '
+                     'ON results (accessed)')
+        return conn
+
+    def get(self, key):
+        # A store that can't be read (eg. locked past the timeout) is a miss
+        conn = self._conns.get()
+        try:
+            row = conn.execute('SELECT value FROM results WHERE key = ?',
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE results SET accessed = ? WHERE key = ?',
+                         (time.time(), key))
+        except sqlite3.OperationalError:
+            return None
+        return row[0]
+
+    def set(self, key, value, size):
+        if size > self.max_bytes:
+            return
+        try:
+            self._set(key, value, size)
+        except sqlite3.OperationalError:
+            pass  # not stored - computed again next time
+
+    def _set(self, key, value, size):
+        conn = self._conns.get()
+        conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                     (key, value, size, time.time()))
+        total, = conn.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM results').fetchone()
+        while total > self.max_bytes:
+            oldest = conn.execute(
+                'SELECT key, size FROM results ORDER BY accessed LIMIT 1'
+            ).fetchone()
+            if oldest is None:
+                break  # another worker has just emptied it
+            conn.execute('DELETE FROM results WHERE key = ?', (oldest[0],))
+            total -= oldest[1]
+            self.evictions += 1
+
+    def clear(self):
+        self._conns.get().execute('DELETE FROM results')
+
+    def stats(self):
+        entries, total = self._conns.get().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results').fetchone()
+        return {'entries': entries, 'bytes': total,
+                'evictions': self.evictions}
+
+
+def make_store(url, max_entries=256, max_bytes=64 * 1024 ** 2):
+    # None/'memory' for a per-process store, 'sqlite:///path/to/file.db'
+    # for one shared between processes on this host
+    if not url or url == 'memory':
+        return MemoryStore(max_entries, max_bytes)
+    if url.startswith('sqlite:///'):
+        return SQLiteStore(url[len('sqlite:///'):], max_bytes)
+    raise ValueError(f'Unknown result store: {url}')
@@ -0,0 +1,79 @@
+# Consultant totals per calendar year, financial year and quarter
+#
+# Built from the cube's running totals - each period is a contiguous run of
+# months, so its totals are one subtraction per period rather than a
+# filter and pivot_table over every row. Rebuilt with the cube on reload.
+
+import numpy as np
+import pandas as pd
+
+from row_index import runs
+
+KINDS = ('year', 'financial_year', 'quarter')
+
+
+def period_labels(months):
+    # Label of each month (datetime64 array) for every kind of period.
+    # Financial years start in July, as in dashboard_data.financial_year
+    years = months.astype('datetime64[Y]').astype(np.int64) + 1970
+    month_num = months.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    fin_start = years - (month_num < 7)
+    return {
+        'year': np.array([str(y) for y in years], dtype=object),
+        'financial_year': np.array([f'{y}.{y + 1}' for y in fin_start],
+                                   dtype=object),
+        'quarter': np.array([f'{y} Q{(m - 1) // 3 + 1}'
+                             for y, m in zip(years, month_num)],
+                            dtype=object),
+    }
+
+
+def period_bounds(kind, label):
+    # First and last day of a period, from its label
+    if kind == 'year':
+        return pd.Timestamp(f'{label}-01-01'), pd.Timestamp(f'{label}-12-31')
+    if kind == 'financial_year':
+        first = int(label.split('.')[0])
+        return (pd.Timestamp(f'{first}-07-01'),
+                pd.Timestamp(f'{first + 1}-06-30'))
+    year, quarter = label.split(' Q')
+    start = pd.Timestamp(f'{year}-{3 * int(quarter) - 2:02d}-01')
+    return start, start + pd.offsets.QuarterEnd()
+
+
+def add_margin(frame):
+    # Margin recalculated from totals, as calculate_fees does per row
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frame['Margin'] = np.where(
+            frame['Gross sales'] == 0, np.nan,
+            (100 * frame['Commission'] / frame['Gross sales']).round(1))
+    return frame
+
+
+class Rollups:
+
+    def __init__(self, cube):
+        self.consultants = cube.consultants
+        self.metrics = [m for m in cube.metrics if m != 'Margin']
+        positions = [cube.metrics.index(m) for m in self.metrics]
+        self._tables = {}
+        for kind, labels in period_labels(cube.months).items():
+            starts, stops = runs(labels)
+            sums, active = cube.range_totals(starts, stops)
+            self._tables[kind] = (list(labels[starts]),
+                                  sums[:, :, positions], active)
+
+    def labels(self, kind):
+        # Periods with data, oldest first
+        return self._tables[kind][0]
+
+    def table(self, kind, label, metrics=None):
+        # Consultant x Metric totals for one period, consultants with data
+        # in it only. Margin is recalculated from the totals
+        labels, sums, active = self._tables[kind]
+        p = labels.index(label)
+        frame = pd.DataFrame(
+            sums[p][active[p]],
+            index=pd.Index(self.consultants[active[p]], name='Consultant'),
+            columns=self.metrics)
+        return add_margin(frame)[metrics or self.metrics + ['Margin']]
@@ -0,0 +1,65 @@
+# Row slices per consultant
+#
+# With df sorted by consultant then month (sort_rows), each consultant's
+# rows - and each consultant's rows in a financial year - are contiguous, so
+# an individual's history is a slice found by dictionary lookup (plus a
+# binary search for a month range) rather than a scan of every row.
+
+import numpy as np
+import pandas as pd
+
+
+def sort_rows(df):
+    return (df.sort_values(['Consultant', 'Month'], kind='mergesort')
+            .reset_index(drop=True))
+
+
+def runs(codes):
+    # Start/stop positions of each run of equal values
+    starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) \
+        if len(codes) else np.array([], dtype=np.int64)
+    stops = np.r_[starts[1:], len(codes)]
+    return starts, stops
+
+
+class RowIndex:
+
+    def __init__(self, df):
+        # df as returned by sort_rows()
+        self._months = df['Month'].values
+        consultant_codes, consultants = pd.factorize(df['Consultant'])
+        year_codes, years = pd.factorize(df['Financial_year'])
+
+        starts, stops = runs(consultant_codes)
+        self._consultant = {
+            consultants[consultant_codes[start]]: slice(start, stop)
+            for start, stop in zip(starts, stops)}
+
+        # Consultant changes also end a run, for consultants with one year
+        pair_codes = consultant_codes.astype(np.int64) * len(years) \
+            + year_codes
+        starts, stops = runs(pair_codes)
+        self._year = {
+            (consultants[consultant_codes[start]], years[year_codes[start]]):
+                slice(start, stop)
+            for start, stop in zip(starts, stops)}
+
+    def consultant(self, name, month_start=None, month_end=None):
+        # Slice of the consultant's rows, optionally within an inclusive
+        # month range. Empty for unknown consultants
+        rows = self._consultant.get(name, slice(0, 0))
+        if month_start is None and month_end is None:
+            return rows
+        months = self._months[rows]
+        start = rows.start
+        if month_start is not None:
+            start += np.searchsorted(months,
+                                     np.datetime64(month_start, 'ns'))
+        stop = rows.stop
+        if month_end is not None:
+            stop = rows.start + np.searchsorted(
+                months, np.datetime64(month_end, 'ns'), side='right')
+        return slice(int(start), int(stop))
+
+    def financial_year(self, name, fin_year):
+        return self._year.get((name, fin_year), slice(0, 0))
@@ -0,0 +1,74 @@
+# Service fee engine
+#
+# Resolves the SF_Rates table against every row of the Data sheet in one
+# batched pass, rather than filtering the whole rates table once per row.
+#
+# Rules (unchanged from the original per-row lookup):
+# - a consultant uses their own most recent rate applied on/before the month
+# - if they have no rate yet, the most recent DEFAULT rate is used instead
+# - Service fee = SF_flat + SF_pct% of Commission
+#
+# nb. rates sharing the same Date_applied resolve to the later sheet row,
+# matching the old `.iloc[-1]` on a date-ordered SF_Rates sheet.
+
+import numpy as np
+import pandas as pd
+
+
+DEFAULT_NAME = 'DEFAULT'
+RATE_COLS = ['SF_pct', 'SF_flat']
+
+
+def resolve_rates(df, sf):
+    # Returns a frame of SF_pct/SF_flat aligned to df.index
+    rates = (sf[['Consultant', 'Date_applied'] + RATE_COLS]
+             .sort_values('Date_applied', kind='mergesort'))
+    rates['Date_applied'] = rates['Date_applied'].astype(df['Month'].dtype)
+
+    # merge_asof needs the left side ordered by date, original order restored
+    # afterwards using the saved row positions
+    left = pd.DataFrame({'Month': df['Month'].values,
+                         'Consultant': df['Consultant'].values,
+                         '_row': np.arange(len(df))})
+    left = left.sort_values('Month', kind='mergesort')
+
+    own = pd.merge_asof(left, rates, left_on='Month', right_on='Date_applied',
+                        by='Consultant', direction='backward')
+    default = pd.merge_asof(
+        left[['Month', '_row']],
+        rates[rates['Consultant'] == DEFAULT_NAME].drop(columns='Consultant'),
+        left_on='Month', right_on='Date_applied', direction='backward')
+
+    has_own = own['Date_applied'].notna().values
+    if (~has_own & default['Date_applied'].isna().values).any():
+        missing = (left.loc[~has_own & default['Date_applied'].isna().values,
+                            'Month'].min())
+        raise ValueError(f'No {DEFAULT_NAME} service fee rate applied on or '
+                         f'before {missing:%b %Y}')
+
+    resolved = pd.DataFrame(
+        {col: np.where(has_own, own[col].values, default[col].values)
+         for col in RATE_COLS})
+    resolved.index = left['_row'].values
+    resolved = resolved.sort_index()
+    resolved.index = df.index
+    return resolved.astype(float)
+
+
+def calculate_fees(df, sf):
+    # Service fee, Commission paid and Margin for every row, as arrays
+    rates = resolve_rates(df, sf)
+    commission = df['Commission'].values.astype(float)
+    gross = df['Gross sales'].values.astype(float)
+
+    service_fee = rates['SF_flat'].values + \
+        rates['SF_pct'].values * commission / 100
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # No margin when there were no sales, as before
+        margin = np.where(gross == 0, np.nan, 100 * commission / gross)
+
+    return pd.DataFrame({
+        'Service fee': service_fee,
+        'Commission paid': commission - service_fee,
+        'Margin': margin,
+    }, index=df.index)
@@ -0,0 +1,70 @@
+# Coalescing identical concurrent callback calls
+#
+# When a team opens the dashboard together, every page fires the same
+# initial callbacks. While a call for a given key is running, identical
+# calls wait for it and share its result (or exception) instead of
+# computing it again. Only calls in this process are coalesced - across
+# workers, a shared result_store lets them reuse each other's figures once
+# computed.
+
+import threading
+from functools import wraps
+
+from figure_cache import cache_key
+
+
+class _Call:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.computed = 0
+        self.coalesced = 0  # calls answered by another call's result
+
+    def do(self, key, fn, *args):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.computed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def coalesce(self, fn):
+        # Decorator - keyed as in FigureCache.memoize. Put it outside
+        # memoize, so a result is cached before later calls stop waiting
+        @wraps(fn)
+        def wrapper(*args):
+            return self.do(cache_key(fn.__name__, args), fn, *args)
+        return wrapper
+
+    def stats(self):
+        with self._lock:
+            return {'computed': self.computed, 'coalesced': self.coalesced,
+                    'in_flight': len(self._calls)}
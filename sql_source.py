@@ -0,0 +1,372 @@
+# SQLite data source - for histories too large to hold in every worker
+#
+# The workbook is imported into a local SQLite file once (and again when it
+# changes), and each callback becomes a query, so workers only hold the
+# rows they are showing. Work is pushed down into SQL:
+# - the service fee rates are resolved as-of each month at import, by the
+#   rules in service_fee.py, and the derived columns stored
+# - month ranges, Top N and year/quarter totals are filtered, summed and
+#   ranked in the query
+#
+# Indexes - every callback query is a range scan of one of:
+# - sales' primary key (month, consultant_id): slider ranges, Top N, a
+#   month's values and year/quarter totals
+# - sales_consultant (consultant_id, month, <every metric>): one
+#   consultant's history, covering so no table lookups are needed
+# - sf_rates_asof (consultant, date_applied, sheet_row): the as-of lookups
+#
+# The Data sheet is inserted a chunk at a time as it's read. Each gunicorn
+# worker loads the file, so an import holds a lock file (<path>.lock) - the
+# first worker imports, and the others wait for it and use its file.
+#
+# Usage (from the repo root), to import ahead of time:
+#   python sql_source.py DashboardDemo_RandomData.xlsx .dashboard_cache/data.db
+
+import argparse
+import os
+import sqlite3
+import tempfile
+from contextlib import closing, contextmanager
+
+import numpy as np
+import pandas as pd
+
+from data_cache import file_hash
+from data_source import DataSource
+from ingest import CHUNK_ROWS, WorkbookReader
+from rollups import add_margin, period_bounds
+from service_fee import DEFAULT_NAME
+from sqlite_local import ThreadConnections
+from timings import PhaseTimer
+
+try:
+    import fcntl
+except ImportError:  # Windows - imports aren't coordinated
+    fcntl = None
+
+
+SCHEMA_VERSION = 1  # bump if the schema or derived columns change
+
+COLUMNS = {
+    'Gross sales': 'gross_sales',
+    'Cost of sales': 'cost_of_sales',
+    'Commission': 'commission',
+    'Service fee': 'service_fee',
+    'Commission paid': 'commission_paid',
+    'Margin': 'margin',
+}
+SUMMED = [metric for metric in COLUMNS if metric != 'Margin']
+
+SCHEMA = f'''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE consultants (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE sf_rates (
+    sheet_row INTEGER PRIMARY KEY, consultant TEXT NOT NULL,
+    date_applied TEXT NOT NULL, sf_pct REAL NOT NULL, sf_flat REAL NOT NULL);
+CREATE INDEX sf_rates_asof ON sf_rates (consultant, date_applied, sheet_row);
+CREATE TABLE raw_data (
+    month TEXT, consultant TEXT, gross_sales REAL, cost_of_sales REAL,
+    commission REAL);
+CREATE TABLE sales (
+    month TEXT NOT NULL, consultant_id INTEGER NOT NULL,
+    {', '.join(f'{col} REAL' for col in COLUMNS.values())},
+    PRIMARY KEY (month, consultant_id)) WITHOUT ROWID;
+CREATE INDEX sales_consultant ON sales (
+    consultant_id, month, {', '.join(COLUMNS.values())});
+'''
+
+# Rate in force for a raw_data row `d`: the consultant's own latest on/before
+# the month, else DEFAULT's. Same-day rates resolve to the later sheet row
+_AS_OF = '''(SELECT sheet_row FROM sf_rates
+             WHERE consultant = {who} AND date_applied <= d.month
+             ORDER BY date_applied DESC, sheet_row DESC LIMIT 1)'''
+OWN_RATE = _AS_OF.format(who='d.consultant')
+DEFAULT_RATE = _AS_OF.format(who="'" + DEFAULT_NAME + "'")
+
+DERIVE = f'''
+INSERT OR REPLACE INTO sales
+SELECT month, consultant_id,
+       np_round(gross_sales, 0), np_round(cost_of_sales, 0),
+       np_round(commission, 0), np_round(fee, 0),
+       np_round(commission - fee, 0),
+       CASE WHEN gross_sales = 0 THEN NULL
+            ELSE np_round(100 * commission / gross_sales, 1) END
+FROM (SELECT d.rowid AS raw_row, d.month, c.id AS consultant_id,
+             d.gross_sales, d.cost_of_sales, d.commission,
+             r.sf_flat + r.sf_pct * d.commission / 100 AS fee
+      FROM raw_data d
+      JOIN consultants c ON c.name = d.consultant
+      JOIN sf_rates r ON r.sheet_row = COALESCE({OWN_RATE}, {DEFAULT_RATE}))
+ORDER BY raw_row
+'''
+
+MISSING_RATE = f'''
+SELECT MIN(d.month) FROM raw_data d
+WHERE {OWN_RATE} IS NULL AND {DEFAULT_RATE} IS NULL
+'''
+
+
+def _np_round(value, decimals):
+    # As prepare_data rounds - SQLite's ROUND() takes halves away from zero
+    # rather than to even
+    return None if value is None else float(np.round(value, decimals))
+
+
+def _day(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%d')
+
+
+def imported_hash(path):
+    # Hash of the workbook the file was imported from, if current
+    try:
+        conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    except sqlite3.Error:
+        return None
+    try:
+        meta = dict(conn.execute('SELECT key, value FROM meta'))
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.close()
+    if meta.get('schema') != str(SCHEMA_VERSION):
+        return None
+    return meta.get('sha1')
+
+
+@contextmanager
+def import_lock(path):
+    # Held while importing into `path`, across processes
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def import_if_changed(workbook, path, source_id):
+    # Imports unless another process already has (waiting for it if it's
+    # importing now). Returns the number of rows imported
+    if imported_hash(path) == source_id:
+        return 0
+    with import_lock(path):
+        if imported_hash(path) == source_id:
+            return 0
+        return import_workbook(workbook, path, source_id)
+
+
+def import_workbook(workbook, path, source_id=None, chunk_rows=CHUNK_ROWS):
+    # Builds the file alongside, then swaps it in - readers keep the file
+    # they opened. Returns the number of rows imported
+    reader = WorkbookReader(workbook, chunk_rows)
+    book = reader.open()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp_import_')
+    os.close(fd)
+    try:
+        # closed before the file is replaced or removed
+        with closing(sqlite3.connect(tmp_path)) as conn:
+            conn.create_function('np_round', 2, _np_round,
+                                 deterministic=True)
+            conn.executescript(SCHEMA)
+            sf = reader.rates(book)
+            conn.executemany(
+                'INSERT INTO sf_rates VALUES (?, ?, ?, ?, ?)',
+                zip(range(len(sf)), sf['Consultant'],
+                    pd.to_datetime(sf['Date_applied'])
+                    .dt.strftime('%Y-%m-%d'),
+                    sf['SF_pct'].astype(float),
+                    sf['SF_flat'].astype(float)))
+            rows = 0
+            for df in reader.chunks(book, sf):
+                conn.executemany(
+                    'INSERT INTO raw_data VALUES (?, ?, ?, ?, ?)',
+                    zip(df['Month'].dt.strftime('%Y-%m-%d'),
+                        df['Consultant'],
+                        df['Gross sales'].astype(float),
+                        df['Cost of sales'].astype(float),
+                        df['Commission'].astype(float)))
+                rows += len(df)
+            conn.execute('INSERT INTO consultants (name) '
+                         'SELECT DISTINCT consultant FROM raw_data '
+                         'ORDER BY consultant')
+
+            missing = conn.execute(MISSING_RATE).fetchone()[0]
+            if missing is not None:
+                raise ValueError(f'No {DEFAULT_NAME} service fee rate applied '
+                                 f'on or before '
+                                 f'{pd.Timestamp(missing):%b %Y}')
+            conn.execute(DERIVE)
+            conn.execute('DROP TABLE raw_data')
+            conn.executemany('INSERT INTO meta VALUES (?, ?)', [
+                ('schema', str(SCHEMA_VERSION)),
+                ('sha1', source_id or file_hash(workbook))])
+            conn.commit()
+            conn.execute('ANALYZE')
+            conn.execute('VACUUM')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    finally:
+        book.close()
+    return rows
+
+
+class SQLiteData(DataSource):
+
+    def __init__(self, path, timer=None, source_id=None):
+        timer = timer or PhaseTimer()
+        self.path = path
+        self.source_id = source_id
+        self._conns = ThreadConnections(lambda: sqlite3.connect(
+            f'file:{self.path}?mode=ro', uri=True))
+
+        months = pd.to_datetime([m for m, in self._query(
+            'SELECT DISTINCT month FROM sales ORDER BY month')]).values
+        consultants = np.array([name for name, in self._query(
+            'SELECT name FROM consultants ORDER BY name')], dtype=object)
+        self._set_months(months, consultants)
+
+        commission, gross_sales = self._query(
+            'SELECT TOTAL(commission), TOTAL(gross_sales) FROM sales')[0]
+        self.in_date_overall_margin = round(100 * commission / gross_sales, 1)
+        self.month_leader = self._query(
+            'SELECT c.name FROM sales s '
+            'JOIN consultants c ON c.id = s.consultant_id '
+            'WHERE s.month = ? ORDER BY s.gross_sales DESC, c.name LIMIT 1',
+            (_day(self.months_dt[-1]),))[0][0]
+        timer.lap('queries')
+
+    def _query(self, sql, params=()):
+        return self._conns.get().execute(sql, params).fetchall()
+
+    @property
+    def cache_token(self):
+        if self.source_id:
+            return f'sqlite:{self.source_id}:{SCHEMA_VERSION}'
+        return str(id(self))
+
+    def range_frame(self, metric, month_start, month_end, consultants=None):
+        sql = (f'SELECT s.month, c.name, s.{COLUMNS[metric]} FROM sales s '
+               'JOIN consultants c ON c.id = s.consultant_id '
+               'WHERE s.month BETWEEN ? AND ?')
+        params = [_day(month_start), _day(month_end)]
+        if consultants is not None:
+            consultants = list(consultants)
+            sql += f" AND c.name IN ({', '.join('?' * len(consultants))})"
+            params += consultants
+        rows = pd.DataFrame(self._query(sql, params),
+                            columns=['Month', 'Consultant', metric])
+        rows['Month'] = pd.to_datetime(rows['Month'])
+        frame = rows.pivot(index='Month', columns='Consultant',
+                           values=metric).astype(float)
+        if consultants is not None:
+            # Every month of the range and every name given, as the
+            # in-memory cube returns them
+            months = pd.DatetimeIndex(
+                [m for m in self.months_dt if month_start <= m <= month_end],
+                name='Month')
+            frame = frame.reindex(index=months, columns=pd.Index(
+                consultants, name='Consultant'))
+        return frame
+
+    def _totals(self, metric, month_start, month_end, order, limit=-1):
+        return self._query(
+            f'SELECT c.name, TOTAL(s.{COLUMNS[metric]}) AS total '
+            'FROM sales s JOIN consultants c ON c.id = s.consultant_id '
+            'WHERE s.month BETWEEN ? AND ? GROUP BY s.consultant_id '
+            f'ORDER BY {order} LIMIT ?',
+            (_day(month_start), _day(month_end), limit))
+
+    def range_totals(self, metric, month_start, month_end):
+        rows = self._totals(metric, month_start, month_end, 'c.name')
+        return pd.Series([total for _, total in rows],
+                         index=[name for name, _ in rows], dtype=float)
+
+    def top_n(self, metric, month_start, month_end, n=5):
+        rows = self._totals(metric, month_start, month_end,
+                            'total DESC, c.name', n)
+        return pd.Index([name for name, _ in rows])
+
+    def month_values(self, metric, month):
+        rows = self._query(
+            f'SELECT c.name, s.{COLUMNS[metric]} FROM sales s '
+            'JOIN consultants c ON c.id = s.consultant_id '
+            'WHERE s.month = ? ORDER BY c.name', (_day(month),))
+        return pd.Series([value for _, value in rows],
+                         index=pd.Index([name for name, _ in rows],
+                                        name='Consultant'),
+                         dtype=float, name=pd.Timestamp(month))
+
+    def history(self, name, month_start=None, month_end=None):
+        rows = pd.DataFrame(self._query(
+            f"SELECT s.month, {', '.join(COLUMNS.values())} FROM sales s "
+            'WHERE s.consultant_id = '
+            '(SELECT id FROM consultants WHERE name = ?) '
+            'AND s.month BETWEEN ? AND ? ORDER BY s.month',
+            (name,
+             _day(month_start) if month_start is not None else '',
+             _day(month_end) if month_end is not None else '9999')),
+            columns=['Month'] + list(COLUMNS))
+        rows['Month'] = pd.to_datetime(rows['Month'])
+        rows.insert(1, 'Consultant', name)
+        rows['Month_label'] = rows['Month'].dt.strftime('%b %Y')
+        return rows.set_index('Month_label')
+
+    def financial_year_history(self, name, fin_year):
+        return self.history(name, *period_bounds('financial_year', fin_year))
+
+    def period_totals(self, kind, label, metrics=None):
+        month_start, month_end = period_bounds(kind, label)
+        rows = self._query(
+            'SELECT c.name, '
+            + ', '.join(f'TOTAL(s.{COLUMNS[m]})' for m in SUMMED)
+            + ' FROM sales s JOIN consultants c ON c.id = s.consultant_id '
+            'WHERE s.month BETWEEN ? AND ? GROUP BY s.consultant_id '
+            'ORDER BY c.name', (_day(month_start), _day(month_end)))
+        frame = pd.DataFrame([row[1:] for row in rows],
+                             index=pd.Index([row[0] for row in rows],
+                                            name='Consultant'),
+                             columns=SUMMED, dtype=float)
+        return add_margin(frame)[metrics or SUMMED + ['Margin']]
+
+    def memory_report(self):
+        # Data stays on disk (and in the OS page cache)
+        return {'sqlite_file': os.path.getsize(self.path)}
+
+    def reimport(self, workbook, source_id=None):
+        # Returns (new data, number of rows imported)
+        source_id = source_id or file_hash(workbook)
+        rows = import_if_changed(workbook, self.path, source_id)
+        return SQLiteData(self.path, source_id=source_id), rows
+
+    @classmethod
+    def load(cls, workbook, path, timer=None):
+        # Imports the workbook first if the file is missing or out of date
+        timer = timer or PhaseTimer()
+        with timer.phase('hash workbook'):
+            source_id = file_hash(workbook)
+        with timer.phase('import workbook'):
+            import_if_changed(workbook, path, source_id)
+        return cls(path, timer, source_id=source_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Import the workbook into a SQLite data source')
+    parser.add_argument('workbook')
+    parser.add_argument('path')
+    args = parser.parse_args()
+    with import_lock(args.path):
+        rows = import_workbook(args.workbook, args.path)
+    print(f'Imported {rows} rows into {args.path}')
+
+
+if __name__ == '__main__':
+    main()
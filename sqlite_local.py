@@ -0,0 +1,20 @@
+# Per-thread SQLite connections
+#
+# sqlite3 connections can't be shared between threads, so the stores and
+# data sources backed by a file keep one for each thread that asks.
+
+import threading
+
+
+class ThreadConnections:
+
+    def __init__(self, connect):
+        # connect() opens (and sets up) a new connection
+        self._connect = connect
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
@@ -0,0 +1,38 @@
+# Files served at content-hashed URLs
+#
+# url(path) gives eg. /files/DemoLogo.3f2a9c1e04b7.JPG - a changed file gets
+# a new URL, so browsers can keep each one for a year rather than
+# downloading it again (the logo used to be inlined into every page's
+# layout as base64).
+
+import os
+
+import flask
+
+from data_cache import file_hash
+
+ONE_YEAR = 365 * 24 * 60 * 60
+
+
+class StaticAssets:
+
+    def __init__(self, server, prefix='/files/'):
+        self.prefix = prefix
+        self._files = {}  # hashed name -> path
+        server.add_url_rule(prefix + '<name>', 'hashed_file', self._serve)
+
+    def url(self, path):
+        stem, ext = os.path.splitext(os.path.basename(path))
+        name = f'{stem}.{file_hash(path)[:12]}{ext}'
+        self._files[name] = os.path.abspath(path)
+        return self.prefix + name
+
+    def _serve(self, name):
+        if name not in self._files:
+            flask.abort(404)
+        response = flask.send_file(self._files[name], max_age=ONE_YEAR)
+        # Behind the login, so for the browser's cache only
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+WORKBOOK = os.path.join(ROOT, 'DashboardDemo_RandomData.xlsx')
+
+
+@pytest.fixture
+def unwritable_cache(monkeypatch):
+    # The data cache can't be written, on any platform
+    import data_cache
+
+    def fail(*args, **kwargs):
+        raise PermissionError('read-only')
+    monkeypatch.setattr(data_cache.tempfile, 'mkdtemp', fail)
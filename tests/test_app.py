@@ -0,0 +1,54 @@
+import base64
+import time
+
+import pytest
+
+import DashboardDemo as demo
+from conftest import WORKBOOK
+from session import Page
+
+AUTH = {'Authorization': 'Basic ' + base64.b64encode(b'Demo:demo').decode()}
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('app')
+    server = demo.create_server({
+        'workbook': WORKBOOK, 'cache_dir': str(tmp / 'cache'),
+        'background': False, 'watch': False, 'job_workers': 0})
+    return server.test_client()
+
+
+def test_probes_need_no_login(client):
+    assert client.get('/ready').status_code == 200
+    assert client.get('/metrics').status_code == 200
+
+
+def test_dashboard_needs_login(client):
+    assert client.get('/').status_code == 401
+    assert client.get('/payload').status_code == 401
+    assert client.get('/', headers=AUTH).status_code == 200
+
+
+def test_pooled_callbacks_are_profiled_on_the_pool(tmp_path, monkeypatch):
+    def update_graph5(data, year):
+        time.sleep(0.1)
+        return {}
+    monkeypatch.setattr(demo, 'update_graph5', update_graph5)
+    app = demo.create_app({
+        'workbook': WORKBOOK, 'cache_dir': str(tmp_path / 'cache'),
+        'background': False, 'watch': False, 'job_workers': 2,
+        'profile_callback': 'update_graph5'})
+    client = app.server.test_client()
+    data = app.state.get()
+    [(name, body)] = Page(data).select_year(data.years[-1])
+    response = client.post('/_dash-update-component', json=body,
+                           headers=AUTH)
+    assert response.status_code == 200
+    # The same request number again is stale - no update
+    response = client.post('/_dash-update-component', json=body,
+                           headers=AUTH)
+    assert response.status_code == 204
+    stacks = client.get('/profile', headers=AUTH).get_data(as_text=True)
+    assert 'update_graph5 (' in stacks
+    assert 'test_app.py' in stacks
@@ -0,0 +1,138 @@
+import gzip
+import json
+
+import flask
+import pytest
+
+import compression
+from compression import Compressor, accepted_encoding
+
+BODY = json.dumps({'y': list(range(2000))})
+
+
+@pytest.fixture
+def app():
+    server = flask.Flask(__name__)
+    server.compressor = Compressor(min_bytes=1024)
+    server.compressor.init_app(server)
+    server.version = 'v1'
+
+    @server.route('/figure')
+    def figure():
+        return flask.Response(BODY, mimetype='application/json')
+
+    @server.route('/small')
+    def small():
+        return flask.Response('{}', mimetype='application/json')
+
+    @server.route('/encoded')
+    def encoded():
+        response = flask.Response(gzip.compress(BODY.encode()),
+                                  mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+        return response
+
+    @server.route('/bundle.js')
+    def bundle():
+        # As Dash serves its fingerprinted bundles
+        response = flask.Response(BODY, mimetype='application/javascript')
+        response.cache_control.max_age = 3600
+        response.set_etag(server.version)
+        return response
+
+    return server
+
+
+def get(app, path, accept_encoding=None):
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    return app.test_client().get(path, headers=headers)
+
+
+@pytest.mark.parametrize('header, expected', [
+    ('gzip, deflate, br', 'br'),
+    ('gzip', 'gzip'),
+    ('br;q=0, gzip', 'gzip'),
+    ('GZIP', 'gzip'),
+    ('deflate', None),
+    ('', None),
+])
+def test_accepted_encoding(header, expected):
+    if expected == 'br' and compression.brotli is None:
+        expected = 'gzip'
+    assert accepted_encoding(header) == expected
+
+
+def test_accepted_encoding_without_brotli(monkeypatch):
+    monkeypatch.setattr(compression, 'brotli', None)
+    assert accepted_encoding('br, gzip') == 'gzip'
+    assert accepted_encoding('br') is None
+
+
+def test_gzip(app):
+    response = get(app, '/figure', 'gzip')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.data).decode() == BODY
+    assert app.compressor.stats() == {'responses': 1,
+                                      'bytes_in': len(BODY),
+                                      'bytes_out': len(response.data)}
+
+
+def test_brotli(app):
+    if compression.brotli is None:
+        pytest.skip('brotli is not installed')
+    response = get(app, '/figure', 'gzip, br')
+    assert response.headers['Content-Encoding'] == 'br'
+    assert compression.brotli.decompress(response.data).decode() == BODY
+
+
+def test_not_accepted(app):
+    response = get(app, '/figure')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.data.decode() == BODY
+
+
+def test_small_body_is_sent_as_is(app):
+    response = get(app, '/small', 'gzip')
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.data == b'{}'
+    assert app.compressor.stats()['responses'] == 0
+
+
+def test_encoded_body_is_sent_as_is(app):
+    response = get(app, '/encoded', 'gzip')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.data).decode() == BODY  # not twice
+    assert app.compressor.stats()['responses'] == 0
+
+
+def test_cacheable_responses_are_compressed_once(app, monkeypatch):
+    compressed = []
+    compress = compression.compress
+
+    def counted(body, encoding):
+        compressed.append(encoding)
+        return compress(body, encoding)
+    monkeypatch.setattr(compression, 'compress', counted)
+
+    bodies = [get(app, '/bundle.js', 'gzip').data for _ in range(3)]
+    assert compressed == ['gzip']
+    assert gzip.decompress(bodies[-1]).decode() == BODY
+    get(app, '/bundle.js', 'deflate')  # not compressed at all
+    assert compressed == ['gzip']
+    if compression.brotli is not None:
+        get(app, '/bundle.js', 'br')  # another encoding
+        get(app, '/bundle.js', 'br')
+        assert compressed == ['gzip', 'br']
+    app.version = 'v2'  # another ETag
+    get(app, '/bundle.js', 'gzip')
+    assert compressed[-1] == 'gzip' and compressed.count('gzip') == 2
+    get(app, '/bundle.js?v=2', 'gzip')  # another path
+    assert compressed.count('gzip') == 3
+
+    # Responses browsers don't cache, eg. callbacks, each time
+    get(app, '/figure', 'gzip')
+    get(app, '/figure', 'gzip')
+    assert compressed.count('gzip') == 5
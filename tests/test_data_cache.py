@@ -0,0 +1,63 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+from conftest import WORKBOOK
+from dashboard_data import CACHE_VERSION, DashboardData
+
+
+def frames():
+    df = pd.DataFrame({'Month': pd.to_datetime(['2020-01-01', '2020-02-01']),
+                       'Consultant': pd.Categorical(['Anna', 'Bob']),
+                       'Gross sales': np.array([1, 2], dtype=np.float32)})
+    return {'df': df}
+
+
+def test_round_trip(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    assert data_cache.save(WORKBOOK, cache_dir, frames())
+    loaded = data_cache.load(WORKBOOK, cache_dir)['df']
+    pd.testing.assert_frame_equal(loaded, frames()['df'])
+
+
+def test_unwritable_cache_dir_is_skipped(tmp_path, unwritable_cache):
+    cache_dir = str(tmp_path / 'cache')
+    assert not data_cache.save(WORKBOOK, cache_dir, frames())
+    data = DashboardData.load(WORKBOOK, cache_dir)
+    assert data.num_of_months > 0
+
+
+def test_only_its_own_directory_is_replaced(tmp_path):
+    # eg. cache_dir='.' - nothing else in it is touched
+    cache_dir = str(tmp_path)
+    (tmp_path / 'notes.txt').write_text('keep')
+    (tmp_path / 'results.db').write_text('keep')
+    for _ in range(3):
+        assert data_cache.save(WORKBOOK, cache_dir, frames(), CACHE_VERSION)
+    assert sorted(os.listdir(tmp_path)) == ['data', 'notes.txt', 'results.db']
+    # Only the latest frames are kept
+    data_dir = tmp_path / 'data'
+    assert len([name for name in os.listdir(data_dir)
+                if name.startswith('frames_')]) == 1
+    assert data_cache.load(WORKBOOK, cache_dir, CACHE_VERSION) is not None
+
+
+def test_losing_a_race_keeps_the_winners_cache(tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    assert data_cache.save(WORKBOOK, cache_dir, frames(), CACHE_VERSION)
+
+    # Another worker's manifest is swapped in just after ours
+    replace = data_cache.os.replace
+
+    def replace_then_race(src, dst):
+        replace(src, dst)
+        monkeypatch.setattr(data_cache.os, 'replace', replace)
+        data_cache.save(WORKBOOK, cache_dir, frames(), CACHE_VERSION)
+    monkeypatch.setattr(data_cache.os, 'replace', replace_then_race)
+    assert data_cache.save(WORKBOOK, cache_dir, frames(), CACHE_VERSION)
+    loaded = data_cache.load(WORKBOOK, cache_dir, CACHE_VERSION)['df']
+    pd.testing.assert_frame_equal(loaded, frames()['df'])
+    assert not [name for name in os.listdir(tmp_path / 'cache' / 'data')
+                if name.startswith('.tmp_')]
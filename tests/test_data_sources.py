@@ -0,0 +1,116 @@
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+import sql_source
+from conftest import WORKBOOK
+from dashboard_data import DashboardData
+from data_cache import file_hash
+from sql_source import SQLiteData
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp('data')
+    return (DashboardData.load(WORKBOOK, str(tmp / 'cache')),
+            SQLiteData.load(WORKBOOK, str(tmp / 'data.db')))
+
+
+def test_range_frame_with_unknown_consultants(sources):
+    memory, sqlite = sources
+    names = [memory.consultants[1], 'Nobody', memory.consultants[0], 'Aaa']
+    frames = [data.range_frame('Gross sales', *data.recent, names)
+              for data in sources]
+    for frame in frames:
+        assert list(frame.columns) == names
+        assert len(frame) == 12
+        assert frame['Nobody'].isna().all() and frame['Aaa'].isna().all()
+        assert frame[names[0]].notna().all()
+    pd.testing.assert_frame_equal(frames[0].astype(float), frames[1],
+                                  check_freq=False)
+
+
+def test_range_frames_match(sources):
+    memory, sqlite = sources
+    for metric in ('Gross sales', 'Commission', 'Margin'):
+        a = memory.range_frame(metric, memory.months_dt[0],
+                               memory.months_dt[-1])
+        b = sqlite.range_frame(metric, sqlite.months_dt[0],
+                               sqlite.months_dt[-1])
+        pd.testing.assert_frame_equal(a.astype(float), b, check_freq=False,
+                                      check_names=False)
+
+
+@pytest.mark.skipif(sql_source.fcntl is None,
+                    reason='imports are only coordinated with fcntl')
+def test_workers_import_once(tmp_path, monkeypatch):
+    imports = []
+    import_workbook = sql_source.import_workbook
+
+    def slow_import(*args):
+        imports.append(args)
+        time.sleep(0.2)  # the others arrive while it's importing
+        return import_workbook(*args)
+    monkeypatch.setattr(sql_source, 'import_workbook', slow_import)
+
+    path = str(tmp_path / 'data.db')
+    loaded = []
+    workers = [threading.Thread(target=lambda: loaded.append(
+                   SQLiteData.load(WORKBOOK, path)))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert len(imports) == 1
+    assert len(loaded) == 4
+    assert len({data.num_of_months for data in loaded}) == 1
+
+
+def test_failed_import_closes_its_connection(tmp_path, monkeypatch):
+    connections = []
+    connect = sql_source.sqlite3.connect
+
+    def recorded(*args, **kwargs):
+        connections.append(connect(*args, **kwargs))
+        return connections[-1]
+
+    def broken(*args):
+        raise RuntimeError('unreadable')
+        yield
+    monkeypatch.setattr(sql_source.sqlite3, 'connect', recorded)
+    monkeypatch.setattr(sql_source.WorkbookReader, 'chunks', broken)
+    with pytest.raises(RuntimeError):
+        sql_source.import_workbook(WORKBOOK, str(tmp_path / 'data.db'))
+    [conn] = connections
+    with pytest.raises(sqlite3.ProgrammingError):
+        conn.execute('SELECT 1')  # closed
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_import_in_chunks(tmp_path, sources):
+    memory, _ = sources
+    path = str(tmp_path / 'data.db')
+    rows = sql_source.import_workbook(WORKBOOK, path, chunk_rows=7)
+    assert rows == len(pd.read_excel(WORKBOOK, sheet_name='Data'))
+    sqlite = SQLiteData(path)
+    pd.testing.assert_frame_equal(
+        memory.range_frame('Margin', memory.months_dt[0],
+                           memory.months_dt[-1]).astype(float),
+        sqlite.range_frame('Margin', sqlite.months_dt[0],
+                           sqlite.months_dt[-1]), check_freq=False)
+
+
+def test_version_is_the_workbooks(sources, tmp_path):
+    # The same in every worker, whenever it loaded
+    version = file_hash(WORKBOOK)
+    assert [data.version for data in sources] == [version, version]
+    assert DashboardData.load(WORKBOOK, str(tmp_path)).version == version
+
+
+def test_version_without_a_cache(tmp_path, unwritable_cache):
+    data = DashboardData.load(WORKBOOK, str(tmp_path))
+    assert data.version == file_hash(WORKBOOK)
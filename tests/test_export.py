@@ -0,0 +1,47 @@
+import os
+
+import pandas as pd
+
+import DashboardDemo as demo
+from conftest import WORKBOOK
+from export import export
+from ingest import read_sheets
+
+
+def write_workbook(path, raw, sf):
+    with pd.ExcelWriter(path) as writer:
+        raw.to_excel(writer, sheet_name='Data', index=False)
+        sf.to_excel(writer, sheet_name='SF_Rates', index=False)
+
+
+def test_only_changed_views_are_rendered_again(tmp_path):
+    raw, sf = read_sheets(WORKBOOK)
+    workbook = str(tmp_path / 'data.xlsx')
+    config = dict(demo.DEFAULT_CONFIG, workbook=workbook,
+                  cache_dir=str(tmp_path / 'cache'), data_source=None)
+    out_dir = str(tmp_path / 'export')
+    # 18 consultants, 24 months from Mar 2016 and 3 metrics:
+    # gr1 3 x all/Top 5, gr6 18, gr3 24 x 3, gr5 3 years, gr7 18 x 3
+    views = 6 + 18 + 72 + 3 + 54
+
+    write_workbook(workbook, raw, sf)
+    assert export(config, out_dir, workers=2) == (views, 0, 0)
+    assert export(config, out_dir, workers=2) == (0, views, 0)
+
+    # Anna's commission in the first month - outside the last 12 months, so
+    # its pies for Commission and Service fee, 2016's totals and her
+    # Commission and Service fee by financial year
+    first = raw['Month'] == raw['Month'].min()
+    raw.loc[first & (raw['Consultant'] == 'Anna'), 'Commission'] += 500
+    write_workbook(workbook, raw, sf)
+    assert export(config, out_dir, workers=2) == (5, views - 5, 0)
+
+    # Without the first month, its pies go, and 2016's totals and every
+    # consultant's 2015.2016 financial year change
+    write_workbook(workbook, raw[~first], sf)
+    rendered, unchanged, removed = export(config, out_dir, workers=2)
+    assert (rendered, unchanged, removed) == (1 + 54, views - 3 - 55, 3)
+    assert not os.path.exists(os.path.join(out_dir, 'gr3',
+                                           'commission-mar-2016.html'))
+    assert os.path.exists(os.path.join(out_dir, 'gr3',
+                                       'commission-apr-2016.html'))
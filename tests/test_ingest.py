@@ -0,0 +1,56 @@
+import pandas as pd
+import pytest
+
+from conftest import WORKBOOK
+from dashboard_data import read_workbook
+from ingest import WorkbookError
+from timings import PhaseTimer
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    return (pd.read_excel(WORKBOOK, sheet_name='Data'),
+            pd.read_excel(WORKBOOK, sheet_name='SF_Rates'))
+
+
+def problems(tmp_path, df, sf):
+    # The problems read_workbook reports, as on startup
+    workbook = str(tmp_path / 'bad.xlsx')
+    with pd.ExcelWriter(workbook) as writer:
+        df.to_excel(writer, sheet_name='Data', index=False)
+        sf.to_excel(writer, sheet_name='SF_Rates', index=False)
+    with pytest.raises(WorkbookError) as error:
+        read_workbook(workbook, str(tmp_path / 'cache'), PhaseTimer())
+    return error.value.problems
+
+
+def test_bad_date(tmp_path, sheets):
+    df, sf = sheets
+    df = df.astype({'Month': object})
+    df.loc[5, 'Month'] = 'notadate'
+    assert problems(tmp_path, df, sf) == [
+        ('Data', 7, "Month 'notadate' is not a date")]
+
+
+def test_non_numeric_value(tmp_path, sheets):
+    df, sf = sheets
+    df = df.astype({'Gross sales': object})
+    df.loc[3, 'Gross sales'] = 'n/a'
+    assert problems(tmp_path, df, sf) == [
+        ('Data', 5, "Gross sales 'n/a' is not a number")]
+
+
+def test_blank_consultant(tmp_path, sheets):
+    df, sf = sheets
+    df = df.copy()
+    df.loc[10, 'Consultant'] = None
+    assert problems(tmp_path, df, sf) == [('Data', 12, 'no Consultant')]
+
+
+def test_row_with_no_rate(tmp_path, sheets):
+    df, sf = sheets
+    df = df.copy()
+    df.loc[0, 'Month'] = pd.Timestamp('1999-01-01')
+    assert problems(tmp_path, df, sf) == [
+        ('Data', 2, 'no DEFAULT service fee rate applied on or before '
+                    'Jan 1999')]
@@ -0,0 +1,132 @@
+import threading
+import time
+
+import pytest
+from dash.exceptions import PreventUpdate
+
+from job_pool import JobPool
+
+
+def call(pool, key, fn, seq, results, name):
+    # pool.run on a thread of its own, as a request would be
+    def request():
+        try:
+            results[name] = pool.run(key, fn, name, seq=seq)
+        except PreventUpdate:
+            results[name] = 'PreventUpdate'
+    thread = threading.Thread(target=request)
+    thread.start()
+    return thread
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_runs_the_job():
+    pool = JobPool(2)
+    assert pool.run('page', lambda a, b: a + b, 1, 2, seq=1) == 3
+    assert pool.stats()['in_flight'] == 0
+
+
+def test_stale_request_arriving_late_is_dropped():
+    # B was made after A, but reaches the server first
+    pool = JobPool(2)
+    assert pool.run('page', str, 'B_latest', seq=2) == 'B_latest'
+    with pytest.raises(PreventUpdate):
+        pool.run('page', str, 'A_stale', seq=1)
+    assert pool.stats()['stale'] == 1
+
+
+def test_stale_request_arriving_while_latest_runs():
+    pool = JobPool(2)
+    release = threading.Event()
+    results = {}
+
+    def slow(name):
+        release.wait(5)
+        return name
+    latest = call(pool, 'page', slow, 2, results, 'B_latest')
+    wait_for(lambda: pool.stats()['in_flight'] == 1)
+    stale = call(pool, 'page', slow, 1, results, 'A_stale')
+    stale.join(5)
+    release.set()
+    latest.join(5)
+    assert results == {'B_latest': 'B_latest', 'A_stale': 'PreventUpdate'}
+
+
+def test_waiting_job_is_cancelled_by_a_newer_one():
+    pool = JobPool(1)
+    release = threading.Event()
+    results = {}
+
+    def slow(name):
+        release.wait(5)
+        return name
+    busy = call(pool, 'other page', slow, 1, results, 'other')
+    wait_for(lambda: pool.stats()['running'] == 1)
+    first = call(pool, 'page', str, 1, results, 'first')
+    wait_for(lambda: pool.stats()['in_flight'] == 2)
+    second = call(pool, 'page', str, 2, results, 'second')
+    first.join(5)
+    assert results == {'first': 'PreventUpdate'}
+    release.set()
+    for thread in (busy, second):
+        thread.join(5)
+    assert results == {'other': 'other', 'first': 'PreventUpdate',
+                       'second': 'second'}
+    assert pool.stats()['cancelled'] == 1
+
+
+def test_superseded_running_job_frees_its_slot():
+    # The latest starts straight away, without waiting for the job it
+    # superseded to finish
+    pool = JobPool(1)
+    latest_started = threading.Event()
+    results = {}
+
+    def superseded(name):
+        latest_started.wait(5)
+        return name
+
+    def latest(name):
+        latest_started.set()
+        return name
+    first = call(pool, 'page', superseded, 1, results, 'first')
+    wait_for(lambda: pool.stats()['running'] == 1)
+    second = call(pool, 'page', latest, 2, results, 'second')
+    second.join(5)
+    first.join(5)
+    assert latest_started.is_set()
+    assert results == {'first': 'PreventUpdate', 'second': 'second'}
+    assert pool.stats()['dropped'] == 1
+
+
+def test_rapid_steps_take_one_job_time():
+    # Four slider steps on two workers - only the last one's time counts
+    pool = JobPool(2)
+    results = {}
+
+    def job(name):
+        time.sleep(0.2)
+        return name
+    start = time.perf_counter()
+    threads = []
+    for seq in range(1, 5):
+        threads.append(call(pool, 'page', job, seq, results, seq))
+        time.sleep(0.01)
+    for thread in threads:
+        thread.join(5)
+    assert results[4] == 4
+    assert [results[seq] for seq in (1, 2, 3)] == ['PreventUpdate'] * 3
+    assert time.perf_counter() - start < 0.35
+
+
+def test_keys_are_independent():
+    pool = JobPool(2)
+    assert pool.run(('page 1', 'gr1'), str, 'a', seq=5) == 'a'
+    assert pool.run(('page 2', 'gr1'), str, 'b', seq=1) == 'b'
+    assert pool.run(('page 1', 'gr5'), str, 'c', seq=1) == 'c'
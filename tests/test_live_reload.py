@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import WORKBOOK
+from dashboard_data import DashboardData, prepare_data
+from data_cache import file_hash
+from ingest import read_sheets
+from live_reload import reload_data
+
+
+@pytest.fixture(scope='module')
+def sheets():
+    return read_sheets(WORKBOOK)
+
+
+def write_workbook(path, raw, sf):
+    with pd.ExcelWriter(path) as writer:
+        raw.to_excel(writer, sheet_name='Data', index=False)
+        sf.to_excel(writer, sheet_name='SF_Rates', index=False)
+    return str(path)
+
+
+def appended_month(raw, sf):
+    last = raw['Month'].max()
+    return raw[raw['Month'] < last], raw, sf, sf
+
+
+def new_consultant(raw, sf):
+    added = raw[raw['Consultant'] == raw['Consultant'].iloc[0]].copy()
+    added['Consultant'] = 'Zed'
+    return raw, pd.concat([raw, added], ignore_index=True), sf, sf
+
+
+def new_default_rate(raw, sf):
+    rate = pd.DataFrame({'Consultant': ['DEFAULT'],
+                         'Date_applied': [raw['Month'].iloc[len(raw) // 2]],
+                         'SF_pct': [15], 'SF_flat': [50]})
+    return raw, raw, sf, pd.concat([sf, rate], ignore_index=True)
+
+
+def assert_same(reloaded, loaded):
+    assert reloaded.source_id == loaded.source_id
+    pd.testing.assert_frame_equal(reloaded.df.reset_index(drop=True),
+                                  loaded.df.reset_index(drop=True),
+                                  check_categorical=False)
+    assert reloaded.months_dt == loaded.months_dt
+    assert list(reloaded.consultants) == list(loaded.consultants)
+    for metric in ('Gross sales', 'Commission', 'Service fee', 'Margin'):
+        pd.testing.assert_frame_equal(
+            reloaded.range_frame(metric, *reloaded.recent),
+            loaded.range_frame(metric, *loaded.recent))
+        np.testing.assert_allclose(
+            reloaded.range_totals(metric, reloaded.months_dt[0],
+                                  reloaded.months_dt[-1]).values,
+            loaded.range_totals(metric, loaded.months_dt[0],
+                                loaded.months_dt[-1]).values)
+    for kind in ('year', 'financial_year', 'quarter'):
+        assert reloaded.rollups.labels(kind) == loaded.rollups.labels(kind)
+        for label in loaded.rollups.labels(kind):
+            pd.testing.assert_frame_equal(
+                reloaded.period_totals(kind, label),
+                loaded.period_totals(kind, label))
+    assert reloaded.month_leader == loaded.month_leader
+
+
+@pytest.mark.parametrize('change', [appended_month, new_consultant,
+                                    new_default_rate])
+def test_reload_matches_a_full_load(sheets, tmp_path, change):
+    old_raw, raw, old_sf, sf = change(*sheets)
+    before = write_workbook(tmp_path / 'before.xlsx', old_raw, old_sf)
+    after = write_workbook(tmp_path / 'after.xlsx', raw, sf)
+    data = DashboardData.load(before, str(tmp_path / 'cache_before'))
+
+    new_raw, new_sf = read_sheets(after)
+    reloaded, recalculated = reload_data(data, new_raw, new_sf,
+                                         file_hash(after))
+    assert 0 < recalculated < len(new_raw)  # not a full rebuild
+    assert_same(reloaded, DashboardData.load(after,
+                                             str(tmp_path / 'cache_after')))
+
+
+def test_unchanged_rows_get_the_new_version(sheets):
+    raw, sf = sheets
+    data = DashboardData(prepare_data(raw.copy(), sf), sf, source_id='old')
+    reloaded, recalculated = reload_data(data, raw, sf, 'new')
+    assert recalculated == 0
+    assert reloaded.source_id == 'new' and reloaded.version == 'new'
+    assert data.source_id == 'old'
+    assert reloaded.cube is data.cube
+
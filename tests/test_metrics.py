@@ -0,0 +1,26 @@
+from metrics import BYTES_BUCKETS, SECONDS_BUCKETS, Histogram
+
+
+def test_histogram_lines():
+    histogram = Histogram(SECONDS_BUCKETS)
+    for value in (0.003, 0.004, 30):
+        histogram.observe(value)
+    lines = list(histogram.lines('compute_seconds', 'callback="gr1"'))
+    assert len(lines) == len(SECONDS_BUCKETS) + 3
+    assert lines[2] == 'compute_seconds_bucket{callback="gr1",le="0.005"} 2'
+    assert lines[-3] == 'compute_seconds_bucket{callback="gr1",le="+Inf"} 3'
+    assert lines[-1] == 'compute_seconds_count{callback="gr1"} 3'
+
+
+def test_sum_keeps_full_precision():
+    # Rates are worked out from differences of the sum between scrapes, so
+    # it mustn't be rounded once it grows large
+    histogram = Histogram(BYTES_BUCKETS)
+    histogram.observe(123456789)
+    histogram.observe(1)
+    seconds = Histogram(SECONDS_BUCKETS)
+    seconds.observe(1234567.125)
+    [line] = [line for line in histogram.lines('bytes', 'a="b"')
+              if '_sum' in line]
+    assert line == 'bytes_sum{a="b"} 123456790'
+    assert list(seconds.lines('s', 'a="b"'))[-2] == 's_sum{a="b"} 1234567.125'
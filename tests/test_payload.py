@@ -0,0 +1,67 @@
+import json
+
+import numpy as np
+import plotly.graph_objs as go
+
+import payload
+
+
+def test_size_before_is_sampled(monkeypatch):
+    stats = payload.PayloadStats(sample_every=20)
+    monkeypatch.setattr(payload, 'payload_stats', stats)
+
+    @payload.reduce_payload(decimals=0)
+    def figure():
+        return go.Figure(go.Scatter(x=list(range(50)),
+                                    y=[i + 0.25 for i in range(50)]))
+
+    for _ in range(45):
+        figure()
+    summary = stats.summary()['figure']
+    assert summary['calls'] == 45
+    assert summary['sampled'] == 3  # calls 1, 21 and 41
+    assert summary['saved_per_call'] > 0
+    assert summary['bytes_after'] == 15 * summary['sampled_after']
+
+
+def test_min_max_points_keeps_extremes_and_gaps():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=1000)
+    y[[100, 500]] = np.nan
+    y[321], y[654] = 10, -10
+    keep = payload.min_max_points(y, 60)
+    assert len(keep) <= 60
+    assert {321, 654, 100, 500} <= set(keep)
+    assert list(keep) == sorted(keep)
+    assert list(payload.min_max_points(y[:50], 60)) == list(range(50))
+
+
+def figure(traces, points, gaps=0.0):
+    rng = np.random.default_rng(1)
+    x = [f'2000-{i}' for i in range(points)]
+    data = []
+    for _ in range(traces):
+        y = rng.normal(1000, 300, points).round()
+        y[rng.random(points) < gaps] = np.nan
+        data.append(go.Scatter(x=x, y=y))
+    return go.Figure(data)
+
+
+def test_small_figure_is_serialised_once(monkeypatch):
+    calls = []
+    monkeypatch.setattr(payload, 'figure_json',
+                        lambda fig: calls.append(fig) or '{}')
+    payload.reduce_figure(figure(3, 50))
+    assert len(calls) == 1
+
+
+def test_figure_with_gaps_is_brought_within_budget():
+    fig = figure(50, 2000, gaps=0.05)
+    budget = 100 * 1024
+    reduced, text = payload.reduce_figure(fig, budget=budget)
+    assert len(text) <= budget
+    assert json.loads(text) is not None
+    for before, after in zip(fig.data, reduced['data']):
+        values = [v for v in after['y'] if v is not None]
+        assert max(values) == np.nanmax(before.y)
+        assert None in after['y']  # gaps kept
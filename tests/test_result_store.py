@@ -0,0 +1,55 @@
+import itertools
+import os
+import threading
+import types
+
+import result_store
+from result_store import MemoryStore, SQLiteStore
+
+
+def test_memory_store_evicts_least_recently_used():
+    store = MemoryStore(max_entries=3, max_bytes=1000)
+    for key in 'abc':
+        store.set(key, key.upper(), 10)
+    assert store.get('a') == 'A'  # now the most recent
+    store.set('d', 'D', 10)
+    assert store.get('b') is None
+    assert [store.get(key) for key in 'acd'] == ['A', 'C', 'D']
+    # Over max_bytes too
+    store.set('e', 'E', 985)
+    assert store.get('a') is None and store.get('c') is None
+    assert store.stats() == {'entries': 2, 'bytes': 995, 'evictions': 3}
+
+
+def test_sqlite_store_evicts_least_recently_used(tmp_path, monkeypatch):
+    # A clock that always moves on (time.time() can repeat on Windows)
+    clock = itertools.count()
+    monkeypatch.setattr(result_store, 'time',
+                        types.SimpleNamespace(time=lambda: next(clock)))
+    store = SQLiteStore(str(tmp_path / 'results.db'), max_bytes=30)
+    for key in 'abc':
+        store.set(key, key.upper(), 10)
+    assert store.get('a') == 'A'
+    store.set('d', 'D', 10)
+    assert store.get('b') is None
+    assert [store.get(key) for key in 'acd'] == ['A', 'C', 'D']
+    assert store.stats() == {'entries': 3, 'bytes': 30, 'evictions': 1}
+
+
+def test_sqlite_store_survives_its_file_being_removed(tmp_path):
+    store = SQLiteStore(str(tmp_path / 'results.db'), max_bytes=30)
+    store.set('a', 'A', 10)
+    for name in os.listdir(tmp_path):
+        os.remove(tmp_path / name)
+
+    # A new request thread gets a new connection, to a new file
+    results = []
+
+    def request():
+        results.append(store.get('a'))
+        store.set('b', 'B', 10)
+        results.append(store.get('b'))
+    thread = threading.Thread(target=request)
+    thread.start()
+    thread.join()
+    assert results == [None, 'B']
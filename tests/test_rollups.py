@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import WORKBOOK
+from dashboard_data import DashboardData, prepare_data
+from ingest import read_sheets
+from rollups import KINDS, add_margin, period_labels
+from row_index import RowIndex, sort_rows
+
+
+@pytest.fixture(scope='module')
+def data():
+    raw, sf = read_sheets(WORKBOOK)
+    # A consultant who leaves and one who joins late, so not every period
+    # has every consultant
+    raw = raw[~((raw['Consultant'] == raw['Consultant'].iloc[0])
+                & (raw['Month'] > raw['Month'].iloc[len(raw) // 2]))]
+    raw = raw[~((raw['Consultant'] == raw['Consultant'].iloc[-1])
+                & (raw['Month'] < raw['Month'].iloc[len(raw) // 3]))]
+    return DashboardData(prepare_data(raw.copy(), sf), sf)
+
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_period_totals_match_pivot_table(data, kind):
+    # As gr5 used to total a year's rows
+    df = data.df
+    metrics = data.rollups.metrics
+    labels = period_labels(df['Month'].values)[kind]
+    assert data.rollups.labels(kind) == list(pd.unique(np.sort(labels)))
+    for label in data.rollups.labels(kind):
+        expected = add_margin(
+            df[labels == label]
+            .pivot_table(index='Consultant', values=metrics, aggfunc='sum',
+                         observed=True)[metrics].astype(float))
+        expected.index = expected.index.astype(object)
+        pd.testing.assert_frame_equal(data.period_totals(kind, label),
+                                      expected)
+
+
+def test_row_index_slices(data):
+    df = data.df
+    rows = RowIndex(df)
+    for name in data.consultants:
+        mine = np.flatnonzero(df['Consultant'].values == name)
+        assert list(range(len(df))[rows.consultant(name)]) == list(mine)
+
+        months = df['Month'].values[mine]
+        start, end = months[len(months) // 4], months[len(months) // 2]
+        within = mine[(months >= start) & (months <= end)]
+        assert (list(range(len(df))[rows.consultant(name, start, end)])
+                == list(within))
+        assert (list(range(len(df))[rows.consultant(name, month_end=end)])
+                == list(mine[months <= end]))
+
+        for year in pd.unique(df['Financial_year'].values[mine]):
+            assert (list(range(len(df))[rows.financial_year(name, year)])
+                    == list(mine[df['Financial_year'].values[mine] == year]))
+
+    assert rows.consultant('Nobody') == slice(0, 0)
+    assert rows.financial_year('Nobody', '2017.2018') == slice(0, 0)
+
+
+def test_sort_rows_groups_consultants():
+    df = pd.DataFrame({'Consultant': ['b', 'a', 'b', 'a'],
+                       'Month': pd.to_datetime(['2020-02-01', '2020-02-01',
+                                                '2020-01-01', '2020-01-01'])})
+    assert list(zip(*sort_rows(df).values.T)) == [
+        ('a', pd.Timestamp('2020-01-01')), ('a', pd.Timestamp('2020-02-01')),
+        ('b', pd.Timestamp('2020-01-01')), ('b', pd.Timestamp('2020-02-01'))]
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from bench_service_fee import service_fee_calc
+from conftest import WORKBOOK
+from service_fee import calculate_fees
+
+
+def reference(df, sf):
+    # The original row-by-row calculation
+    fee = df.apply(service_fee_calc, axis=1, sf=sf).astype(float)
+    gross = df['Gross sales'].astype(float)
+    margin = (100 * df['Commission'] / gross).where(gross != 0)
+    return fee, margin
+
+
+def assert_matches(df, sf):
+    fee, margin = reference(df, sf)
+    fees = calculate_fees(df, sf)
+    np.testing.assert_allclose(fees['Service fee'].values, fee.values)
+    np.testing.assert_allclose(fees['Commission paid'].values,
+                               (df['Commission'] - fee).values)
+    np.testing.assert_allclose(fees['Margin'].values, margin.values)
+    return fees
+
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['Month', 'Consultant', 'Gross sales',
+                                       'Commission']).astype(
+        {'Month': 'datetime64[ns]'})
+
+
+def rates(rows):
+    return pd.DataFrame(rows, columns=['Consultant', 'Date_applied',
+                                       'SF_pct', 'SF_flat']).astype(
+        {'Date_applied': 'datetime64[ns]'})
+
+
+def test_demo_workbook():
+    df = pd.read_excel(WORKBOOK, sheet_name='Data', parse_dates=['Month'])
+    sf = pd.read_excel(WORKBOOK, sheet_name='SF_Rates')
+    assert_matches(df, sf)
+
+
+def test_rates_on_the_same_date_use_the_later_row():
+    sf = rates([('DEFAULT', '2020-01-01', 10, 100),
+                ('Anna', '2020-03-01', 5, 50),
+                ('Anna', '2020-03-01', 20, 0),
+                ('DEFAULT', '2020-03-01', 1, 1),
+                ('DEFAULT', '2020-03-01', 2, 2)])
+    df = frame([('2020-03-01', 'Anna', 1000, 100),
+                ('2020-03-01', 'Bob', 1000, 100),
+                ('2020-04-01', 'Anna', 1000, 100)])
+    fees = assert_matches(df, sf)
+    assert list(fees['Service fee']) == [20, 4, 20]
+
+
+def test_default_until_the_consultant_has_their_own_rate():
+    sf = rates([('DEFAULT', '2020-01-01', 10, 100),
+                ('Anna', '2020-03-01', 0, 0)])
+    df = frame([('2020-01-01', 'Anna', 1000, 100),
+                ('2020-02-01', 'Anna', 1000, 100),
+                ('2020-03-01', 'Anna', 1000, 100)])
+    fees = assert_matches(df, sf)
+    assert list(fees['Service fee']) == [110, 110, 0]
+
+
+def test_no_margin_without_sales():
+    sf = rates([('DEFAULT', '2020-01-01', 10, 100)])
+    df = frame([('2020-01-01', 'Anna', 0, 0),
+                ('2020-01-01', 'Bob', 500, 50)])
+    fees = assert_matches(df, sf)
+    assert np.isnan(fees['Margin'][0])
+    assert fees['Margin'][1] == 10
+
+
+def test_month_before_any_default_rate():
+    sf = rates([('DEFAULT', '2020-02-01', 10, 100)])
+    df = frame([('2020-01-01', 'Anna', 1000, 100)])
+    with pytest.raises(ValueError, match='Jan 2020'):
+        calculate_fees(df, sf)
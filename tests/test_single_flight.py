@@ -0,0 +1,72 @@
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def call_together(flight, result, n=8):
+    # n threads call flight.do() with the same key. The function returns (or
+    # raises) `result`, once the other n - 1 calls are waiting on it.
+    # Returns (the number of times it ran, each call's result or exception)
+    runs = []
+
+    def fn():
+        runs.append(1)
+        deadline = time.monotonic() + 5
+        while (flight.stats()['coalesced'] < n - 1
+               and time.monotonic() < deadline):
+            time.sleep(0.01)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    outcomes = [None] * n
+
+    def call(i):
+        try:
+            outcomes[i] = flight.do('key', fn)
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(runs), outcomes
+
+
+def test_one_call_for_everyone():
+    flight = SingleFlight()
+    result = object()
+    runs, outcomes = call_together(flight, result)
+    assert runs == 1
+    assert all(outcome is result for outcome in outcomes)
+    assert flight.stats() == {'computed': 1, 'coalesced': 7, 'in_flight': 0}
+
+
+def test_error_reaches_every_caller():
+    flight = SingleFlight()
+    error = ValueError('bad data')
+    runs, outcomes = call_together(flight, error)
+    assert runs == 1
+    assert all(outcome is error for outcome in outcomes)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_key_is_released_afterwards():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do('key', lambda: int('x'))
+    assert flight.do('key', lambda: 1) == 1
+    assert flight.do('key', lambda: 2) == 2  # computed again, not shared
+    assert flight.stats() == {'computed': 3, 'coalesced': 0, 'in_flight': 0}
+
+
+def test_keys_are_independent():
+    flight = SingleFlight()
+    # a call for another key, made while 'a' is running, isn't held up by it
+    assert flight.do('a', lambda: flight.do('b', lambda: 'b') + 'a') == 'ba'
+    assert flight.stats()['coalesced'] == 0
@@ -0,0 +1,37 @@
+# Simple wall-clock timings for named phases, eg. of startup
+
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+class PhaseTimer:
+
+    def __init__(self):
+        self.phases = OrderedDict()
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, time.perf_counter() - start)
+
+    def lap(self, name):
+        # Time since the end of the previous phase/lap, for straight-line code
+        self._add(name, time.perf_counter() - self._last)
+
+    def _add(self, name, secs):
+        self.phases[name] = self.phases.get(name, 0) + secs
+        self._last = time.perf_counter()
+
+    def total(self):
+        return sum(self.phases.values())
+
+    def report(self, title='Startup'):
+        lines = [f'{title}: {self.total():.3f}s']
+        lines += [f'  {name:<20} {secs:8.3f}s'
+                  for name, secs in self.phases.items()]
+        return '\n'.join(lines)